@@ -4,6 +4,7 @@ import torch
 import numpy as np
 from PIL import Image, ImageOps
 from typing import List, Tuple
+from ._pd_walk import IMAGE_EXTS, list_files
 
 class Load_Images_Advance:
     """
@@ -95,32 +96,23 @@ class Load_Images_Advance:
         递归获取目录及其子目录中的所有图片文件，按指定方式排序
         特别优化了数字文件名的排序：1.jpg, 2.jpg, ..., 100.jpg
         """
-        valid_extensions = ['.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tiff', '.gif']
         image_files = []
-        searched_dirs = []
+        count_by_dir = {}
         
         print(f"开始递归搜索图片文件，根目录: {directory}")
         print(f"排序方式: {sort_method}")
         
-        for root, dirs, files in os.walk(directory):
-            searched_dirs.append(root)
-            print(f"正在搜索目录: {root}")
-            
-            image_count_in_dir = 0
-            for file in files:
-                if any(file.lower().endswith(ext) for ext in valid_extensions):
-                    full_path = os.path.join(root, file)
-                    image_files.append(full_path)
-                    image_count_in_dir += 1
-            
-            if image_count_in_dir > 0:
-                print(f"  在目录 {root} 中找到 {image_count_in_dir} 张图片")
-            
-            if dirs:
-                print(f"  发现 {len(dirs)} 个子文件夹: {dirs}")
+        # 目录未变化时直接复用上次的列举结果（工作流重复执行时省去整棵目录树的遍历）
+        for entry in list_files(directory, IMAGE_EXTS, max_depth=None, use_cache=True):
+            image_files.append(entry.path)
+            root = os.path.dirname(entry.path)
+            count_by_dir[root] = count_by_dir.get(root, 0) + 1
+        
+        for root, image_count_in_dir in count_by_dir.items():
+            print(f"  在目录 {root} 中找到 {image_count_in_dir} 张图片")
         
         print(f"搜索完成！")
-        print(f"总共搜索了 {len(searched_dirs)} 个目录")
+        print(f"共有 {len(count_by_dir)} 个目录包含图片")
         print(f"找到 {len(image_files)} 张图片")
         
         # 根据选择的排序方法进行排序
@@ -159,7 +151,7 @@ class Load_Images_Advance:
         
         if len(all_image_files) == 0:
             error_msg = f"未在目录 '{directory}' 及其所有子目录中找到任何图片文件。\n"
-            error_msg += f"支持的格式：png, jpg, jpeg, webp, bmp, tiff, gif\n"
+            error_msg += f"支持的格式：png, jpg, jpeg, webp, bmp, tiff, tif, gif\n"
             error_msg += f"请检查：\n"
             error_msg += f"1. 目录路径是否正确\n"
             error_msg += f"2. 目录及子目录中是否包含支持格式的图片文件\n"
@@ -1,5 +1,16 @@
 import os
 import json
+import time
+from ._pd_fileio import AtomicWriter, FSYNC_POLICIES
+from ._pd_parallel import map_processes
+from ._pd_tasks import group_workflow, edit_workflow
+from ._pd_walk import JSON_EXTS, walk_files
+from ._pd_jsonedit import parse_edit_script
+from ._pd_layout import LAYOUT_MODES, layered_layout
+
+# indent4：与原来一致的缩进格式；compact：无空白，体积小、序列化快
+JSON_STYLES = ["indent4", "compact"]
+
 
 class PDJSON_Group:
     @classmethod
@@ -14,6 +25,11 @@ class PDJSON_Group:
                 "output_folder": ("STRING", {"default": ""}),
                 "new_filename": ("STRING", {"default": "_fix01"}),  # 改为后缀模式
             },
+            "optional": {
+                "fsync_policy": (FSYNC_POLICIES, {"default": "never"}),  # 落盘策略：耐久性 vs 吞吐
+                "json_style": (JSON_STYLES, {"default": "indent4"}),  # 输出格式
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),  # 并行进程数，0 = CPU 核数
+            },
         }
 
     RETURN_TYPES = ("STRING",)
@@ -21,7 +37,8 @@ class PDJSON_Group:
     FUNCTION = "process_json_files"
     CATEGORY = "PD Custom Nodes"
 
-    def process_json_files(self, directory_path, color_choice, modify_size, font_size, target_title, output_folder, new_filename):
+    def process_json_files(self, directory_path, color_choice, modify_size, font_size, target_title, output_folder, new_filename,
+                           fsync_policy="never", json_style="indent4", workers=0):
         try:
             # 规范化路径
             directory_path = os.path.normpath(directory_path)
@@ -46,55 +63,42 @@ class PDJSON_Group:
                 os.makedirs(output_folder)
 
             # 获取所有JSON文件
-            json_files = [f for f in os.listdir(directory_path) if f.lower().endswith(".json")]
+            json_files = [entry.name for entry in walk_files(directory_path, JSON_EXTS)]
             if not json_files:
                 return (f"错误：没有找到JSON文件: {directory_path}",)
 
-            processed_files = []
-            
+            start_time = time.perf_counter()
+            jobs = []
             for filename in json_files:
-                input_path = os.path.join(directory_path, filename)
-                
-                # 生成新文件名（在原始文件名后添加后缀）
+                # 生成新文件名（在原始文件名后添加后缀，保留原扩展名）
                 base_name, ext = os.path.splitext(filename)
-                new_base_name = f"{base_name}{new_filename}"
-                output_name = f"{new_base_name}{ext}"  # 保留原扩展名
-                output_path = os.path.join(output_folder, output_name)
+                output_path = os.path.join(output_folder, f"{base_name}{new_filename}{ext}")
+                jobs.append((os.path.join(directory_path, filename), output_path, target_color,
+                             modify_size, font_size, target_title, json_style))
 
-                # 读取JSON文件
-                try:
-                    with open(input_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                except Exception as e:
-                    print(f"读取JSON文件失败 {input_path}: {e}")
+            processed_files = []
+            unchanged = 0
+            identical = 0
+            failed = 0
+            writer = AtomicWriter(fsync_policy)
+            for job, outcome, error in map_processes(group_workflow, jobs, workers):
+                input_path, output_path = job[0], job[1]
+                if error is not None:
+                    print(f"读取JSON文件失败 {input_path}: {error}")
+                    failed += 1
                     continue
-
-                # 修改数据
-                modified = False
-                for group in data.get("groups", []):
-                    # 修改颜色
-                    if target_color is not None:
-                        group["color"] = target_color
-                        modified = True
-                    
-                    # 修改字体大小
-                    if modify_size == "enable":
-                        should_modify = not target_title or group.get("title") == target_title
-                        if should_modify and "font_size" in group:
-                            old_size = group["font_size"]
-                            group["font_size"] = font_size
-                            print(f"修改组 '{group.get('title')}': 字体大小 {old_size} → {font_size}")
-                            modified = True
-
-                # 保存修改
-                if modified:
-                    with open(output_path, 'w', encoding='utf-8') as f:
-                        json.dump(data, f, ensure_ascii=False, indent=4)
-                    processed_files.append(output_path)
-                    print(f"已处理文件: {output_path}")
+                changes, payload = outcome
+                if not changes:
+                    unchanged += 1
+                elif payload is None:
+                    # 修改后与已有输出逐字节相同，不重写
+                    identical += 1
                 else:
-                    print(f"无需修改: {input_path}")
+                    writer.write_bytes(output_path, payload)
+                    processed_files.append(output_path)
 
+            writer.commit()
+            seconds = time.perf_counter() - start_time
             result_msg = f"处理完成！已修改 {len(processed_files)} 个文件"
             if output_folder != directory_path:
                 result_msg += f"\n输出目录: {output_folder}"
@@ -104,12 +108,117 @@ class PDJSON_Group:
             
             if modify_size == "enable":
                 result_msg += f"\n字体大小修改为: {font_size} (目标标题: '{target_title}' if specified)"
+
+            result_msg += f"\n无需修改 {unchanged} 个 | 内容相同跳过写入 {identical} 个 | 失败 {failed} 个"
+            result_msg += f"\n{writer.stats.summary()}"
+            result_msg += f"\n⏱️ 耗时 {seconds:.2f}s | {len(jobs) / seconds if seconds > 0 else 0:.0f} 文件/秒"
             
             return (result_msg,)
 
         except Exception as e:
             return (f"处理出错: {str(e)}",)
 
+class PDJSON_EditScript:
+    """
+    按编辑脚本批量修改工作流 JSON：脚本只编译一次，每个文件一次遍历完成全部操作
+    例：set nodes[type=KSampler].widgets_values[2] = 30
+        replace nodes[type=CheckpointLoaderSimple].widgets_values[0] = old.safetensors -> new.safetensors
+        delete groups[title=Temp]
+    """
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "directory_path": ("STRING", {"default": ""}),
+                "script": ("STRING", {
+                    "default": "",
+                    "multiline": True,
+                    "placeholder": "set nodes[type=KSampler].widgets_values[2] = 30\nreplace nodes[*].widgets_values[*] = old.safetensors -> new.safetensors\ndelete groups[title=Temp]"
+                }),
+                "output_folder": ("STRING", {"default": ""}),  # 留空则写回输入文件夹
+                "new_filename": ("STRING", {"default": ""}),  # 文件名后缀，留空且输出到原文件夹时原地修改
+            },
+            "optional": {
+                "dry_run": ("BOOLEAN", {"default": False}),  # 只统计修改次数，不写文件
+                "json_style": (JSON_STYLES, {"default": "indent4"}),  # 输出格式
+                "fsync_policy": (FSYNC_POLICIES, {"default": "never"}),  # 落盘策略：耐久性 vs 吞吐
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),  # 并行进程数，0 = CPU 核数
+            },
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("Result",)
+    FUNCTION = "apply_script"
+    CATEGORY = "PD Custom Nodes"
+
+    def apply_script(self, directory_path, script, output_folder, new_filename,
+                     dry_run=False, json_style="indent4", fsync_policy="never", workers=0):
+        try:
+            directory_path = os.path.normpath(directory_path)
+            output_folder = os.path.normpath(output_folder) if output_folder else directory_path
+
+            if not os.path.exists(directory_path):
+                return (f"错误：输入文件夹不存在: {directory_path}",)
+
+            edit_script, errors = parse_edit_script(script)
+            if errors:
+                return ("脚本错误：\n" + "\n".join(errors),)
+            if not edit_script.ops:
+                return ("错误：脚本为空",)
+
+            json_files = [entry.name for entry in walk_files(directory_path, JSON_EXTS)]
+            if not json_files:
+                return (f"错误：没有找到JSON文件: {directory_path}",)
+            if not dry_run:
+                os.makedirs(output_folder, exist_ok=True)
+
+            start_time = time.perf_counter()
+            jobs = []
+            for filename in json_files:
+                base_name, ext = os.path.splitext(filename)
+                output_path = os.path.join(output_folder, f"{base_name}{new_filename}{ext}")
+                jobs.append((os.path.join(directory_path, filename), output_path, edit_script, json_style))
+
+            details = []
+            written = 0
+            unchanged = 0
+            failed = 0
+            total_changes = 0
+            writer = AtomicWriter(fsync_policy)
+            for job, outcome, error in map_processes(edit_workflow, jobs, workers):
+                filename = os.path.basename(job[0])
+                if error is not None:
+                    failed += 1
+                    details.append(f"❌ {filename}: {error}")
+                    continue
+                changes, payload = outcome
+                if not changes:
+                    unchanged += 1
+                    continue
+                total_changes += changes
+                details.append(f"✏️ {filename}: {changes} 处修改")
+                if payload is not None and not dry_run:
+                    writer.write_bytes(job[1], payload)
+                    written += 1
+
+            writer.commit()
+            seconds = time.perf_counter() - start_time
+
+            result_msg = f"{'预览' if dry_run else '处理'}完成！{len(jobs)} 个文件，共 {total_changes} 处修改"
+            result_msg += f"\n修改 {len(jobs) - unchanged - failed} 个 | 写入 {written} 个 | 无需修改 {unchanged} 个 | 失败 {failed} 个"
+            if output_folder != directory_path:
+                result_msg += f"\n输出目录: {output_folder}"
+            result_msg += f"\n{writer.stats.summary()}"
+            result_msg += f"\n⏱️ 耗时 {seconds:.2f}s | {len(jobs) / seconds if seconds > 0 else 0:.0f} 文件/秒"
+            result_msg += "\n\n" + "\n".join(details[:100])
+            if len(details) > 100:
+                result_msg += f"\n... 剩余 {len(details) - 100} 条"
+            return (result_msg,)
+
+        except Exception as e:
+            return (f"处理出错: {str(e)}",)
+
+
 class BatchJsonIncremental:
     @classmethod
     def INPUT_TYPES(s):
@@ -122,6 +231,12 @@ class BatchJsonIncremental:
                 "increment": ("INT", {"default": 20}),  # 坐标递增步长
                 "file_prefix": ("STRING", {"default": "Modified"}),  # 输出文件前缀
             },
+            "optional": {
+                "fsync_policy": (FSYNC_POLICIES, {"default": "never"}),  # 落盘策略：耐久性 vs 吞吐
+                # diagonal: 按编号斜向排列；layered: 按连线分层布局，increment 作为节点间距
+                "layout_mode": (LAYOUT_MODES, {"default": "diagonal"}),
+                "sweeps": ("INT", {"default": 4, "min": 0, "max": 24, "step": 1}),  # 分层布局减少交叉的扫描轮数
+            },
         }
 
     CATEGORY = "image/PD_jsonincremental"  # 节点类别
@@ -130,7 +245,8 @@ class BatchJsonIncremental:
     RETURN_NAMES = ("result_message",)  # 返回的结果名称
     FUNCTION = "arrange_nodes_batch"
 
-    def arrange_nodes_batch(self, input_folder, output_folder, start_x, start_y, increment, file_prefix):
+    def arrange_nodes_batch(self, input_folder, output_folder, start_x, start_y, increment, file_prefix,
+                            fsync_policy="never", layout_mode="diagonal", sweeps=4):
         try:
             # 自动规范路径
             input_folder = os.path.normpath(input_folder)
@@ -152,7 +268,7 @@ class BatchJsonIncremental:
                 print(f"Output folder created: {output_folder}")
 
             # 获取输入文件夹中所有 JSON 文件
-            json_files = [f for f in os.listdir(input_folder) if f.endswith(".json")]
+            json_files = [entry.name for entry in walk_files(input_folder, JSON_EXTS)]
             print(f"Found JSON files: {json_files}")
 
             if not json_files:
@@ -161,6 +277,7 @@ class BatchJsonIncremental:
                 return (error_msg,)
 
             processed_files = []  # 用于记录已处理的文件列表
+            writer = AtomicWriter(fsync_policy)
 
             # 遍历所有 JSON 文件
             for idx, json_file in enumerate(json_files):
@@ -192,27 +309,34 @@ class BatchJsonIncremental:
                 nodes.sort(key=lambda x: x.get("id", 0))
                 print(f"Nodes sorted by ID for file: {input_file}")
 
-                # 更新每个节点的 `pos` 和 `xy`
-                for i, node in enumerate(nodes):
-                    new_x = start_x + i * increment
-                    new_y = start_y + i * increment
-                    node["pos"] = [new_x, new_y]
-                    node["xy"] = [new_x, new_y]
-                    print(f"Updated node {i} position to pos: {node['pos']}")
+                if layout_mode == "layered":
+                    layout_start = time.perf_counter()
+                    layer_count = layered_layout(data, start_x, start_y, increment, increment, sweeps)
+                    print(f"Layered layout: {layer_count} layers, {time.perf_counter() - layout_start:.3f}s")
+                else:
+                    # 更新每个节点的 `pos` 和 `xy`
+                    for i, node in enumerate(nodes):
+                        new_x = start_x + i * increment
+                        new_y = start_y + i * increment
+                        node["pos"] = [new_x, new_y]
+                        node["xy"] = [new_x, new_y]
+                        print(f"Updated node {i} position to pos: {node['pos']}")
 
                 # 将修改后的节点写回数据
                 data["nodes"] = nodes
 
-                # 保存到新的 JSON 文件
-                with open(output_file, "w", encoding="utf-8") as file:
-                    json.dump(data, file, ensure_ascii=False, indent=4)
+                # 保存到新的 JSON 文件（临时文件 + 重命名）
+                writer.write_text(output_file, json.dumps(data, ensure_ascii=False, indent=4))
 
                 print(f"File saved to: {output_file}")
                 processed_files.append(output_file)
 
+            writer.commit()
+
             # 返回结果信息
             result_msg = (
-                f"批量处理完成！已处理 {len(processed_files)} 个文件，全部按照编号递增节点处理。\n"
+                f"批量处理完成！已处理 {len(processed_files)} 个文件，全部按照{'连线分层布局' if layout_mode == 'layered' else '编号递增'}节点处理。\n"
+                f"{writer.stats.summary()}\n"
                 f"文件保存在目录：{output_folder}\n文件列表：\n" + "\n".join(processed_files)
             )
             print(result_msg)
@@ -229,10 +353,12 @@ class BatchJsonIncremental:
 NODE_CLASS_MAPPINGS = {
     "PDJSON_BatchJsonIncremental": BatchJsonIncremental,  # 节点内部名称
     "PDJSON_Group": PDJSON_Group,   
+    "PDJSON_EditScript": PDJSON_EditScript,
 }
 
 # 可选：为节点增加更友好的名称
 NODE_DISPLAY_NAME_MAPPINGS = {
     "PDJSON_BatchJsonIncremental": "PDJSON_incrementalnumber",  # 节点显示名称
     "PDJSON_Group": "PDJSON_Group",
+    "PDJSON_EditScript": "PDJSON_EditScript",
 }
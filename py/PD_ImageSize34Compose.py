@@ -1,10 +1,129 @@
 """
 PD: Image Size 3-4 Compose Node
 批量处理图片：缩放最长边到指定尺寸，然后裁剪到3:4比例
+多进程并行处理；输出目录中的 .pd_compose_manifest.json 记录每个源文件及其输出的 mtime/大小，
+参数相同且源文件、输出都未变化时跳过，只处理新增或改动过的图片
+
+PD: Image Multi Compose Node
+一次解码生成多个 (比例, 最长边, 格式) 版本，各版本共用 reduce 金字塔，输出写入 输出目录/<比例>_<尺寸>/
 """
 
 import os
+import re
+import json
+import time
+from collections import Counter
+import comfy.utils
 from PIL import Image
+from ._pd_fileio import AtomicWriter, FSYNC_POLICIES
+from ._pd_rename import RenamePlan
+from ._pd_walk import IMAGE_EXTS, walk_files
+from ._pd_image import open_for_crop, resize_crop, flatten_on_white
+from ._pd_parallel import map_processes, map_ordered
+from ._pd_tasks import compose_image, fan_out_image
+
+MANIFEST_NAME = ".pd_compose_manifest.json"
+# 2：原地处理时记录以处理后的文件名为键
+MANIFEST_VERSION = 2
+
+# 目标格式 → (PIL 格式, 扩展名)；same 保持源文件格式
+TARGET_FORMATS = {
+    "jpg": ("JPEG", ".jpg"),
+    "jpeg": ("JPEG", ".jpg"),
+    "png": ("PNG", ".png"),
+    "webp": ("WEBP", ".webp"),
+    "same": (None, None),
+}
+# 每攒够这么多个输出文件就并行写一次盘
+_WRITE_CHUNK = 64
+
+_TARGET_LINE = re.compile(r"^(\d+)\s*[:xX]\s*(\d+)\s+(\d+)(?:\s+(\w+))?$")
+
+
+def _signature(path):
+    """(mtime_ns, 大小)；文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def parse_targets(text):
+    """
+    解析目标列表，每行一个：比例 最长边 [格式]，如 "3:4 1024 jpg"、"16x9 1920 webp"；格式省略时为 jpg
+    空行与 # 开头的行忽略，输出相同的目标（含 jpg 与 jpeg）只保留一个；返回 ([(宽, 高, 最长边, 格式)], [错误说明])
+    同一比例和尺寸的目标写入同一个文件夹，文件名只靠扩展名区分：same 的扩展名随源文件而定，
+    可能与同文件夹的其他目标重名，因此不能与其他格式共用文件夹，报告为错误
+    """
+    targets = []
+    errors = []
+    # (宽, 高, 最长边) → {扩展名（same 为 None）: 行号}
+    folders = {}
+    for line_no, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        match = _TARGET_LINE.match(line)
+        if not match:
+            errors.append(f"第 {line_no} 行格式应为 '比例 最长边 [格式]': {line}")
+            continue
+        width, height, size = int(match.group(1)), int(match.group(2)), int(match.group(3))
+        format = (match.group(4) or "jpg").lower()
+        if format not in TARGET_FORMATS:
+            errors.append(f"第 {line_no} 行格式 {format} 不支持（可用: {', '.join(TARGET_FORMATS)}）")
+            continue
+        if width <= 0 or height <= 0 or size <= 0:
+            errors.append(f"第 {line_no} 行比例和尺寸必须大于0: {line}")
+            continue
+        target = (width, height, size, format)
+        ext = TARGET_FORMATS[format][1]
+        exts = folders.setdefault((width, height, size), {})
+        if ext in exts:
+            continue
+        if exts and (ext is None or None in exts):
+            other = exts.get(None) or next(iter(exts.values()))
+            errors.append(f"第 {line_no} 行与第 {other} 行都写入 {target_folder(target)}，"
+                          f"same 格式可能与另一目标重名，请改用不同的比例或尺寸: {line}")
+            continue
+        exts[ext] = line_no
+        targets.append(target)
+    return targets, errors
+
+
+def target_folder(target):
+    width, height, size, _ = target
+    return f"{width}x{height}_{size}"
+
+
+class _ComposeManifest:
+    """
+    files: 源文件名 → [源 mtime_ns, 源大小, 输出文件名, 输出 mtime_ns, 输出大小]
+    原地处理时源文件就是输出，键为处理（及重命名）后的文件名
+    参数（尺寸、比例、命名方式、输入目录）不同时视为空清单；源文件已不存在的记录在保存前删除
+    """
+
+    def __init__(self, directory, params):
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.params = params
+        self.files = {}
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION and data.get("params") == self.params:
+                self.files = data["files"]
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"处理清单无法读取，将全部重新处理: {e}")
+            self.files = {}
+
+    def save(self, writer):
+        data = {"version": MANIFEST_VERSION, "params": self.params, "files": self.files}
+        writer.write_text(self.path, json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+
 
 class PD_ImageSize34Compose:
     """
@@ -42,6 +161,11 @@ class PD_ImageSize34Compose:
                     "multiline": False,
                     "placeholder": "重命名前缀"
                 })
+            },
+            "optional": {
+                "fsync_policy": (FSYNC_POLICIES, {"default": "never"}),  # 落盘策略：耐久性 vs 吞吐
+                "skip_unchanged": ("BOOLEAN", {"default": True}),  # 跳过清单中已是最新的图片；关闭则全部重新处理
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),  # 图片处理进程数，0 = CPU 核数
             }
         }
     
@@ -63,60 +187,18 @@ class PD_ImageSize34Compose:
             处理后的图片对象，或None（如果失败）
         """
         try:
-            # 打开图片
-            img = Image.open(image_path)
-            
-            # 如果是RGBA模式，转换为RGB
-            if img.mode == 'RGBA':
-                # 创建白色背景
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                background.paste(img, mask=img.split()[3])
-                img = background
-            elif img.mode != 'RGB':
+            img, output_size, source_box, _ = open_for_crop(image_path, longer_size, aspect_ratio)
+            img = flatten_on_white(img)
+            if img.mode != 'RGB':
                 img = img.convert('RGB')
-            
-            # 步骤1：缩放最长边到longer_size
-            width, height = img.size
-            max_dimension = max(width, height)
-            
-            if max_dimension > longer_size:
-                scale = longer_size / max_dimension
-                new_width = int(width * scale)
-                new_height = int(height * scale)
-                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # 步骤2：裁剪到指定比例
-            current_width, current_height = img.size
-            target_ratio = aspect_ratio[0] / aspect_ratio[1]
-            current_ratio = current_width / current_height
-            
-            if abs(current_ratio - target_ratio) > 0.01:  # 如果比例不同才裁剪
-                if current_ratio > target_ratio:
-                    # 当前图片太宽，需要裁剪宽度
-                    new_width = int(current_height * target_ratio)
-                    new_height = current_height
-                    left = (current_width - new_width) // 2
-                    top = 0
-                    right = left + new_width
-                    bottom = current_height
-                else:
-                    # 当前图片太高，需要裁剪高度
-                    new_width = current_width
-                    new_height = int(current_width / target_ratio)
-                    left = 0
-                    top = (current_height - new_height) // 2
-                    right = current_width
-                    bottom = top + new_height
-                
-                img = img.crop((left, top, right, bottom))
-            
-            return img
+            return resize_crop(img, output_size, source_box, Image.Resampling.LANCZOS)
             
         except Exception as e:
             print(f"  ❌ 处理图片失败 {image_path}: {str(e)}")
             return None
     
-    def process_images(self, longer_size, input_path, output_path, rename_image, rename_prefix):
+    def process_images(self, longer_size, input_path, output_path, rename_image, rename_prefix, fsync_policy="never",
+                       skip_unchanged=True, workers=0):
         """
         批量处理图片
         """
@@ -131,25 +213,17 @@ class PD_ImageSize34Compose:
             else:
                 # 确保输出目录存在
                 os.makedirs(output_path, exist_ok=True)
+            in_place = os.path.normcase(os.path.abspath(output_path)) == os.path.normcase(os.path.abspath(input_path))
             
-            # 支持的图片格式
-            supported_formats = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.webp')
+            # 获取所有图片文件（已按文件名排序，重命名顺序一致）
+            entries = list(walk_files(input_path, IMAGE_EXTS))
             
-            # 获取所有图片文件
-            image_files = []
-            for file in os.listdir(input_path):
-                if file.lower().endswith(supported_formats):
-                    image_files.append(file)
-            
-            if not image_files:
+            if not entries:
                 return (f"❌ 在 '{input_path}' 中没有找到图片文件",)
             
-            # 排序文件列表以确保一致的重命名顺序
-            image_files.sort()
-            
             print(f"\n📁 输入文件夹: {input_path}")
             print(f"📁 输出文件夹: {output_path}")
-            print(f"🖼️  找到 {len(image_files)} 张图片")
+            print(f"🖼️  找到 {len(entries)} 张图片")
             print(f"⚙️  配置: 最长边={longer_size}px, 比例=3:4")
             if rename_image:
                 print(f"✏️  重命名: 启用 (前缀: {rename_prefix})")
@@ -157,69 +231,275 @@ class PD_ImageSize34Compose:
                 print(f"✏️  重命名: 禁用")
             print("=" * 60)
             
-            success_count = 0
-            fail_count = 0
+            start_time = time.perf_counter()
             aspect_ratio = (3, 4)  # 固定3:4比例
+            manifest = _ComposeManifest(output_path, {
+                "longer_size": longer_size,
+                "aspect_ratio": list(aspect_ratio),
+                "rename_prefix": rename_prefix if rename_image else None,
+                "input_path": os.path.normcase(os.path.abspath(input_path)),
+            })
+            if skip_unchanged:
+                manifest.load()
             
-            # 如果需要重命名，先处理所有图片并临时保存
-            processed_images = []
+            # 只保留源文件仍在、输出仍在且未被改动的记录；源文件被删除或改名后，
+            # 之后出现的同名文件不会误用旧记录
+            names = {entry.name for entry in entries}
+            records = {}
+            for source, record in manifest.files.items():
+                if source in names and _signature(os.path.join(output_path, record[2])) == record[3:]:
+                    records[source] = record
+            taken = {os.path.normcase(record[2]) for record in records.values()}
             
-            for i, filename in enumerate(image_files, 1):
-                old_path = os.path.join(input_path, filename)
-                print(f"\n[{i}/{len(image_files)}] 处理: {filename}")
-                
-                # 处理图片
-                img = self.process_single_image(old_path, longer_size, aspect_ratio)
+            # 规划：跳过已是最新的图片，其余确定输出文件名
+            jobs = []
+            up_to_date = 0
+            for i, entry in enumerate(entries, 1):
+                signature = _signature(entry.path)
+                record = records.get(entry.name)
+                if record is not None and record[:2] == signature:
+                    up_to_date += 1
+                    continue
                 
-                if img:
-                    if rename_image:
-                        # 获取文件扩展名
-                        _, ext = os.path.splitext(filename)
-                        if not ext:
-                            ext = '.jpg'
-                        # 生成新文件名
-                        new_filename = f"{rename_prefix}{i:02d}{ext}"
-                        new_path = os.path.join(output_path, new_filename)
-                        
-                        # 保存到临时列表
-                        processed_images.append((img, new_path, old_path))
-                        print(f"  ✅ 处理成功 -> 将重命名为: {new_filename} -> 尺寸: {img.size}")
+                if rename_image:
+                    # 获取文件扩展名
+                    ext = os.path.splitext(entry.name)[1]
+                    if record is not None:
+                        new_filename = record[2]
                     else:
-                        # 保存到输出路径
-                        if input_path == output_path:
-                            # 覆盖原图
-                            save_path = old_path
-                        else:
-                            # 保存到新路径
-                            save_path = os.path.join(output_path, filename)
-                        
-                        img.save(save_path, quality=95)
-                        print(f"  ✅ 处理成功 -> 尺寸: {img.size}")
-                    
-                    success_count += 1
+                        # 生成新文件名；编号已被保留的输出占用时顺延
+                        number = i
+                        new_filename = f"{rename_prefix}{number:02d}{ext}"
+                        while os.path.normcase(new_filename) in taken:
+                            number += 1
+                            new_filename = f"{rename_prefix}{number:02d}{ext}"
+                        taken.add(os.path.normcase(new_filename))
                 else:
+                    new_filename = entry.name
+                format = Image.registered_extensions().get(entry.ext)
+                jobs.append(((entry.path, longer_size, aspect_ratio, format), entry.name, new_filename))
+            
+            if up_to_date:
+                print(f"⏭️  跳过 {up_to_date} 张已是最新的图片，待处理 {len(jobs)} 张")
+            
+            success_count = 0
+            fail_count = 0
+            # 经临时文件原子写入，中断不会留下截断的图片
+            writer = AtomicWriter(fsync_policy)
+            completed = []
+            
+            pbar = comfy.utils.ProgressBar(len(jobs)) if jobs else None
+            tasks = [task for task, _, _ in jobs]
+            outputs = {task[0]: (filename, new_filename) for task, filename, new_filename in jobs}
+            for i, (task, result, error) in enumerate(map_processes(compose_image, tasks, workers,
+                                                                    on_progress=lambda done, total: pbar.update(1)), 1):
+                filename, new_filename = outputs[task[0]]
+                print(f"\n[{i}/{len(jobs)}] 处理: {filename}")
+                if error is not None:
+                    print(f"  ❌ 处理图片失败 {task[0]}: {error}")
+                    fail_count += 1
+                    continue
+                data, size = result
+                # 原地处理先写回原文件，重命名在全部处理完成后统一执行
+                save_path = task[0] if in_place else os.path.join(output_path, new_filename)
+                try:
+                    writer.write_bytes(save_path, data)
+                except Exception as e:
+                    print(f"  ❌ 保存失败 {save_path}: {e}")
                     fail_count += 1
+                    continue
+                signature = _signature(task[0])
+                completed.append([filename, new_filename, signature])
+                success_count += 1
+                if new_filename != filename:
+                    print(f"  ✅ 处理成功 -> 将重命名为: {new_filename} -> 尺寸: {size}")
+                else:
+                    print(f"  ✅ 处理成功 -> 尺寸: {size}")
+            writer.commit()
             
-            # 如果需要重命名，删除原图并保存新图
-            if rename_image and processed_images:
+            # 原地重命名：一次规划完成（链式/循环重命名、冲突检测、失败回滚），不再先删除原图
+            rename_summary = ""
+            if in_place and rename_image and completed:
                 print("\n" + "=" * 60)
                 print("正在重命名文件...")
-                
-                # 如果输入输出是同一个目录，先删除原图
-                if input_path == output_path:
-                    for _, _, old_path in processed_images:
-                        try:
-                            os.remove(old_path)
-                        except:
-                            pass
-                
-                # 保存所有新图
-                for img, new_path, _ in processed_images:
-                    img.save(new_path, quality=95)
-                    print(f"  ✅ 已保存: {os.path.basename(new_path)}")
+                plan = RenamePlan(output_path)
+                for filename, new_filename, _ in completed:
+                    plan.add(filename, new_filename)
+                rename_result = plan.execute()
+                renamed = dict(rename_result.renamed)
+                for item in completed:
+                    if item[0] in renamed:
+                        print(f"  ✅ 已保存: {item[1]}")
+                    else:
+                        # 未能重命名的图片已处理完成，保留原名
+                        item[1] = item[0]
+                for src, dst, reason in rename_result.conflicts:
+                    print(f"  ⚠️ 未重命名 {src} -> {dst}: {reason}")
+                rename_summary = "\n" + rename_result.summary()
+            
+            # 更新清单：原地处理时源文件就是输出，记录改用重命名后的文件名
+            for filename, new_filename, signature in completed:
+                output_signature = _signature(os.path.join(output_path, new_filename))
+                if output_signature is None:
+                    continue
+                if in_place:
+                    records.pop(filename, None)
+                    names.discard(filename)
+                    names.add(new_filename)
+                    records[new_filename] = output_signature + [new_filename] + output_signature
+                else:
+                    records[filename] = signature + [new_filename] + output_signature
+            # 源文件已不存在的记录不再保留
+            records = {source: record for source, record in records.items() if source in names}
+            if completed or records != manifest.files:
+                manifest.files = records
+                manifest.save(writer)
+            writer.commit()
             
+            elapsed = time.perf_counter() - start_time
             # 生成结果消息
-            result_message = f"✨ 处理完成! 成功: {success_count} 张, 失败: {fail_count} 张"
+            result_message = (f"✨ 处理完成! 成功: {success_count} 张, 失败: {fail_count} 张, "
+                              f"跳过(已是最新): {up_to_date} 张, 耗时 {elapsed:.2f}s"
+                              f"{rename_summary}\n{writer.stats.summary()}")
+            print("\n" + "=" * 60)
+            print(result_message)
+            print("=" * 60)
+            
+            return (result_message,)
+            
+        except Exception as e:
+            error_msg = f"❌ 处理过程中发生错误: {str(e)}"
+            print(error_msg)
+            return (error_msg,)
+
+class PD_ImageMultiCompose:
+    """
+    ComfyUI节点：每张源图只解码一次，按目标列表生成多个比例/尺寸/格式的版本
+    """
+    
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "input_path": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": "输入图片文件夹路径"
+                }),
+                "output_path": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": "输出文件夹路径，每个目标一个子文件夹"
+                }),
+                "targets": ("STRING", {
+                    "default": "3:4 1024 jpg\n1:1 1024 jpg\n16:9 1920 webp",
+                    "multiline": True,
+                    "placeholder": "每行一个目标：比例 最长边 [格式]，格式可为 jpg / png / webp / same"
+                }),
+            },
+            "optional": {
+                "quality": ("INT", {"default": 95, "min": 1, "max": 100, "step": 1}),  # jpg / webp 质量
+                "fsync_policy": (FSYNC_POLICIES, {"default": "never"}),  # 落盘策略：耐久性 vs 吞吐
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),  # 图片处理进程数，0 = CPU 核数
+            }
+        }
+    
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("message",)
+    FUNCTION = "process_images"
+    CATEGORY = "PD/Image Processing"
+    
+    def process_images(self, input_path, output_path, targets, quality=95, fsync_policy="never", workers=0):
+        try:
+            if not input_path or not os.path.exists(input_path):
+                return (f"❌ 错误: 输入路径 '{input_path}' 不存在或为空",)
+            if not output_path:
+                return ("❌ 错误: 请指定输出文件夹路径",)
+            
+            target_list, errors = parse_targets(targets)
+            for error in errors:
+                print(f"  ⚠️ {error}")
+            if not target_list:
+                return ("❌ 没有有效的目标\n" + "\n".join(errors),)
+            
+            entries = list(walk_files(input_path, IMAGE_EXTS))
+            if not entries:
+                return (f"❌ 在 '{input_path}' 中没有找到图片文件",)
+            
+            # 输出文件名取源文件名去掉扩展名；同名不同格式的源（a.png 与 a.jpg）保留源扩展名（a_png、a_jpg），
+            # 避免输出互相覆盖；仍然重名的报告为错误并跳过
+            stem_counts = Counter(os.path.normcase(entry.stem) for entry in entries)
+            output_stems = {}
+            used = {os.path.normcase(entry.stem) for entry in entries if stem_counts[os.path.normcase(entry.stem)] == 1}
+            skipped = []
+            for entry in entries:
+                stem = entry.stem
+                if stem_counts[os.path.normcase(stem)] > 1:
+                    stem = f"{stem}_{entry.ext[1:]}"
+                    if os.path.normcase(stem) in used:
+                        skipped.append(entry.name)
+                        continue
+                    used.add(os.path.normcase(stem))
+                output_stems[entry.path] = stem
+            for name in skipped:
+                errors.append(f"{name}: 输出文件名与其他源文件重名，已跳过")
+                print(f"  ⚠️ {name}: 输出文件名与其他源文件重名，已跳过")
+            
+            folders = [os.path.join(output_path, target_folder(target)) for target in target_list]
+            for folder in folders:
+                os.makedirs(folder, exist_ok=True)
+            
+            print(f"\n📁 输入文件夹: {input_path}")
+            print(f"📁 输出文件夹: {output_path}")
+            print(f"🖼️  找到 {len(entries)} 张图片, {len(target_list)} 个目标:")
+            for target, folder in zip(target_list, folders):
+                print(f"   {target[0]}:{target[1]} {target[2]}px {target[3]} -> {folder}")
+            print("=" * 60)
+            
+            start_time = time.perf_counter()
+            writer = AtomicWriter(fsync_policy)
+            success_count = 0
+            fail_count = 0
+            write_errors = []
+            pending = []
+            
+            def flush():
+                # 输出文件并行写盘，AtomicWriter 线程安全
+                for (path, _), _, error in map_ordered(lambda job: writer.write_bytes(*job), pending, workers):
+                    if error is not None:
+                        print(f"  ❌ 保存失败 {path}: {error}")
+                        write_errors.append(path)
+                pending.clear()
+            
+            pbar = comfy.utils.ProgressBar(len(output_stems))
+            # 格式在主进程解析好再交给子进程
+            task_targets = [(width, height, size, TARGET_FORMATS[format]) for width, height, size, format in target_list]
+            tasks = [(entry.path, task_targets, quality) for entry in entries if entry.path in output_stems]
+            for i, (task, results, error) in enumerate(map_processes(fan_out_image, tasks, workers,
+                                                                     on_progress=lambda done, total: pbar.update(1)), 1):
+                name = os.path.basename(task[0])
+                if error is not None:
+                    print(f"[{i}/{len(tasks)}] ❌ 处理图片失败 {name}: {error}")
+                    fail_count += 1
+                    continue
+                stem = output_stems[task[0]]
+                for folder, (data, ext, _) in zip(folders, results):
+                    pending.append((os.path.join(folder, f"{stem}{ext}"), data))
+                print(f"[{i}/{len(tasks)}] ✅ {name} -> {', '.join(f'{w}x{h}' for _, _, (w, h) in results)}")
+                success_count += 1
+                if len(pending) >= _WRITE_CHUNK:
+                    flush()
+            flush()
+            writer.commit()
+            
+            elapsed = time.perf_counter() - start_time
+            result_message = (f"✨ 处理完成! 源图 成功: {success_count} 张, 失败: {fail_count} 张, "
+                              f"重名跳过: {len(skipped)} 张; "
+                              f"输出 {success_count * len(target_list) - len(write_errors)} 个文件"
+                              f"（{len(target_list)} 个目标）, 写入失败 {len(write_errors)} 个, 耗时 {elapsed:.2f}s\n"
+                              f"{writer.stats.summary()}")
+            if errors:
+                result_message += "\n被忽略的目标与源文件:\n" + "\n".join(errors)
             print("\n" + "=" * 60)
             print(result_message)
             print("=" * 60)
@@ -233,10 +513,12 @@ class PD_ImageSize34Compose:
 
 # 节点类映射
 NODE_CLASS_MAPPINGS = {
-    "PD_ImageSize34Compose": PD_ImageSize34Compose
+    "PD_ImageSize34Compose": PD_ImageSize34Compose,
+    "PD_ImageMultiCompose": PD_ImageMultiCompose
 }
 
 # 节点显示名称映射
 NODE_DISPLAY_NAME_MAPPINGS = {
-    "PD_ImageSize34Compose": "PD: Image Size 3-4 Compose"
+    "PD_ImageSize34Compose": "PD: Image Size 3-4 Compose",
+    "PD_ImageMultiCompose": "PD: Image Multi Compose"
 }
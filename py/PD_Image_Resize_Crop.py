@@ -1,8 +1,27 @@
 import torch
+import torch.nn.functional as F
 import numpy as np
 from PIL import Image, ImageOps
 import os
 from typing import List, Tuple
+from ._pd_image import ratio_crop_plan, resize_crop
+
+# 可用 torch 整批处理的重采样方法 → F.interpolate 参数；LANCZOS 没有对应实现，仍逐张走 PIL
+TORCH_RESAMPLING = {
+    "BICUBIC": {"mode": "bicubic", "align_corners": False, "antialias": True},
+    "BILINEAR": {"mode": "bilinear", "align_corners": False, "antialias": True},
+    "AREA": {"mode": "area"},
+    "NEAREST": {"mode": "nearest-exact"},
+}
+
+
+def _pixel_box(source_box):
+    """
+    裁剪框取整到整像素（四舍五入）：torch 只能按整像素切片，PIL 路径使用同一个框，两条路径的裁剪区域一致
+    ratio_crop_plan 的裁剪框宽高不小于 1，按 floor(v + 0.5) 取整后也不会变为 0
+    """
+    return tuple(int(v + 0.5) for v in source_box)
+
 
 class PD_image_ratio_size:
     """
@@ -39,7 +58,7 @@ class PD_image_ratio_size:
                     "step": 1,
                     "display": "number"
                 }),
-                "resampling_method": (["LANCZOS", "BICUBIC", "BILINEAR", "NEAREST"], {
+                "resampling_method": (["LANCZOS", "BICUBIC", "BILINEAR", "NEAREST", "AREA"], {
                     "default": "LANCZOS"
                 })
             }
@@ -49,7 +68,8 @@ class PD_image_ratio_size:
     RETURN_NAMES = ("processed_images", "info")
     FUNCTION = "process_images"
     CATEGORY = "PD_Image/Processing"
-    OUTPUT_IS_LIST = (False, False)
+    INPUT_IS_LIST = True
+    OUTPUT_IS_LIST = (True, False)
 
     def pil_to_tensor(self, image: Image.Image) -> torch.Tensor:
         """将PIL图像转换为ComfyUI张量格式 (H, W, C)"""
@@ -99,7 +119,8 @@ class PD_image_ratio_size:
     def process_single_image(self, image_tensor: torch.Tensor, max_size: int, 
                            aspect_ratio: Tuple[int, int], resampling_method: str) -> Tuple[torch.Tensor, str]:
         """
-        处理单张图像：缩放最长边到指定尺寸，然后裁剪到指定比例
+        处理单张图像（PIL）：缩放最长边到指定尺寸，然后裁剪到指定比例
+        裁剪框换算到原图坐标，一次 resize 完成裁剪与缩放
         
         Args:
             image_tensor: 输入图像张量 (H, W, C)
@@ -119,43 +140,8 @@ class PD_image_ratio_size:
             # 获取重采样滤镜
             resampling_filter = self.get_resampling_filter(resampling_method)
             
-            # 步骤1：缩放最长边到max_size
-            width, height = pil_image.size
-            max_dimension = max(width, height)
-            
-            if max_dimension > max_size:
-                scale = max_size / max_dimension
-                new_width = int(width * scale)
-                new_height = int(height * scale)
-                pil_image = pil_image.resize((new_width, new_height), resampling_filter)
-            
-            # 步骤2：裁剪到指定比例
-            current_width, current_height = pil_image.size
-            target_ratio = aspect_ratio[0] / aspect_ratio[1]
-            current_ratio = current_width / current_height
-            
-            crop_info = ""
-            if abs(current_ratio - target_ratio) > 0.01:  # 如果比例不同才裁剪
-                if current_ratio > target_ratio:
-                    # 当前图片太宽，需要裁剪宽度
-                    new_width = int(current_height * target_ratio)
-                    new_height = current_height
-                    left = (current_width - new_width) // 2
-                    top = 0
-                    right = left + new_width
-                    bottom = current_height
-                    crop_info = f"裁剪宽度: {current_width}→{new_width}"
-                else:
-                    # 当前图片太高，需要裁剪高度
-                    new_width = current_width
-                    new_height = int(current_width / target_ratio)
-                    left = 0
-                    top = (current_height - new_height) // 2
-                    right = current_width
-                    bottom = top + new_height
-                    crop_info = f"裁剪高度: {current_height}→{new_height}"
-                
-                pil_image = pil_image.crop((left, top, right, bottom))
+            output_size, source_box, crop_info = ratio_crop_plan(original_size, max_size, aspect_ratio)
+            pil_image = resize_crop(pil_image, output_size, _pixel_box(source_box), resampling_filter)
             
             # 转换回张量
             processed_tensor = self.pil_to_tensor(pil_image)
@@ -173,18 +159,101 @@ class PD_image_ratio_size:
             error_info = f"处理失败: {str(e)}"
             return image_tensor, error_info
 
-    def process_images(self, images: torch.Tensor, max_size: int, aspect_width: int, 
-                      aspect_height: int, resampling_method: str):
+    def process_batch_torch(self, images: torch.Tensor, max_size: int,
+                            aspect_ratio: Tuple[int, int], resampling_method: str) -> Tuple[torch.Tensor, str]:
+        """
+        整批处理（torch）：同一批次尺寸相同，只算一次裁剪框，一次 interpolate 缩放全部帧
+        
+        Args:
+            images: 输入图像张量 (B, H, W, C)
+        
+        Returns:
+            processed_batch: 处理后的图像张量 (B, H, W, 3)
+            info: 处理信息（每帧相同）
+        """
+        _, height, width, channels = images.shape
+        output_size, source_box, crop_info = ratio_crop_plan((width, height), max_size, aspect_ratio)
+        
+        # 先在原图上裁剪（裁剪框取整到像素，与 PIL 路径相同）再缩放，被裁掉的部分不参与插值
+        left, top, right, bottom = _pixel_box(source_box)
+        batch = images[:, top:bottom, left:right, :].permute(0, 3, 1, 2)  # (B, C, H, W)
+        if (right - left, bottom - top) != output_size:
+            batch = F.interpolate(batch.float(), size=(output_size[1], output_size[0]),
+                                  **TORCH_RESAMPLING[resampling_method])
+            if resampling_method == "BICUBIC":
+                # 双三次插值会产生过冲
+                batch = batch.clamp(0.0, 1.0)
+        batch = batch.permute(0, 2, 3, 1)
+        
+        # 与 PIL 路径一致：带透明通道的合成到白色背景，单通道扩展为 RGB
+        if channels == 4:
+            rgb, alpha = batch[..., :3], batch[..., 3:]
+            batch = rgb * alpha + (1.0 - alpha)
+        elif channels == 1:
+            batch = batch.expand(-1, -1, -1, 3)
+        
+        info = f"原始尺寸: {(width, height)} → 最终尺寸: {output_size}"
+        if crop_info:
+            info += f" ({crop_info})"
+        return batch.contiguous(), info
+
+    def process_group(self, images: torch.Tensor, max_size: int,
+                      aspect_ratio: Tuple[int, int], resampling_method: str) -> Tuple[List[torch.Tensor], List[str]]:
+        """
+        处理一组尺寸相同的帧 (B, H, W, C)：torch 方法整组一次完成，LANCZOS 逐张走 PIL
+        返回按顺序覆盖全部帧的批次列表，相邻且尺寸相同的帧合并为一个批次；
+        PIL 处理失败的帧保持原尺寸，单独成为一个批次，不影响其余帧
+        """
+        if resampling_method in TORCH_RESAMPLING:
+            processed_batch, info = self.process_batch_torch(images, max_size, aspect_ratio, resampling_method)
+            return [processed_batch], [info] * images.shape[0]
+        runs = []
+        infos = []
+        for image_tensor in images:
+            processed_tensor, info = self.process_single_image(
+                image_tensor, max_size, aspect_ratio, resampling_method
+            )
+            if runs and runs[-1][0].shape == processed_tensor.shape:
+                runs[-1].append(processed_tensor)
+            else:
+                runs.append([processed_tensor])
+            infos.append(info)
+        return [torch.stack(run, dim=0) for run in runs], infos
+
+    @staticmethod
+    def _slice_runs(runs: List[torch.Tensor], start: int, count: int) -> List[torch.Tensor]:
+        """从按顺序排列的批次列表中取出第 start 帧起的 count 帧，返回各批次的切片（视图）"""
+        pieces = []
+        position = 0
+        for run in runs:
+            low = max(start, position)
+            high = min(start + count, position + run.shape[0])
+            if low < high:
+                pieces.append(run[low - position:high - position])
+            position += run.shape[0]
+        return pieces
+
+    def process_images(self, images, max_size, aspect_width, aspect_height, resampling_method):
         """
         主处理函数：批量处理图像
+        INPUT_IS_LIST：images 为图像列表（可来自 Load_Images 等按张输出不同尺寸的节点），其余参数取第一个值
+        按输入尺寸分组，每组拼成一个批次只处理一次；全部输出尺寸相同时合并为一个批次，
+        否则按输入顺序逐项输出列表（同一输入项内尺寸不同的帧，如处理失败保持原尺寸的帧，拆为相邻的多项）
         
         Args:
-            images: 输入图像张量，形状为 (B, H, W, C)
+            images: 图像张量列表，每项形状为 (B, H, W, C) 或 (H, W, C)
             max_size: 最长边的目标尺寸
             aspect_width: 目标宽高比的宽度
             aspect_height: 目标宽高比的高度
             resampling_method: 重采样方法
         """
+        if not isinstance(images, list):
+            images = [images]
+        max_size = max_size[0] if isinstance(max_size, list) else max_size
+        aspect_width = aspect_width[0] if isinstance(aspect_width, list) else aspect_width
+        aspect_height = aspect_height[0] if isinstance(aspect_height, list) else aspect_height
+        resampling_method = resampling_method[0] if isinstance(resampling_method, list) else resampling_method
+
         try:
             # 验证输入参数
             if max_size <= 0:
@@ -194,47 +263,56 @@ class PD_image_ratio_size:
             
             aspect_ratio = (aspect_width, aspect_height)
             
-            # 处理输入张量
-            if len(images.shape) == 3:
-                # 单张图像，添加batch维度
-                images = images.unsqueeze(0)
+            # 单张图像添加 batch 维度
+            items = [image.unsqueeze(0) if len(image.shape) == 3 else image for image in images]
+            total = sum(item.shape[0] for item in items)
             
-            batch_size = images.shape[0]
-            processed_images = []
-            processing_info = []
+            # 按 (H, W, C) 分组，记录每组包含的输入项下标
+            groups = {}
+            for index, item in enumerate(items):
+                groups.setdefault(tuple(item.shape[1:]), []).append(index)
             
-            print(f"开始处理 {batch_size} 张图像")
+            print(f"开始处理 {len(items)} 项共 {total} 张图像，{len(groups)} 种输入尺寸")
             print(f"目标配置: 最大尺寸={max_size}px, 宽高比={aspect_width}:{aspect_height}")
             print(f"重采样方法: {resampling_method}")
             
-            # 逐张处理图像
-            for i in range(batch_size):
-                image_tensor = images[i]  # 形状: (H, W, C)
-                
-                processed_tensor, info = self.process_single_image(
-                    image_tensor, max_size, aspect_ratio, resampling_method
-                )
-                
-                processed_images.append(processed_tensor)
-                processing_info.append(f"图像 {i+1}: {info}")
-                
-                print(f"处理完成 {i+1}/{batch_size}: {info}")
+            # 每个输入项对应的输出批次列表
+            outputs = [None] * len(items)
+            item_infos = [None] * len(items)
+            for shape, indices in groups.items():
+                batch = items[indices[0]] if len(indices) == 1 else torch.cat([items[i] for i in indices], dim=0)
+                runs, infos = self.process_group(batch, max_size, aspect_ratio, resampling_method)
+                print(f"尺寸 {shape[1]}x{shape[0]} 共 {batch.shape[0]} 张处理完成: {infos[0]}")
+                # 按原顺序拆回各输入项
+                offset = 0
+                for i in indices:
+                    count = items[i].shape[0]
+                    outputs[i] = self._slice_runs(runs, offset, count)
+                    item_infos[i] = infos[offset:offset + count]
+                    offset += count
+            
+            processing_info = [f"图像 {n}: {info}"
+                               for n, info in enumerate((info for infos in item_infos for info in infos), 1)]
             
-            # 将处理后的图像重新组合成批次张量
-            processed_batch = torch.stack(processed_images, dim=0)  # 形状: (B, H, W, C)
+            # 输出尺寸全部相同时合并为一个批次，否则保持列表
+            pieces = [piece for pieces in outputs for piece in pieces]
+            if len({tuple(piece.shape[1:]) for piece in pieces}) == 1:
+                result = [pieces[0] if len(pieces) == 1 else torch.cat(pieces, dim=0)]
+            else:
+                result = pieces
+            shapes = ", ".join(str(tuple(output.shape)) for output in result)
             
             # 生成汇总信息
-            final_shape = processed_batch.shape
             summary_info = f"批量处理完成:\n"
-            summary_info += f"输入图像数量: {batch_size}\n"
-            summary_info += f"输出张量形状: {final_shape}\n"
+            summary_info += f"输入图像数量: {total}（{len(items)} 项，{len(groups)} 种尺寸）\n"
+            summary_info += f"输出张量形状: {shapes}\n"
             summary_info += f"目标配置: 最大尺寸={max_size}px, 宽高比={aspect_width}:{aspect_height}\n"
             summary_info += f"重采样方法: {resampling_method}\n\n"
             summary_info += "详细处理信息:\n" + "\n".join(processing_info)
             
-            print(f"批量处理完成！输出张量形状: {final_shape}")
+            print(f"批量处理完成！输出 {len(result)} 项: {shapes}")
             
-            return (processed_batch, summary_info)
+            return (result, summary_info)
             
         except Exception as e:
             error_msg = f"处理错误: {str(e)}"
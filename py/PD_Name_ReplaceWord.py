@@ -1,5 +1,6 @@
 import os
-from pathlib import Path
+import fnmatch
+from ._pd_rename import RenamePlan
 
 class PD_TxtBatchRename:
     """专注于文件命名修改的节点 - 支持多种文件格式"""
@@ -11,6 +12,9 @@ class PD_TxtBatchRename:
                 "file_format": (["jpg", "png", "mp3", "txt", "all"], {"default": "txt"}),  # 文件格式选择
                 "search_keyword": ("STRING", {"default": ""}),  # 要搜索的文件名关键词
                 "replace_word": ("STRING", {"default": ""}),  # 替换词，留空表示删除
+            },
+            "optional": {
+                "dry_run": ("BOOLEAN", {"default": False}),  # 只预览重命名计划，不改动文件
             }
         }
 
@@ -18,7 +22,7 @@ class PD_TxtBatchRename:
     RETURN_NAMES = ("show",)  # 用于显示处理日志
     FUNCTION = "process_files"
     CATEGORY = "PD Custom Nodes"
-    def process_files(self, directory_path, file_format, search_keyword, replace_word):
+    def process_files(self, directory_path, file_format, search_keyword, replace_word, dry_run=False):
         try:
             # 自动转义路径，兼容不同操作系统
             directory_path = os.path.normpath(directory_path)
@@ -44,16 +48,18 @@ class PD_TxtBatchRename:
             operation_desc = "删除" if not replace_text else f"替换为 '{replace_text}'"
             print(f"操作: {operation_desc}")
             
-            # 根据选择的格式获取文件
-            directory = Path(directory_path)
+            # 根据选择的格式获取文件（一次列举，同时作为重命名计划的占用表）
+            plan = RenamePlan(directory_path)
             
             if file_format == "all":
                 # 获取所有文件（排除子目录）
-                target_files = [f for f in directory.iterdir() if f.is_file()]
+                target_files = [e.name for e in plan.entries if e.is_file()]
                 format_desc = "所有格式"
             else:
-                # 获取指定格式的文件
-                target_files = list(directory.glob(f"*.{file_format}"))
+                # 获取指定格式的文件（与 glob 一致：不匹配隐藏文件）
+                pattern = f"*.{file_format}"
+                target_files = [e.name for e in plan.entries
+                                if e.is_file() and not e.name.startswith(".") and fnmatch.fnmatch(e.name, pattern)]
                 format_desc = f".{file_format}"
             
             print(f"扫描到 {len(target_files)} 个 {format_desc} 文件")
@@ -62,41 +68,39 @@ class PD_TxtBatchRename:
                 no_files_msg = f"未找到任何 {format_desc} 文件！"
                 print(no_files_msg)
                 return (no_files_msg,)
-            processed_results = []
-            modified_count = 0
-            
-            for file_path in target_files:
-                try:
-                    print(f"\n检查文件: {file_path.name}")
-                    
-                    # 检查文件名中是否包含关键词
-                    if search_keyword in file_path.name:
-                        new_name = file_path.name.replace(search_keyword, replace_text)
-                        new_path = file_path.with_name(new_name)
-                        
-                        # 检查目标文件名是否已存在
-                        if new_path.exists():
-                            error_result = f"⚠️ {file_path.name}: 跳过 - 目标文件名 '{new_name}' 已存在"
-                            print(f"  {error_result}")
-                            processed_results.append(error_result)
-                            continue
-                        
-                        # 执行重命名操作
-                        file_path.rename(new_path)
-                        modified_count += 1
-                        result = f"✅ {file_path.name} → {new_name}"
-                        print(f"  {result}")
-                        processed_results.append(result)
-                    else:
-                        result = f"⚪ {file_path.name}: 未找到关键词 '{search_keyword}'"
-                        print(f"  {result}")
-                        processed_results.append(result)
 
-                except Exception as e:
-                    error_result = f"❌ {file_path.name}: 处理失败 - {e}"
-                    print(f"  {error_result}")
-                    processed_results.append(error_result)
-                    continue
+            # 先为所有文件生成新名字，再整批执行：交换/链式重命名不再因目标“已存在”而失败
+            outcomes = []
+            for file_name in target_files:
+                # 检查文件名中是否包含关键词
+                if search_keyword in file_name:
+                    new_name = file_name.replace(search_keyword, replace_text)
+                    if not new_name:
+                        outcomes.append((file_name, f"❌ {file_name}: 处理失败 - 新文件名为空"))
+                        continue
+                    if new_name == file_name:
+                        outcomes.append((file_name, f"⚪ {file_name}: 文件名无需修改"))
+                        continue
+                    plan.add(file_name, new_name)
+                    outcomes.append((file_name, new_name))
+                else:
+                    outcomes.append((file_name, f"⚪ {file_name}: 未找到关键词 '{search_keyword}'"))
+
+            rename_result = plan.execute(dry_run=dry_run)
+            renamed = dict(rename_result.renamed)
+            conflicts = {src: reason for src, _, reason in rename_result.conflicts}
+            modified_count = len(renamed)
+
+            processed_results = []
+            for file_name, outcome in outcomes:
+                if file_name in renamed:
+                    result = f"✅ {file_name} → {renamed[file_name]}"
+                elif file_name in conflicts:
+                    result = f"⚠️ {file_name}: 跳过 - {outcome}: {conflicts[file_name]}"
+                else:
+                    result = outcome
+                print(f"  {result}")
+                processed_results.append(result)
 
             # 生成最终结果消息
             total_files = len(target_files)
@@ -107,6 +111,7 @@ class PD_TxtBatchRename:
 📄 总文件数: {total_files} 个文件
 🔍 关键词操作: '{search_keyword}' → '{replace_text}' ({operation_desc})
 ✅ 成功修改: {modified_count} 个文件
+🧾 {rename_result.summary()}
 
 详细结果:
 {chr(10).join(processed_results)}
@@ -1,5 +1,6 @@
 import os
-from pathlib import Path
+import fnmatch
+from ._pd_rename import RenamePlan
 
 class PD_name_replacewordorder:
     """调整文件名中关键词位置顺序的节点"""
@@ -12,6 +13,9 @@ class PD_name_replacewordorder:
                 "file_format": (["jpg", "png", "mp3", "txt", "all"], {"default": "txt"}),  # 文件格式选择
                 "search_keyword": ("STRING", {"default": ""}),  # 要搜索的文件名关键词
                 "wordorder": (["front", "end"], {"default": "front"}),  # 位置选择
+            },
+            "optional": {
+                "dry_run": ("BOOLEAN", {"default": False}),  # 只预览重命名计划，不改动文件
             }
         }
 
@@ -20,7 +24,7 @@ class PD_name_replacewordorder:
     FUNCTION = "process_files"
     CATEGORY = "PD Custom Nodes"
     
-    def process_files(self, directory_path, file_format, search_keyword, wordorder):
+    def process_files(self, directory_path, file_format, search_keyword, wordorder, dry_run=False):
         try:
             # 自动转义路径，兼容不同操作系统
             directory_path = os.path.normpath(directory_path)
@@ -45,16 +49,18 @@ class PD_name_replacewordorder:
             operation_desc = "移动到最前面" if wordorder == "front" else "移动到最后面"
             print(f"操作: 将关键词{operation_desc}")
             
-            # 根据选择的格式获取文件
-            directory = Path(directory_path)
+            # 根据选择的格式获取文件（一次列举，同时作为重命名计划的占用表）
+            plan = RenamePlan(directory_path)
             
             if file_format == "all":
                 # 获取所有文件（排除子目录）
-                target_files = [f for f in directory.iterdir() if f.is_file()]
+                target_files = [e.name for e in plan.entries if e.is_file()]
                 format_desc = "所有格式"
             else:
-                # 获取指定格式的文件
-                target_files = list(directory.glob(f"*.{file_format}"))
+                # 获取指定格式的文件（与 glob 一致：不匹配隐藏文件）
+                pattern = f"*.{file_format}"
+                target_files = [e.name for e in plan.entries
+                                if e.is_file() and not e.name.startswith(".") and fnmatch.fnmatch(e.name, pattern)]
                 format_desc = f".{file_format}"
             
             print(f"扫描到 {len(target_files)} 个 {format_desc} 文件")
@@ -64,67 +70,56 @@ class PD_name_replacewordorder:
                 print(no_files_msg)
                 return (no_files_msg,)
                 
-            processed_results = []
-            modified_count = 0
-            
-            for file_path in target_files:
-                try:
-                    print(f"\n检查文件: {file_path.name}")
+            # 先为所有文件生成新名字，再整批执行：交换/链式重命名不再因目标“已存在”而失败
+            outcomes = []
+            for file_name in target_files:
+                # 检查文件名中是否包含关键词
+                if search_keyword in file_name:
+                    # 分离文件名和扩展名
+                    file_stem, file_suffix = os.path.splitext(file_name)
+                    
+                    # 移除关键词，保留原有的所有符号
+                    remaining_name = file_stem.replace(search_keyword, "")
+                    
+                    # 根据选择的位置重新组合文件名，直接拼接不添加分隔符
+                    if wordorder == "front":
+                        if remaining_name:
+                            new_stem = f"{search_keyword}{remaining_name}"
+                        else:
+                            new_stem = search_keyword
+                    else:  # end
+                        if remaining_name:
+                            new_stem = f"{remaining_name}{search_keyword}"
+                        else:
+                            new_stem = search_keyword
                     
-                    # 检查文件名中是否包含关键词
-                    if search_keyword in file_path.name:
-                        # 分离文件名和扩展名
-                        file_stem = file_path.stem  # 不含扩展名的文件名
-                        file_suffix = file_path.suffix  # 扩展名
-                        
-                        # 移除关键词，保留原有的所有符号
-                        remaining_name = file_stem.replace(search_keyword, "")
-                        
-                        # 根据选择的位置重新组合文件名，直接拼接不添加分隔符
-                        if wordorder == "front":
-                            if remaining_name:
-                                new_stem = f"{search_keyword}{remaining_name}"
-                            else:
-                                new_stem = search_keyword
-                        else:  # end
-                            if remaining_name:
-                                new_stem = f"{remaining_name}{search_keyword}"
-                            else:
-                                new_stem = search_keyword
-                        
-                        new_name = f"{new_stem}{file_suffix}"
-                        new_path = file_path.with_name(new_name)
-                        
-                        # 跳过已经在正确位置的文件
-                        if file_path.name == new_name:
-                            result = f"⚪ {file_path.name}: 关键词已在目标位置"
-                            print(f"  {result}")
-                            processed_results.append(result)
-                            continue
-                        
-                        # 检查目标文件名是否已存在
-                        if new_path.exists():
-                            error_result = f"⚠️ {file_path.name}: 跳过 - 目标文件名 '{new_name}' 已存在"
-                            print(f"  {error_result}")
-                            processed_results.append(error_result)
-                            continue
-                        
-                        # 执行重命名操作
-                        file_path.rename(new_path)
-                        modified_count += 1
-                        result = f"✅ {file_path.name} → {new_name}"
-                        print(f"  {result}")
-                        processed_results.append(result)
-                    else:
-                        result = f"⚪ {file_path.name}: 未找到关键词 '{search_keyword}'"
-                        print(f"  {result}")
-                        processed_results.append(result)
+                    new_name = f"{new_stem}{file_suffix}"
+                    
+                    # 跳过已经在正确位置的文件
+                    if file_name == new_name:
+                        outcomes.append((file_name, f"⚪ {file_name}: 关键词已在目标位置"))
+                        continue
+                    
+                    plan.add(file_name, new_name)
+                    outcomes.append((file_name, new_name))
+                else:
+                    outcomes.append((file_name, f"⚪ {file_name}: 未找到关键词 '{search_keyword}'"))
 
-                except Exception as e:
-                    error_result = f"❌ {file_path.name}: 处理失败 - {e}"
-                    print(f"  {error_result}")
-                    processed_results.append(error_result)
-                    continue
+            rename_result = plan.execute(dry_run=dry_run)
+            renamed = dict(rename_result.renamed)
+            conflicts = {src: reason for src, _, reason in rename_result.conflicts}
+            modified_count = len(renamed)
+
+            processed_results = []
+            for file_name, outcome in outcomes:
+                if file_name in renamed:
+                    result = f"✅ {file_name} → {renamed[file_name]}"
+                elif file_name in conflicts:
+                    result = f"⚠️ {file_name}: 跳过 - {outcome}: {conflicts[file_name]}"
+                else:
+                    result = outcome
+                print(f"  {result}")
+                processed_results.append(result)
 
             # 生成最终结果消息
             total_files = len(target_files)
@@ -135,6 +130,7 @@ class PD_name_replacewordorder:
 📄 总文件数: {total_files} 个文件
 🔍 关键词操作: '{search_keyword}' ({operation_desc})
 ✅ 成功修改: {modified_count} 个文件
+🧾 {rename_result.summary()}
 
 详细结果:
 {chr(10).join(processed_results)}
@@ -14,6 +14,7 @@ import time
 from datetime import datetime
 from comfy.cli_args import args
 import folder_paths
+from ._pd_fileio import AtomicWriter, FSYNC_POLICIES, NameReserver
 
 class PD_SAVE_PATH2:
     """
@@ -51,6 +52,9 @@ class PD_SAVE_PATH2:
                 "embed_metadata": ("BOOLEAN", {"default": True}),  # 是否嵌入元数据
                 "overwrite_mode": (["false", "prefix_as_filename"], {"default": "false"}),  # 覆盖模式
             },
+            "optional": {
+                "fsync_policy": (FSYNC_POLICIES, {"default": "never"}),  # 落盘策略：耐久性 vs 吞吐
+            },
             "hidden": {
                 "prompt": "PROMPT", 
                 "extra_pnginfo": "EXTRA_PNGINFO"
@@ -64,7 +68,7 @@ class PD_SAVE_PATH2:
 
     def save_images(self, images, name="T_", output_dir="", 
                    number_start=True, number_padding=1, filename_delimiter="_", extension="jpg", quality=100, optimize_image=True, lossless_webp=False,
-                   embed_metadata=True, overwrite_mode="false", prompt=None, extra_pnginfo=None):
+                   embed_metadata=True, overwrite_mode="false", fsync_policy="never", prompt=None, extra_pnginfo=None):
         """
         保存图像主方法
         
@@ -81,6 +85,7 @@ class PD_SAVE_PATH2:
         - lossless_webp: WebP是否无损
         - embed_metadata: 是否嵌入元数据
         - overwrite_mode: 覆盖模式
+        - fsync_policy: fsync 策略（never / per_batch / per_file）
         - prompt: 提示词信息
         - extra_pnginfo: 额外的PNG元数据信息
         
@@ -106,12 +111,14 @@ class PD_SAVE_PATH2:
             # 确保输出目录存在
             os.makedirs(output_dir, exist_ok=True)
             
-            # 调用私有方法保存图像到自定义目录
-            self._save_images_to_dir(
-                images, name, output_dir, number_padding, number_start, filename_delimiter, extension, quality,
-                optimize_image, lossless_webp, embed_metadata, overwrite_mode,
-                prompt, extra_pnginfo
-            )
+            # 调用私有方法保存图像到自定义目录（临时文件 + 重命名，按策略 fsync）
+            with AtomicWriter(fsync_policy) as writer:
+                self._save_images_to_dir(
+                    images, name, output_dir, number_padding, number_start, filename_delimiter, extension, quality,
+                    optimize_image, lossless_webp, embed_metadata, overwrite_mode,
+                    prompt, extra_pnginfo, writer
+                )
+            print(f"PD_SAVE_PATH2: {writer.stats.summary()}")
             
             # 返回空的结果，不显示预览图
             return {}
@@ -153,7 +160,7 @@ class PD_SAVE_PATH2:
         return text
 
     def _generate_filename(self, name: str, number_padding: int, 
-                          number_start: bool, filename_delimiter: str, extension: str, output_dir: str) -> str:
+                          number_start: bool, filename_delimiter: str, extension: str, reserver) -> str:
         """
         生成唯一的文件名
         
@@ -163,7 +170,7 @@ class PD_SAVE_PATH2:
             number_start (bool): 数字是否在开头
             filename_delimiter (str): 文件名分隔符，空则不加分隔符
             extension (str): 文件扩展名
-            output_dir (str): 输出目录
+            reserver (NameReserver): 输出目录的文件名分配器（整批只列举一次目录）
             
         Returns:
             str: 生成的文件名
@@ -189,72 +196,37 @@ class PD_SAVE_PATH2:
         else:  # 无前缀的情况
             # 只有数字: 1.jpg
             pattern = f"(\\d+)"
+        regex = re.compile(pattern + "$")
         
-        existing_counters = []
-        try:
-            for filename in os.listdir(output_dir):
-                # 只检查相同扩展名的文件
-                file_ext = os.path.splitext(filename)[1].lower()
-                if file_ext != extension.lower():
-                    continue
-                
-                # 移除扩展名再匹配
-                name_without_ext = os.path.splitext(filename)[0]
-                match = re.match(pattern + "$", name_without_ext)
-                if match:
-                    existing_counters.append(int(match.group(1)))
-        except Exception as e:
-            print(f"读取目录失败: {e}")
-        
-        # 设置初始计数器值
-        if existing_counters:
-            counter = max(existing_counters) + 1
-        else:
-            counter = 1
+        def parse_number(filename):
+            # 只检查相同扩展名的文件，移除扩展名再匹配
+            name_without_ext, file_ext = os.path.splitext(filename)
+            if file_ext.lower() != extension.lower():
+                return None
+            match = regex.match(name_without_ext)
+            return int(match.group(1)) if match else None
         
-        # 生成文件名
-        if name.strip():  # 有前缀的情况
-            if number_start:
-                # 数字在开头: 1_T_.jpg 或 1T_.jpg（无分隔符）
-                if filename_delimiter:
-                    filename = f"{counter:0{number_padding}}{filename_delimiter}{name}{extension}"
-                else:
-                    filename = f"{counter:0{number_padding}}{name}{extension}"
-            else:
-                # 数字在末尾: T_1.jpg 或 T1.jpg（无分隔符）
-                if filename_delimiter:
-                    filename = f"{name}{filename_delimiter}{counter:0{number_padding}}{extension}"
-                else:
-                    filename = f"{name}{counter:0{number_padding}}{extension}"
-        else:  # 无前缀的情况
-            # 只有数字: 1.jpg
-            filename = f"{counter:0{number_padding}}{extension}"
-        
-        # 确保文件名唯一
-        while os.path.exists(os.path.join(output_dir, filename)):
-            counter += 1
+        def make_name(counter):
             if name.strip():  # 有前缀的情况
                 if number_start:
                     # 数字在开头: 1_T_.jpg 或 1T_.jpg（无分隔符）
                     if filename_delimiter:
-                        filename = f"{counter:0{number_padding}}{filename_delimiter}{name}{extension}"
-                    else:
-                        filename = f"{counter:0{number_padding}}{name}{extension}"
-                else:
-                    # 数字在末尾: T_1.jpg 或 T1.jpg（无分隔符）
-                    if filename_delimiter:
-                        filename = f"{name}{filename_delimiter}{counter:0{number_padding}}{extension}"
-                    else:
-                        filename = f"{name}{counter:0{number_padding}}{extension}"
-            else:  # 无前缀的情况
-                # 只有数字: 1.jpg
-                filename = f"{counter:0{number_padding}}{extension}"
+                        return f"{counter:0{number_padding}}{filename_delimiter}{name}{extension}"
+                    return f"{counter:0{number_padding}}{name}{extension}"
+                # 数字在末尾: T_1.jpg 或 T1.jpg（无分隔符）
+                if filename_delimiter:
+                    return f"{name}{filename_delimiter}{counter:0{number_padding}}{extension}"
+                return f"{name}{counter:0{number_padding}}{extension}"
+            # 无前缀的情况，只有数字: 1.jpg
+            return f"{counter:0{number_padding}}{extension}"
         
-        return filename
+        # 从已有最大编号 + 1 开始，跳过已被占用的名字；同一模式的计数器在批内缓存
+        seq_key = (pattern, extension.lower(), number_padding)
+        return reserver.reserve_sequence(seq_key, make_name, parse_number)
 
     def _save_images_to_dir(self, images, name, output_dir, number_padding, number_start, filename_delimiter, extension, quality,
                            optimize_image, lossless_webp, embed_metadata, overwrite_mode,
-                           prompt, extra_pnginfo):
+                           prompt, extra_pnginfo, writer):
         """
         私有方法：将图像保存到指定目录
         
@@ -262,12 +234,14 @@ class PD_SAVE_PATH2:
         - images: 图像数组
         - name: 文件名前缀，空则不加前缀
         - output_dir: 输出目录路径
+        - writer: AtomicWriter 写入器
         - 其他参数: 各种保存选项
         
         返回：
         - results: 保存结果列表
         """
         results = []
+        reserver = NameReserver(output_dir)
         
         # 遍历图像数组，逐个保存
         for batch_number, image in enumerate(images):
@@ -303,7 +277,7 @@ class PD_SAVE_PATH2:
                         number_start=number_start,
                         filename_delimiter=filename_delimiter,
                         extension=extension,
-                        output_dir=output_dir
+                        reserver=reserver
                     )
                 
                 # 准备元数据
@@ -332,35 +306,40 @@ class PD_SAVE_PATH2:
                 
                 # 保存图像
                 if extension.lower() in ["jpg", "jpeg"]:
-                    img.save(
+                    writer.save_image(
+                        img,
                         output_file,
                         quality=quality,
                         optimize=optimize_image
                     )
                 elif extension.lower() == 'webp':
-                    img.save(
+                    writer.save_image(
+                        img,
                         output_file,
                         quality=quality,
                         lossless=lossless_webp,
                         exif=metadata
                     )
                 elif extension.lower() == 'png':
-                    img.save(
+                    writer.save_image(
+                        img,
                         output_file,
                         pnginfo=metadata,
                         optimize=optimize_image,
                         compress_level=self.compress_level
                     )
                 elif extension.lower() == 'bmp':
-                    img.save(output_file)
+                    writer.save_image(img, output_file)
                 elif extension.lower() == 'tiff':
-                    img.save(
+                    writer.save_image(
+                        img,
                         output_file,
                         quality=quality,
                         optimize=optimize_image
                     )
                 else:
-                    img.save(
+                    writer.save_image(
+                        img,
                         output_file,
                         pnginfo=metadata,
                         optimize=optimize_image
@@ -1,6 +1,11 @@
-import shutil
 import os
+import time
+from collections import Counter
 from pathlib import Path
+from ._pd_fileio import TRANSFER_MODES, NameReserver, format_transfer_counts
+from ._pd_parallel import copy_files
+from ._pd_match import MATCH_MODES, KeywordRouter, parse_rules
+from ._pd_walk import walk_files
 
 class PD_ImageFileTraining:
     """
@@ -46,6 +51,11 @@ class PD_ImageFileTraining:
                     "multiline": False,
                     "placeholder": "关键词2（用于分类到folder_2）"
                 }),
+            },
+            "optional": {
+                # copy: 独立副本（支持时用 reflink 写时复制）；link: 允许硬链接，与源文件共享数据
+                "transfer_mode": (TRANSFER_MODES, {"default": "copy"}),
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),  # 并行复制线程数，0 = 自动
             }
         }
     
@@ -55,7 +65,8 @@ class PD_ImageFileTraining:
     CATEGORY = "PandyTool/File"
     DESCRIPTION = "根据文件名是否包含自定义关键词对文件进行分类复制"
 
-    def classify_files(self, input_path, output_path, training_folder, folder_1, word_1, folder_2, word_2):
+    def classify_files(self, input_path, output_path, training_folder, folder_1, word_1, folder_2, word_2,
+                       transfer_mode="copy", workers=0):
         """
         文件分类主函数
         """
@@ -97,56 +108,57 @@ class PD_ImageFileTraining:
             count_2 = 0
             error_count = 0
             processed_files = []
+            transfer_counts = Counter()
             
             # 获取所有文件（只处理输入文件夹根目录下的文件）
             try:
-                files_to_process = [f for f in input_folder.iterdir() 
-                                  if f.is_file() and f.parent == input_folder]
+                files_to_process = [Path(entry.path) for entry in walk_files(input_folder)]
             except Exception as e:
                 return (f"❌ 错误：无法读取文件夹内容 - {str(e)}",)
             
             if not files_to_process:
                 return (f"📂 信息：文件夹中没有文件需要处理 - {input_path}",)
             
-            # 遍历文件进行分类
+            # 遍历文件进行分类：先串行决定目标路径（同批目标名在此预留），再并行复制
+            jobs = []
+            labels = []
+            reservers = {}
             for file_path in files_to_process:
-                try:
-                    file_name = file_path.name
-                    
-                    # 判断是否包含关键词word_1
-                    if word_1.strip() and word_1.strip() in file_name:
-                        # 复制到 folder_1 文件夹
-                        target_path = folder_1_path / file_name
-                        target_path = self._get_unique_filename(target_path)
-                        
-                        shutil.copy2(str(file_path), str(target_path))
-                        processed_files.append(f"✅ [{word_1}] {file_name}")
-                        count_1 += 1
-                    elif word_2.strip() and word_2.strip() in file_name:
-                        # 如果包含关键词word_2，复制到 folder_2 文件夹
-                        target_path = folder_2_path / file_name
-                        target_path = self._get_unique_filename(target_path)
-                        
-                        shutil.copy2(str(file_path), str(target_path))
-                        processed_files.append(f"📄 [{word_2}] {file_name}")
-                        count_2 += 1
-                    else:
-                        # 如果都不包含，默认复制到 folder_2 文件夹
-                        target_path = folder_2_path / file_name
-                        target_path = self._get_unique_filename(target_path)
-                        
-                        shutil.copy2(str(file_path), str(target_path))
-                        processed_files.append(f"📄 [其他] {file_name}")
-                        count_2 += 1
-                        
-                except Exception as e:
+                file_name = file_path.name
+                
+                # 判断是否包含关键词word_1
+                if word_1.strip() and word_1.strip() in file_name:
+                    # 复制到 folder_1 文件夹
+                    target_path = folder_1_path / file_name
+                    labels.append((f"✅ [{word_1}] {file_name}", 1))
+                elif word_2.strip() and word_2.strip() in file_name:
+                    # 如果包含关键词word_2，复制到 folder_2 文件夹
+                    target_path = folder_2_path / file_name
+                    labels.append((f"📄 [{word_2}] {file_name}", 2))
+                else:
+                    # 如果都不包含，默认复制到 folder_2 文件夹
+                    target_path = folder_2_path / file_name
+                    labels.append((f"📄 [其他] {file_name}", 2))
+                target_path = self._get_unique_filename(target_path, reservers)
+                jobs.append((str(file_path), str(target_path)))
+
+            for (src, _), (label, group), (strategy, attempts, error) in zip(
+                    jobs, labels, copy_files(jobs, transfer_mode, workers)):
+                if error is not None:
                     error_count += 1
-                    processed_files.append(f"❌ 复制失败: {file_path.name} - {str(e)}")
+                    processed_files.append(f"❌ 复制失败: {os.path.basename(src)} - {str(error)}")
+                    continue
+                transfer_counts[strategy] += 1
+                processed_files.append(label)
+                if group == 1:
+                    count_1 += 1
+                else:
+                    count_2 += 1
             
             # 生成结果消息
             result_message = self._generate_result_message(
                 training_dir, count_1, count_2, error_count, 
-                len(files_to_process), folder_1, folder_2, processed_files
+                len(files_to_process), folder_1, folder_2, processed_files, transfer_counts
             )
             
             return (result_message,)
@@ -154,27 +166,19 @@ class PD_ImageFileTraining:
         except Exception as e:
             return (f"❌ 未知错误：{str(e)}",)
     
-    def _get_unique_filename(self, file_path):
+    def _get_unique_filename(self, file_path, reservers):
         """
-        获取唯一的文件名，如果文件已存在则添加编号
+        获取唯一的文件名，如果文件已存在或已被本批预留则添加编号
+        每个目标文件夹只列举一次（folder_1 与 folder_2 相同时共用同一个分配器）
         """
-        if not file_path.exists():
-            return file_path
-        
-        counter = 1
-        original_stem = file_path.stem
-        original_suffix = file_path.suffix
         parent_dir = file_path.parent
-        
-        while file_path.exists():
-            new_name = f"{original_stem}_{counter}{original_suffix}"
-            file_path = parent_dir / new_name
-            counter += 1
-        
-        return file_path
+        key = os.path.normcase(os.path.abspath(parent_dir))
+        if key not in reservers:
+            reservers[key] = NameReserver(str(parent_dir))
+        return parent_dir / reservers[key].reserve(file_path.name)
     
     def _generate_result_message(self, training_dir, count_1, count_2, error_count, 
-                               total_files, folder_1, folder_2, processed_files):
+                               total_files, folder_1, folder_2, processed_files, transfer_counts):
         """
         生成结果消息
         """
@@ -188,6 +192,7 @@ class PD_ImageFileTraining:
         
         if error_count > 0:
             message_parts.append(f"   • ❌ 失败: {error_count} 个文件")
+        message_parts.append(f"   • 传输方式: {format_transfer_counts(transfer_counts)}")
         
         message_parts.append("\n📝 处理详情:")
         # 只显示前20个文件的处理情况，避免消息过长
@@ -200,12 +205,147 @@ class PD_ImageFileTraining:
         
         return "\n".join(message_parts)
 
+
+class PD_KeywordRouter:
+    """
+    多关键词路由节点：按“关键词 -> 文件夹”规则表把文件分到任意多个分类文件夹
+    规则表编译成 Aho-Corasick 自动机，每个文件名只扫描一遍，与规则数量无关
+    """
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "input_path": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": "输入文件夹路径"
+                }),
+                "output_path": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": "输出路径（留空则在输入文件夹下创建）"
+                }),
+                "training_folder": ("STRING", {
+                    "default": "aitookit_training",
+                    "multiline": False,
+                    "placeholder": "训练文件夹名称"
+                }),
+                "rules": ("STRING", {
+                    "default": "R -> aitookit_R\nT -> aitookit_T",
+                    "multiline": True,
+                    "placeholder": "每行一条：关键词1, 关键词2 -> 文件夹；# 开头为注释"
+                }),
+                "match_mode": (MATCH_MODES, {"default": "priority"}),
+                "default_folder": ("STRING", {
+                    "default": "aitookit_other",
+                    "multiline": False,
+                    "placeholder": "未命中任何规则的文件夹（留空则跳过）"
+                }),
+                "case_sensitive": ("BOOLEAN", {"default": True}),
+            },
+            "optional": {
+                "transfer_mode": (TRANSFER_MODES, {"default": "copy"}),
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),  # 并行复制线程数，0 = 自动
+            }
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("message",)
+    FUNCTION = "route_files"
+    CATEGORY = "PandyTool/File"
+    DESCRIPTION = "按关键词规则表把文件路由到多个分类文件夹（priority / first_match / all_matches）"
+
+    def route_files(self, input_path, output_path, training_folder, rules, match_mode, default_folder,
+                    case_sensitive, transfer_mode="copy", workers=0):
+        try:
+            input_path = input_path.strip()
+            if not input_path:
+                return ("❌ 错误：请提供输入文件夹路径",)
+            if not os.path.isdir(input_path):
+                return (f"❌ 错误：文件夹不存在 - {input_path}",)
+
+            rule_list, rule_errors = parse_rules(rules)
+            if rule_errors:
+                return ("❌ 规则表错误：\n" + "\n".join(rule_errors),)
+            if not rule_list:
+                return ("❌ 错误：规则表为空",)
+
+            base_dir = output_path.strip() or input_path
+            training_dir = os.path.join(base_dir, training_folder)
+            default_folder = default_folder.strip()
+
+            start = time.perf_counter()
+            router = KeywordRouter(rule_list, match_mode, case_sensitive)
+
+            # 流式列举输入文件夹（只处理根目录下的文件），边列举边路由
+            jobs = []
+            labels = []
+            reservers = {}
+            unmatched = 0
+            scanned = 0
+            for entry in walk_files(input_path):
+                scanned += 1
+                folders = router.route(entry.name)
+                if not folders:
+                    if not default_folder:
+                        unmatched += 1
+                        continue
+                    folders = [default_folder]
+                for folder in folders:
+                    folder_dir = os.path.join(training_dir, folder)
+                    reserver = reservers.get(folder_dir)
+                    if reserver is None:
+                        os.makedirs(folder_dir, exist_ok=True)
+                        reserver = reservers[folder_dir] = NameReserver(folder_dir)
+                    jobs.append((entry.path, reserver.path(entry.name)))
+                    labels.append((folder, entry.name))
+            route_seconds = time.perf_counter() - start
+
+            if not scanned:
+                return (f"📂 信息：文件夹中没有文件需要处理 - {input_path}",)
+
+            folder_counts = Counter()
+            transfer_counts = Counter()
+            details = []
+            error_count = 0
+            for (folder, name), (strategy, _, error) in zip(labels, copy_files(jobs, transfer_mode, workers)):
+                if error is not None:
+                    error_count += 1
+                    details.append(f"❌ 复制失败: {name} - {str(error)}")
+                    continue
+                folder_counts[folder] += 1
+                transfer_counts[strategy] += 1
+                details.append(f"✅ [{folder}] {name}")
+
+            message_parts = ["🎉 关键词路由完成！",
+                             f"📁 输出路径: {training_dir}",
+                             f"📊 扫描 {scanned} 个文件 | 规则 {len(rule_list)} 条 | 自动机状态 {router.automaton.state_count} | "
+                             f"模式 {match_mode} | 路由耗时 {route_seconds:.3f}s"]
+            for folder, count in folder_counts.most_common():
+                message_parts.append(f"   • {folder}: {count} 个文件")
+            if unmatched:
+                message_parts.append(f"   • 未命中（已跳过）: {unmatched} 个文件")
+            if error_count:
+                message_parts.append(f"   • ❌ 失败: {error_count} 个文件")
+            message_parts.append(f"   • 传输方式: {format_transfer_counts(transfer_counts)}")
+            message_parts.append("\n📝 处理详情:")
+            message_parts.extend(f"   {line}" for line in details[:20])
+            if len(details) > 20:
+                message_parts.append(f"   ... 还有 {len(details) - 20} 条")
+            return ("\n".join(message_parts),)
+
+        except Exception as e:
+            return (f"❌ 未知错误：{str(e)}",)
+
 # 节点映射字典
 NODE_CLASS_MAPPINGS = {
-    "PD_ImageFileTraining": PD_ImageFileTraining
+    "PD_ImageFileTraining": PD_ImageFileTraining,
+    "PD_KeywordRouter": PD_KeywordRouter,
 }
 
 # 节点显示名称映射
 NODE_DISPLAY_NAME_MAPPINGS = {
-    "PD_ImageFileTraining": "PD：aitookitTraining v1"
+    "PD_ImageFileTraining": "PD：aitookitTraining v1",
+    "PD_KeywordRouter": "PD：Keyword Router",
 }
@@ -1,23 +1,33 @@
 """
 PD图像覆盖保存节点
 该模块提供了保存图像并覆盖同名文件的功能
+内容未变化时跳过写入，变化时通过临时文件 + 重命名原子替换
 """
 
 from PIL import Image
 from PIL.PngImagePlugin import PngInfo
 import os
+import io
+import hashlib
+from collections import OrderedDict
 import numpy as np
 import json
 from comfy.cli_args import args
 import folder_paths
 from datetime import datetime
+from ._pd_fileio import AtomicWriter, FSYNC_POLICIES
 
 
 class PD_image_coversaver:
     """
     PD图像覆盖保存节点
     功能：将图像保存到指定路径，如果存在同名文件则直接覆盖
+    编码结果与磁盘上已有文件内容相同时跳过写入，避免无意义的重写和同步层缓存失效
     """
+
+    # 已落盘文件的内容摘要缓存：filepath -> (mtime_ns, size, digest)，跨节点实例共享
+    _digest_cache = OrderedDict()
+    _digest_cache_size = 4096
     
     def __init__(self):
         """初始化保存参数"""
@@ -41,6 +51,9 @@ class PD_image_coversaver:
                 "format": (["png", "jpg"], {"default": "png"}),  # 图像格式选择
                 "show_preview": ("BOOLEAN", {"default": True}),  # 是否在前端显示预览图
             },
+            "optional": {
+                "fsync_policy": (FSYNC_POLICIES, {"default": "never"}),  # 落盘策略：耐久性 vs 吞吐
+            },
             "hidden": {
                 "prompt": "PROMPT", 
                 "extra_pnginfo": "EXTRA_PNGINFO"
@@ -53,7 +66,7 @@ class PD_image_coversaver:
     CATEGORY = "PD/Image"  # 节点分类
 
     def save_images(self, images, filename="output", custom_output_dir="", 
-                   format="png", show_preview=True, prompt=None, extra_pnginfo=None):
+                   format="png", show_preview=True, fsync_policy="never", prompt=None, extra_pnginfo=None):
         """
         保存图像主方法（覆盖模式）
         
@@ -63,6 +76,7 @@ class PD_image_coversaver:
         - custom_output_dir: 自定义输出目录路径
         - format: 图像格式（png或jpg）
         - show_preview: 是否在前端显示预览图
+        - fsync_policy: fsync 策略（never / per_batch / per_file）
         - prompt: 提示词信息
         - extra_pnginfo: 额外的PNG元数据信息
         
@@ -82,9 +96,11 @@ class PD_image_coversaver:
             os.makedirs(output_dir, exist_ok=True)
             
             # 保存图像到指定目录
-            results = self._save_images_to_dir(
-                images, filename, output_dir, format, prompt, extra_pnginfo
-            )
+            with AtomicWriter(fsync_policy) as writer:
+                results = self._save_images_to_dir(
+                    images, filename, output_dir, format, prompt, extra_pnginfo, writer
+                )
+            print(f"PD_image_coversaver: {writer.stats.summary()}")
             
             # 根据show_preview参数决定返回值
             if show_preview:
@@ -124,7 +140,7 @@ class PD_image_coversaver:
             target_extension = f".{format.lower()}"
             return f"{filename}{target_extension}"
 
-    def _save_images_to_dir(self, images, filename, output_dir, format, prompt, extra_pnginfo):
+    def _save_images_to_dir(self, images, filename, output_dir, format, prompt, extra_pnginfo, writer):
         """
         私有方法：将图像保存到指定目录（覆盖模式）
         
@@ -135,6 +151,7 @@ class PD_image_coversaver:
         - format: 图像格式（png或jpg）
         - prompt: 提示词信息
         - extra_pnginfo: 额外PNG信息
+        - writer: AtomicWriter 写入器
         
         返回：
         - results: 保存结果列表
@@ -188,11 +205,12 @@ class PD_image_coversaver:
             # 完整文件路径
             filepath = os.path.join(output_dir, file)
             
-            # 根据格式保存图像（直接覆盖）
+            # 先编码到内存，用于和已有文件比较
+            buffer = io.BytesIO()
             if format.lower() == "png":
                 # PNG格式：保存为RGBA，包含元数据和指定的压缩级别
                 img.save(
-                    filepath,
+                    buffer,
                     pnginfo=metadata,
                     compress_level=self.compress_level,
                     format='PNG'
@@ -200,13 +218,21 @@ class PD_image_coversaver:
             else:  # JPG格式
                 # JPG格式：保存为RGB，设置质量
                 img.save(
-                    filepath,
+                    buffer,
                     format='JPEG',
                     quality=95,  # JPG质量设置
                     optimize=True
                 )
+            data = buffer.getvalue()
+            digest = hashlib.blake2b(data, digest_size=16).digest()
             
-            print(f"图像已保存: {filepath}")
+            if self._existing_digest(filepath, len(data)) == digest:
+                print(f"内容未变化，跳过写入: {filepath}")
+            else:
+                # 内容变化：原子替换（直接覆盖）
+                writer.write_bytes(filepath, data)
+                self._remember_digest(filepath, os.stat(filepath), digest)
+                print(f"图像已保存: {filepath}")
             
             # 生成返回结果信息，包含文件名和路径
             results.append({
@@ -217,6 +243,39 @@ class PD_image_coversaver:
         
         return results
 
+    def _existing_digest(self, filepath, new_size):
+        """
+        获取磁盘上已有文件的内容摘要
+        - 文件不存在或大小与新内容不同：返回 None（无需读取即可判定有变化）
+        - 缓存中 (mtime_ns, size) 命中：直接返回缓存摘要
+        - 否则读取文件计算摘要并缓存
+        """
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+        if st.st_size != new_size:
+            return None
+
+        cache = PD_image_coversaver._digest_cache
+        cached = cache.get(filepath)
+        if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            cache.move_to_end(filepath)
+            return cached[2]
+
+        with open(filepath, 'rb') as f:
+            digest = hashlib.blake2b(f.read(), digest_size=16).digest()
+        self._remember_digest(filepath, st, digest)
+        return digest
+
+    def _remember_digest(self, filepath, st, digest):
+        """记录文件摘要，超过容量时淘汰最久未使用的条目"""
+        cache = PD_image_coversaver._digest_cache
+        cache[filepath] = (st.st_mtime_ns, st.st_size, digest)
+        cache.move_to_end(filepath)
+        while len(cache) > PD_image_coversaver._digest_cache_size:
+            cache.popitem(last=False)
+
 
 # 节点类映射：将类名映射到实际的类
 NODE_CLASS_MAPPINGS = {
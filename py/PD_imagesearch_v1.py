@@ -5,6 +5,7 @@ from pathlib import Path
 from PIL import Image, ImageOps
 import folder_paths
 import unicodedata
+from ._pd_walk import IMAGE_EXTS, TEXT_EXTS, walk_files
 
 class PD_ImageSearch:
     """
@@ -58,9 +59,6 @@ class PD_ImageSearch:
             if not input_folder.is_dir():
                 raise ValueError(f"提供的路径不是文件夹: {input_path}")
             
-            # 支持的图片格式
-            supported_formats = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.webp'}
-            
             # 搜索包含关键字的图片文件和txt文件
             matching_image_files = []
             matching_txt_files = []
@@ -69,18 +67,16 @@ class PD_ImageSearch:
             word_norm = unicodedata.normalize('NFKC', word).casefold()
             
             try:
-                # 遍历文件夹中的所有文件
-                for file_path in input_folder.iterdir():
-                    if file_path.is_file():
-                        # 归一化文件名并检查是否包含关键字
-                        file_name_norm = unicodedata.normalize('NFKC', file_path.name).casefold()
-                        
-                        if word_norm in file_name_norm:
-                            # 检查文件扩展名
-                            if file_path.suffix.lower() in supported_formats:
-                                matching_image_files.append(file_path)
-                            elif file_path.suffix.lower() == '.txt':
-                                matching_txt_files.append(file_path)
+                # 遍历文件夹中的图片与txt文件
+                for entry in walk_files(input_folder, IMAGE_EXTS | TEXT_EXTS):
+                    # 归一化文件名并检查是否包含关键字
+                    file_name_norm = unicodedata.normalize('NFKC', entry.name).casefold()
+                    
+                    if word_norm in file_name_norm:
+                        if entry.ext in TEXT_EXTS:
+                            matching_txt_files.append(Path(entry.path))
+                        else:
+                            matching_image_files.append(Path(entry.path))
                 
             except Exception as e:
                 raise ValueError(f"无法读取文件夹内容: {str(e)}")
@@ -1,6 +1,31 @@
 import os
+import uuid
 from PIL import Image
 import folder_paths
+import comfy.utils
+from ._pd_fileio import AtomicWriter, FSYNC_POLICIES
+from ._pd_rename import RenamePlan, TEMP_PREFIX
+from ._pd_walk import IMAGE_EXTS, walk_files
+from ._pd_parallel import map_ordered, map_processes
+from ._pd_tasks import transcode_image
+
+# 输出格式 → (PIL 格式, 可原样保留的图像模式)；其余模式需要转换，必须重新编码
+_PASSTHROUGH = {
+    "JPG": ("JPEG", ("RGB", "L", "CMYK")),
+    "PNG": ("PNG", ("RGBA", "RGB", "L")),
+}
+
+
+def _temp_name():
+    """同目录内的临时名；TEMP_PREFIX 开头的文件会被目录遍历跳过"""
+    return f"{TEMP_PREFIX}{uuid.uuid4().hex[:12]}"
+
+
+def _probe_image(path):
+    """只读文件头：返回 (格式, 尺寸, 模式)"""
+    with Image.open(path) as img:
+        return img.format, img.size, img.mode
+
 
 class PD_rename_image:
     @classmethod
@@ -27,6 +52,10 @@ class PD_rename_image:
                     "default": "img_{index:04d}",
                     "placeholder": "重命名模式，如 img_{index:04d}"
                 }),
+            },
+            "optional": {
+                "fsync_policy": (FSYNC_POLICIES, {"default": "never"}),  # 落盘策略：耐久性 vs 吞吐
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),  # 图片处理进程数，0 = CPU 核数
             }
         }
     
@@ -35,28 +64,13 @@ class PD_rename_image:
     FUNCTION = "process_images"
     CATEGORY = "PD_Tools"
     
-    def resize_image_keep_ratio(self, image, max_size):
-        """保持宽高比调整图片尺寸"""
-        width, height = image.size
-        
-        # 计算缩放比例
-        if width > height:
-            if width > max_size:
-                ratio = max_size / width
-                new_width = max_size
-                new_height = int(height * ratio)
-            else:
-                return image
-        else:
-            if height > max_size:
-                ratio = max_size / height
-                new_height = max_size
-                new_width = int(width * ratio)
-            else:
-                return image
-        
-        return image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-    def process_images(self, input_path, max_size, output_format, rename_pattern):
+    def needs_transcode(self, probe, max_size, output_format):
+        """格式、模式已符合且不超过最长边时无需重新编码，直接重命名即可（不会多一次 JPEG 有损压缩）"""
+        image_format, size, mode = probe
+        target_format, modes = _PASSTHROUGH[output_format.upper()]
+        return image_format != target_format or mode not in modes or max(size) > max_size
+
+    def process_images(self, input_path, max_size, output_format, rename_pattern, fsync_policy="never", workers=0):
         """处理图片批量重命名和格式转换"""
         
         if not os.path.exists(input_path):
@@ -65,79 +79,111 @@ class PD_rename_image:
         if not os.path.isdir(input_path):
             return (f"错误: {input_path} 不是一个文件夹",)
         
-        # 支持的图片格式
-        supported_formats = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
-        
-        # 获取所有图片文件
-        image_files = []
-        for file_name in os.listdir(input_path):
-            file_path = os.path.join(input_path, file_name)
-            if os.path.isfile(file_path):
-                _, ext = os.path.splitext(file_name.lower())
-                if ext in supported_formats:
-                    image_files.append(file_name)
+        # 获取所有图片文件（按文件名排序确保处理顺序一致）
+        image_files = [entry.name for entry in walk_files(input_path, IMAGE_EXTS)]
         
         if not image_files:
             return (f"在路径 {input_path} 中未找到支持的图片文件",)
         
-        # 按文件名排序确保处理顺序一致
-        image_files.sort()
-        
-        processed_count = 0
-        error_count = 0
+        output_format = output_format.upper()
         error_messages = []
+        writer = AtomicWriter(fsync_policy)
         
-        for index, file_name in enumerate(image_files):
+        # 探测文件头，确定新文件名以及是否需要重新编码
+        passthrough = []   # [(源文件名, 新文件名)]
+        transcode = []     # [(源文件名, 新文件名)]
+        paths = [os.path.join(input_path, file_name) for file_name in image_files]
+        for index, (path, probe, error) in enumerate(map_ordered(_probe_image, paths, workers)):
+            file_name = image_files[index]
+            if error is not None:
+                error_messages.append(f"处理文件 {file_name} 时出错: {str(error)}")
+                continue
             try:
-                old_file_path = os.path.join(input_path, file_name)
-                
                 # 生成新文件名
                 new_name = rename_pattern.format(index=index + 1, original=os.path.splitext(file_name)[0])
-                new_file_name = f"{new_name}.{output_format.lower()}"
-                new_file_path = os.path.join(input_path, new_file_name)
-                
-                # 打开并处理图片
-                with Image.open(old_file_path) as img:
-                    # 转换为RGB模式（对于JPG格式）
-                    if output_format.upper() == "JPG" and img.mode in ("RGBA", "LA", "P"):
-                        # 创建白色背景
-                        background = Image.new("RGB", img.size, (255, 255, 255))
-                        if img.mode == "P":
-                            img = img.convert("RGBA")
-                        background.paste(img, mask=img.split()[-1] if img.mode == "RGBA" else None)
-                        img = background
-                    elif output_format.upper() == "PNG" and img.mode not in ("RGBA", "RGB", "L"):
-                        img = img.convert("RGBA")
-                    # 调整图片尺寸
-                    resized_img = self.resize_image_keep_ratio(img, max_size)
-                    
-                    # 保存处理后的图片
-                    save_kwargs = {}
-                    if output_format.upper() == "JPG":
-                        save_kwargs = {"format": "JPEG", "quality": 95, "optimize": True}
-                    elif output_format.upper() == "PNG":
-                        save_kwargs = {"format": "PNG", "optimize": True}
-                    
-                    resized_img.save(new_file_path, **save_kwargs)
-                
-                # 如果新文件名与原文件名不同，删除原文件
-                if old_file_path != new_file_path and os.path.exists(new_file_path):
-                    os.remove(old_file_path)
-                
-                processed_count += 1
-                
             except Exception as e:
-                error_count += 1
                 error_messages.append(f"处理文件 {file_name} 时出错: {str(e)}")
                 continue
+            new_file_name = f"{new_name}.{output_format.lower()}"
+            if self.needs_transcode(probe, max_size, output_format):
+                transcode.append((file_name, new_file_name))
+            else:
+                passthrough.append((file_name, new_file_name))
+        
+        # 先重新编码：结果写入同目录的临时名，源文件保持不动；失败的文件保留原名和原扩展名
+        staged = {}  # 源文件名 → (临时名, 新文件名, 源文件移走时的临时名)
+        tasks = [(os.path.join(input_path, src), max_size, output_format) for src, _ in transcode]
+        targets = dict(transcode)
+        pbar = comfy.utils.ProgressBar(len(tasks)) if tasks else None
+        for (path, _, _), data, error in map_processes(transcode_image, tasks, workers,
+                                                       on_progress=lambda done, total: pbar.update(1)):
+            src = os.path.basename(path)
+            if error is None:
+                staged_name = _temp_name()
+                try:
+                    writer.write_bytes(os.path.join(input_path, staged_name), data)
+                    staged[src] = (staged_name, targets[src], _temp_name())
+                    continue
+                except Exception as e:
+                    error = e
+            error_messages.append(f"处理文件 {src} 时出错: {str(error)}")
+        writer.commit()
         
+        # 再统一重命名：原样保留的文件直接改名；重新编码的文件由临时名改为新文件名，同时把源文件移到临时名
+        # （腾出可能被其他文件用作目标的名字）。新文件名无法使用的，连同源文件一起退出计划，源文件保持不动
+        dropped = set()
+        while True:
+            plan = RenamePlan(input_path)
+            for src, dst in passthrough:
+                plan.add(src, dst)
+            for src, (staged_name, dst, trash_name) in staged.items():
+                if src not in dropped:
+                    plan.add(staged_name, dst)
+                    plan.add(src, trash_name)
+            preview = plan.execute(dry_run=True)
+            conflicted = {src: (dst, reason) for src, dst, reason in preview.conflicts}
+            newly_dropped = [src for src, (staged_name, _, trash_name) in staged.items()
+                             if src not in dropped and (staged_name in conflicted or src in conflicted)]
+            if not newly_dropped:
+                break
+            for src in newly_dropped:
+                dropped.add(src)
+                dst, reason = conflicted.get(staged[src][0], conflicted.get(src))
+                error_messages.append(f"处理文件 {src} 时出错: {reason} ({dst})")
+        rename_result = plan.execute()
+        
+        renamed = {src for src, _ in rename_result.renamed}
+        passthrough_names = {src for src, _ in passthrough}
+        for src, dst, reason in rename_result.conflicts:
+            if src in passthrough_names:
+                error_messages.append(f"处理文件 {src} 时出错: {reason} ({dst})")
+        if rename_result.error:
+            error_messages.append(f"重命名失败，已全部回滚: {rename_result.error}")
+        passthrough_count = sum(1 for src, _ in passthrough if src in renamed or src in rename_result.unchanged)
+        
+        # 收尾：编码结果已就位的删除移走的源文件；未就位的（冲突或回滚）删除临时结果
+        transcoded_count = 0
+        for src, (staged_name, _, trash_name) in staged.items():
+            try:
+                if src not in dropped and staged_name in renamed:
+                    os.remove(os.path.join(input_path, trash_name))
+                    transcoded_count += 1
+                else:
+                    os.remove(os.path.join(input_path, staged_name))
+            except OSError as e:
+                error_messages.append(f"清理临时文件时出错: {e}")
+        
+        processed_count = passthrough_count + transcoded_count
+        error_count = len(error_messages)
+
         # 生成结果报告
         result_lines = [
             f"批量处理完成!",
             f"处理路径: {input_path}",
             f"最长边限制: {max_size}px",
             f"输出格式: {output_format}",
-            f"成功处理: {processed_count} 张图片",
+            f"成功处理: {processed_count} 张图片（原样保留仅重命名 {passthrough_count} 张, 重新编码 {transcoded_count} 张）",
+            writer.stats.summary(),
         ]
         
         if error_count > 0:
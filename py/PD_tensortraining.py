@@ -1,6 +1,11 @@
-import shutil
 import os
+import time
+from collections import Counter
 from pathlib import Path
+from ._pd_fileio import TRANSFER_MODES, NameReserver, format_transfer_counts
+from ._pd_parallel import copy_files
+from ._pd_match import ReplaceRule, ReplaceRuleSet, parse_replace_rules
+from ._pd_walk import walk_files
 
 class PD_TensorTraining:
     """
@@ -64,6 +69,17 @@ class PD_TensorTraining:
                     "placeholder": "替换词3"
                 }),
                 "ext_3": (ext_list, {"default": ".txt"}),
+            },
+            "optional": {
+                # copy: 独立副本（支持时用 reflink 写时复制）；link: 允许硬链接，与源文件共享数据
+                "transfer_mode": (TRANSFER_MODES, {"default": "copy"}),
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),  # 并行复制线程数，0 = 自动
+                # 规则表：每行“查找 -> 替换 | 后缀”，re: 前缀为正则；非空时取代上面三组规则
+                "rules": ("STRING", {
+                    "default": "",
+                    "multiline": True,
+                    "placeholder": "R -> star | .jpg\nre:^T_(\\d+) -> end_\\1 | .jpg\nT -> | .txt"
+                }),
             }
         }
     
@@ -76,7 +92,7 @@ class PD_TensorTraining:
     def process_dataset(self, input_path, output_path, operation_mode,
                        find_1, replace_1, ext_1,
                        find_2, replace_2, ext_2,
-                       find_3, replace_3, ext_3):
+                       find_3, replace_3, ext_3, transfer_mode="copy", workers=0, rules=""):
         
         VALID_EXTS = {'.jpg', '.png', '.txt'}
 
@@ -98,124 +114,101 @@ class PD_TensorTraining:
 
             # 3. 统计数据
             stats = {
-                "total": 0, "renamed": 0, "copied": 0, "errors": 0, "skipped": 0, "logs": []
+                "total": 0, "renamed": 0, "copied": 0, "errors": 0, "skipped": 0, "logs": [],
+                "transfer": Counter(), "retried": 0
             }
 
             # 4. 获取文件
-            files = [f for f in in_dir.iterdir() if f.is_file() and f.suffix.lower() in VALID_EXTS]
+            files = [Path(entry.path) for entry in walk_files(in_dir, VALID_EXTS)]
             
             if not files:
                 return (f"⚠️ 警告：目录中没有支持的文件 (jpg/png/txt)",)
 
-            # 5. 核心处理循环
+            # 5. 编译规则：规则表非空时整表一次匹配；否则三组旧规则依次生效（保持原来的级联替换效果）
+            if rules.strip():
+                rule_list, rule_errors = parse_replace_rules(rules)
+                if rule_errors:
+                    return ("❌ 规则表错误：\n" + "\n".join(rule_errors),)
+                stages = [ReplaceRuleSet(rule_list)]
+            else:
+                legacy = [(find_1, replace_1, ext_1), (find_2, replace_2, ext_2), (find_3, replace_3, ext_3)]
+                stages = [ReplaceRuleSet([ReplaceRule(find, replace, ext)])
+                          for find, replace, ext in legacy if find and find.strip()]
+            strict = operation_mode == "Strict Filter (Rules Only)"
+            # 严格模式：只处理被某条规则的后缀范围覆盖的文件，每种后缀只判断一次
+            scope_cache = {}
+
+            # 6. 核心处理循环：先串行决定每个文件的去向（目标名在此预留，保证互不冲突），再并行复制
+            start_time = time.perf_counter()
+            jobs = []
+            planned = []
+            reserver = NameReserver(str(out_dir))
             for f in files:
                 try:
                     original_name = f.name
                     current_ext = f.suffix.lower() 
-                    new_name = original_name
-                    
-                    # 标记该文件是否被规则命中
-                    matched_rule = False
-
-                    # --- 规则处理 (增加 .strip() 防止空字符串误判) ---
-                    
-                    # 规则 1
-                    if find_1 and find_1.strip():
-                        if (ext_1 == "All" or ext_1 == current_ext):
-                            if find_1 in new_name:
-                                new_name = new_name.replace(find_1, replace_1)
-                                matched_rule = True # 命中了内容修改
-                            elif operation_mode == "Strict Filter (Rules Only)":
-                                # 在严格模式下，如果后缀匹配了规则（比如是txt），但没包含关键词
-                                # 我们通常认为它属于"该类文件"，允许通过，但如果你希望严格到"只有包含关键词才复制"，逻辑需更严
-                                # 这里保持宽容：只要后缀对应且规则非空，就视为命中了关注范围
-                                matched_rule = True
-
-                    # 规则 2
-                    if find_2 and find_2.strip():
-                        if (ext_2 == "All" or ext_2 == current_ext):
-                            if find_2 in new_name:
-                                new_name = new_name.replace(find_2, replace_2)
-                                matched_rule = True
-                            elif operation_mode == "Strict Filter (Rules Only)":
-                                matched_rule = True
-
-                    # 规则 3
-                    if find_3 and find_3.strip():
-                        if (ext_3 == "All" or ext_3 == current_ext):
-                            if find_3 in new_name:
-                                new_name = new_name.replace(find_3, replace_3)
-                                matched_rule = True
-                            elif operation_mode == "Strict Filter (Rules Only)":
-                                matched_rule = True
 
                     # --- 决策：是否复制/处理 ---
-                    
-                    should_process = True
-                    
-                    # 如果是严格模式，且没有命中任何有效规则的后缀范围，则跳过
-                    if operation_mode == "Strict Filter (Rules Only)":
-                        # 检查当前文件是否属于任何一个由于设置了find而生效的ext范围
-                        active_scope = False
-                        
-                        # 检查规则1是否激活且覆盖当前后缀
-                        if find_1.strip() and (ext_1 == "All" or ext_1 == current_ext): active_scope = True
-                        # 检查规则2
-                        if find_2.strip() and (ext_2 == "All" or ext_2 == current_ext): active_scope = True
-                        # 检查规则3
-                        if find_3.strip() and (ext_3 == "All" or ext_3 == current_ext): active_scope = True
-                        
-                        if not active_scope:
-                            should_process = False
-
-                    if not should_process:
-                        stats["skipped"] += 1
-                        continue
-
-                    # --- 执行操作 ---
+                    if strict:
+                        if current_ext not in scope_cache:
+                            scope_cache[current_ext] = any(stage.in_scope(current_ext) for stage in stages)
+                        if not scope_cache[current_ext]:
+                            stats["skipped"] += 1
+                            continue
+
+                    # --- 规则处理 ---
+                    new_name = original_name
+                    for stage in stages:
+                        new_name, _ = stage.apply(new_name, current_ext)
+
+                    # --- 规划操作 ---
                     stats["total"] += 1
                     
                     # 判断是否发生了重命名
                     is_renamed = (new_name != original_name)
                     
                     # 目标路径处理
-                    dest_path = out_dir / new_name
-                    dest_path = self._get_unique_path(dest_path)
+                    dest_path = out_dir / reserver.reserve(new_name)
 
-                    shutil.copy2(str(f), str(dest_path))
-
-                    if is_renamed:
-                        stats["renamed"] += 1
-                        stats["logs"].append(f"🔄 [{current_ext}] {original_name} -> {dest_path.name}")
-                    else:
-                        stats["copied"] += 1
-                        stats["logs"].append(f"📄 [{current_ext}] {original_name}")
+                    jobs.append((str(f), str(dest_path)))
+                    planned.append((f, dest_path, current_ext, is_renamed))
 
                 except Exception as e:
                     stats["errors"] += 1
                     stats["logs"].append(f"❌ {f.name}: {str(e)}")
 
+            # 7. 并行复制，日志按文件顺序输出
+            for (f, dest_path, current_ext, is_renamed), (strategy, attempts, error) in zip(
+                    planned, copy_files(jobs, transfer_mode, workers)):
+                if error is not None:
+                    stats["errors"] += 1
+                    stats["logs"].append(f"❌ {f.name}: {str(error)}")
+                    continue
+                stats["transfer"][strategy] += 1
+                if attempts > 1:
+                    stats["retried"] += 1
+                if is_renamed:
+                    stats["renamed"] += 1
+                    stats["logs"].append(f"🔄 [{current_ext}] {f.name} -> {dest_path.name}")
+                else:
+                    stats["copied"] += 1
+                    stats["logs"].append(f"📄 [{current_ext}] {f.name}")
+
+            stats["seconds"] = time.perf_counter() - start_time
             return (self._make_report(out_dir, stats),)
 
         except Exception as e:
             return (f"❌ 严重错误: {str(e)}",)
 
-    def _get_unique_path(self, path: Path) -> Path:
-        if not path.exists(): return path
-        stem = path.stem
-        suffix = path.suffix
-        parent = path.parent
-        counter = 1
-        while path.exists():
-            path = parent / f"{stem}_{counter}{suffix}"
-            counter += 1
-        return path
-
     def _make_report(self, out_dir, stats):
         msg = []
         msg.append("✅ Tensor 数据集处理完成")
         msg.append(f"📂 输出: {out_dir}")
         msg.append(f"📊 统计: 处理 {stats['total']} | 改名 {stats['renamed']} | 原样 {stats['copied']} | 忽略 {stats['skipped']}")
+        msg.append(f"🔗 传输方式: {format_transfer_counts(stats['transfer'])} | 重试成功 {stats['retried']} | 失败 {stats['errors']}")
+        seconds = stats["seconds"]
+        scanned = stats["total"] + stats["skipped"]
+        msg.append(f"⏱️ 耗时 {seconds:.2f}s | {scanned / seconds if seconds > 0 else 0:.0f} 文件/秒")
         msg.append("\n📝 详情 (Top 20):")
         msg.extend(stats["logs"][:20])
         if len(stats["logs"]) > 20:
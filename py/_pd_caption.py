@@ -0,0 +1,293 @@
+"""
+PD 标注（caption）标签处理
+供处理 booru 风格 .txt 数据集的节点共用（文件名以 _ 开头，不会被当作节点模块加载）
+
+每个文件只解析一次为标签列表，之后的操作都是集合/字典查找，耗时与标签数量成正比、与规则数量无关：
+    replace  按映射替换标签（目标可为多个标签，留空表示删除）
+    remove   删除集合中的标签
+    dedupe   去掉重复标签，保留第一次出现的位置
+    front    把指定标签按给定顺序移到最前
+    trigger  在最前面加触发词（已存在时移到最前，不会重复）
+    max_tags 限制标签数量（不计触发词，触发词永远保留）
+比较时忽略大小写（可关闭），且下划线与空格视为相同：blue_hair 与 blue hair 是同一个标签
+
+- TagIndex：标签 → 文件数 / 文件列表 的索引，保存在数据集根目录的 .pd_tag_index.json，
+  按文件 mtime/大小增量更新，只重新读取新增或改动过的文件；支持 top_n、共现、按标签查文件三种查询
+"""
+
+import os
+import re
+import json
+from collections import Counter
+
+from ._pd_parallel import map_ordered
+from ._pd_walk import TEXT_EXTS, walk_files
+
+INDEX_NAME = ".pd_tag_index.json"
+INDEX_VERSION = 1
+QUERY_MODES = ["top_n", "cooccurrence", "files_with_tag"]
+
+_SPLIT = re.compile(r"[,\n]")
+
+
+def split_tags(text):
+    """按逗号/换行拆分，去掉首尾空白与空标签"""
+    return [tag for tag in (part.strip() for part in _SPLIT.split(text)) if tag]
+
+
+def tag_key(tag, case_sensitive=False):
+    """比较用的标签键：下划线视为空格，默认忽略大小写"""
+    tag = tag.replace("_", " ")
+    return tag if case_sensitive else tag.lower()
+
+
+def unique_tags(text, case_sensitive=False):
+    """拆分并去重（保留第一次出现的写法与位置）"""
+    seen = set()
+    tags = []
+    for tag in split_tags(text):
+        key = tag_key(tag, case_sensitive)
+        if key not in seen:
+            seen.add(key)
+            tags.append(tag)
+    return tags
+
+
+def parse_replace_map(text):
+    """
+    解析替换表，每行一条：旧标签 -> 新标签（可用逗号写多个，留空表示删除）
+    空行与 # 开头的行忽略；返回 ([(旧标签, [新标签])], [错误说明])
+    """
+    pairs = []
+    errors = []
+    for line_no, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "->" not in line:
+            errors.append(f"第 {line_no} 行缺少 '->': {line}")
+            continue
+        old, new = line.split("->", 1)
+        old = old.strip()
+        if not old:
+            errors.append(f"第 {line_no} 行缺少原标签: {line}")
+            continue
+        pairs.append((old, split_tags(new)))
+    return pairs, errors
+
+
+class CaptionPipeline:
+    """按 replace → remove → dedupe → front → trigger → max_tags 的顺序处理一个文件的标签"""
+
+    def __init__(self, remove=(), replace=(), dedupe=True, front=(), trigger=(), max_tags=0,
+                 case_sensitive=False, separator=", "):
+        self.case_sensitive = case_sensitive
+        self.separator = separator
+        self.replace = {self.key(old): list(new) for old, new in replace}
+        self.remove = {self.key(tag) for tag in remove}
+        self.dedupe = dedupe
+        self.front = {}
+        for tag in front:
+            self.front.setdefault(self.key(tag), len(self.front))
+        self.trigger = list(trigger)
+        self.trigger_keys = {self.key(tag) for tag in self.trigger}
+        self.max_tags = max_tags
+
+    def key(self, tag):
+        return tag_key(tag, self.case_sensitive)
+
+    def transform(self, tags):
+        key = self.key
+        if self.replace:
+            replaced = []
+            for tag in tags:
+                new = self.replace.get(key(tag))
+                if new is None:
+                    replaced.append(tag)
+                else:
+                    replaced.extend(new)
+            tags = replaced
+
+        if self.remove:
+            tags = [tag for tag in tags if key(tag) not in self.remove]
+
+        # 触发词在最前面单独加入，正文中已有的同名标签去掉
+        if self.trigger_keys:
+            tags = [tag for tag in tags if key(tag) not in self.trigger_keys]
+
+        if self.dedupe:
+            seen = set()
+            unique = []
+            for tag in tags:
+                k = key(tag)
+                if k not in seen:
+                    seen.add(k)
+                    unique.append(tag)
+            tags = unique
+
+        if self.front:
+            # 稳定排序：指定标签按 front 中的顺序在前，其余保持原顺序
+            last = len(self.front)
+            tags = sorted(tags, key=lambda tag: self.front.get(key(tag), last))
+
+        if self.max_tags > 0:
+            tags = tags[:self.max_tags]
+
+        return self.trigger + tags
+
+    def apply(self, text):
+        """返回新的文本；标签列表没有变化时返回 None（原文件保持不动，包括原有的分隔符格式）"""
+        tags = split_tags(text)
+        new_tags = self.transform(tags)
+        if new_tags == tags:
+            return None
+        new_text = self.separator.join(new_tags)
+        if text.endswith("\n"):
+            new_text += "\n"
+        return new_text
+
+
+def _read_tags(job):
+    path, _, _, case_sensitive = job
+    with open(path, 'r', encoding='utf-8') as f:
+        return unique_tags(f.read(), case_sensitive)
+
+
+class TagIndex:
+    """
+    一个数据集目录的标签索引；计数为“包含该标签的文件数”
+    files: 相对路径 → (mtime_ns, 大小, 去重后的标签)
+    """
+
+    def __init__(self, root, recursive=True, case_sensitive=False):
+        self.root = root
+        self.recursive = recursive
+        self.case_sensitive = case_sensitive
+        self.files = {}
+        self.counts = Counter()
+        self.postings = {}
+        self.display = {}
+        self.loaded = False
+        self.dirty = False
+
+    @property
+    def path(self):
+        return os.path.join(self.root, INDEX_NAME)
+
+    def key(self, tag):
+        return tag_key(tag, self.case_sensitive)
+
+    def _add(self, rel_path, record):
+        self.files[rel_path] = record
+        for tag in record[2]:
+            key = self.key(tag)
+            self.counts[key] += 1
+            self.postings.setdefault(key, set()).add(rel_path)
+            self.display.setdefault(key, tag)
+
+    def _discard(self, rel_path):
+        for tag in self.files.pop(rel_path)[2]:
+            key = self.key(tag)
+            self.counts[key] -= 1
+            if self.counts[key] <= 0:
+                del self.counts[key]
+                del self.postings[key]
+                del self.display[key]
+            else:
+                self.postings[key].discard(rel_path)
+
+    def load(self):
+        """读取索引文件；不存在、版本或参数不一致、损坏时从空索引开始"""
+        self.loaded = True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if (data.get("version") != INDEX_VERSION or data.get("recursive") != self.recursive
+                    or data.get("case_sensitive") != self.case_sensitive):
+                return
+            for rel_path, (mtime_ns, size, tags) in data["files"].items():
+                self._add(rel_path, (mtime_ns, size, tags))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"标签索引无法读取，将重新建立: {e}")
+            self.files.clear()
+            self.counts.clear()
+            self.postings.clear()
+            self.display.clear()
+
+    def update(self, workers=0):
+        """
+        与磁盘同步：只 stat 每个文件，mtime 或大小变化的才重新读取
+        返回 {"scanned", "added", "updated", "removed", "errors"}
+        """
+        stats = {"scanned": 0, "added": 0, "updated": 0, "removed": 0, "errors": 0}
+        seen = set()
+        jobs = []
+        for entry in walk_files(self.root, TEXT_EXTS, max_depth=None if self.recursive else 0):
+            stats["scanned"] += 1
+            rel_path = entry.rel_path
+            seen.add(rel_path)
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            record = self.files.get(rel_path)
+            if record is None or record[0] != st.st_mtime_ns or record[1] != st.st_size:
+                jobs.append((entry.path, rel_path, (st.st_mtime_ns, st.st_size), self.case_sensitive))
+
+        for rel_path in [rel_path for rel_path in self.files if rel_path not in seen]:
+            self._discard(rel_path)
+            stats["removed"] += 1
+
+        for (path, rel_path, signature, _), tags, error in map_ordered(_read_tags, jobs, workers):
+            if error is not None:
+                print(f"跳过文件 {path}，错误: {error}")
+                stats["errors"] += 1
+                continue
+            if rel_path in self.files:
+                self._discard(rel_path)
+                stats["updated"] += 1
+            else:
+                stats["added"] += 1
+            self._add(rel_path, signature + (tags,))
+
+        if stats["added"] or stats["updated"] or stats["removed"]:
+            self.dirty = True
+        return stats
+
+    def save(self, writer):
+        if not self.dirty:
+            return
+        data = {
+            "version": INDEX_VERSION,
+            "recursive": self.recursive,
+            "case_sensitive": self.case_sensitive,
+            "files": {rel_path: list(record) for rel_path, record in self.files.items()},
+        }
+        writer.write_text(self.path, json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+        self.dirty = False
+
+    def top(self, n=0):
+        """[(标签, 文件数)]，n <= 0 为全部"""
+        items = self.counts.most_common(n if n > 0 else None)
+        return [(self.display[key], count) for key, count in items]
+
+    def files_with(self, tags):
+        """同时包含所有给定标签的文件（相对路径，已排序）"""
+        keys = [self.key(tag) for tag in tags]
+        if not keys:
+            return []
+        postings = sorted((self.postings.get(key, set()) for key in keys), key=len)
+        return sorted(set.intersection(*postings)) if postings[0] else []
+
+    def cooccurrence(self, tags, n=0):
+        """与给定标签同时出现的其他标签：[(标签, 共同出现的文件数)]"""
+        keys = {self.key(tag) for tag in tags}
+        counter = Counter()
+        for rel_path in self.files_with(tags):
+            for tag in self.files[rel_path][2]:
+                key = self.key(tag)
+                if key not in keys:
+                    counter[key] += 1
+        return [(self.display[key], count) for key, count in counter.most_common(n if n > 0 else None)]
@@ -0,0 +1,361 @@
+"""
+PD 文件写入层
+供所有会写文件的节点共用（文件名以 _ 开头，不会被当作节点模块加载）
+
+- 原子性：先写同目录临时文件，再 os.replace 到目标路径，中断时不会留下半截文件
+- fsync 策略（FSYNC_POLICIES）：
+    never      不调用 fsync，吞吐最高；进程崩溃安全，断电可能丢失最近写入
+    per_batch  文件立即替换到位，整批结束（commit）时统一 fsync 文件，每个目录只同步一次
+    per_file   每个文件 fsync 后再替换，并同步所在目录；最安全也最慢
+- 统计：写入字节数、文件数、fsync 次数与耗时
+- materialize()：把源文件放到新路径，按 reflink → hardlink → copy_file_range → copy 依次尝试
+- NameReserver：基于一次目录列举分配不冲突的文件名，替代逐个 exists() 递增探测
+"""
+
+import os
+import sys
+import time
+import uuid
+import errno
+import shutil
+import threading
+from contextlib import contextmanager
+
+FSYNC_POLICIES = ["never", "per_batch", "per_file"]
+
+# materialize 传输模式：
+#   copy  独立副本；支持 reflink 的文件系统（btrfs/xfs/APFS 等）上写时复制，几乎不占空间和时间
+#   link  在 copy 的基础上允许硬链接：输出与源文件共享同一份数据，修改任一方都会影响另一方
+TRANSFER_MODES = ["copy", "link"]
+
+# linux/fs.h: FICLONE = _IOW(0x94, 9, int)
+_FICLONE = 0x40049409
+
+# 这些错误码表示“文件系统/平台不支持该方式”，同一 (源目录, 目标目录) 后续不再尝试；
+# EXDEV（跨文件系统）同时取决于源和目标，因此按目录对记录
+_UNSUPPORTED_ERRNOS = {getattr(errno, name) for name in ("EXDEV", "ENOTTY", "EOPNOTSUPP", "ENOTSUP", "ENOSYS")
+                       if hasattr(errno, name)}
+# FICLONE 在文件系统不支持 reflink 时返回 EINVAL；其他方式的 EINVAL 与具体文件有关
+_REFLINK_UNSUPPORTED_ERRNOS = _UNSUPPORTED_ERRNOS | {errno.EINVAL}
+# 只与当前文件有关的失败：fs.protected_hardlinks 拒绝为他人的文件建硬链接（EPERM）、
+# 源文件链接数已达上限（EMLINK）等，本文件改用下一种方式，不影响后续文件
+_PER_FILE_ERRNOS = {errno.EPERM, errno.EMLINK, errno.EINVAL}
+# {(方式, 源目录, 目标目录)}
+_unsupported = set()
+
+# 临时文件后缀，遍历目录的节点据此跳过写入中的文件
+TEMP_SUFFIX = ".pdtmp"
+
+
+def is_temp_name(name):
+    """是否为本模块产生的临时文件名"""
+    return name.startswith(".") and name.endswith(TEMP_SUFFIX)
+
+
+def _temp_path_for(path):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}{TEMP_SUFFIX}")
+
+
+def _fsync_directory(directory):
+    """同步目录项（POSIX）；Windows 不支持对目录 fsync，直接跳过"""
+    if os.name == "nt":
+        return
+    fd = os.open(directory or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteStats:
+    """写入统计，多线程共享时由 AtomicWriter 加锁更新"""
+
+    def __init__(self):
+        self.files_written = 0
+        self.bytes_written = 0
+        self.fsync_count = 0
+        self.fsync_seconds = 0.0
+
+    def summary(self):
+        return (f"写入 {self.files_written} 个文件 / {self.bytes_written / (1024 * 1024):.2f} MB, "
+                f"fsync {self.fsync_count} 次 / {self.fsync_seconds:.3f}s")
+
+
+class AtomicWriter:
+    """
+    原子写入器，一个节点执行对应一个批次：
+
+        with AtomicWriter(fsync_policy) as writer:
+            writer.write_bytes(path, data)
+            writer.save_image(img, path, quality=95)
+            with writer.open(path) as f:
+                ...
+
+    正常退出 with 块时 commit()；per_batch 策略在 commit 时统一落盘
+    """
+
+    def __init__(self, fsync_policy="never"):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"未知的 fsync 策略: {fsync_policy}")
+        self.fsync_policy = fsync_policy
+        self.stats = WriteStats()
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            # 已经替换到位的文件是完整的，只是放弃批量同步
+            self._pending.clear()
+        return False
+
+    @contextmanager
+    def open(self, path):
+        """以二进制写模式打开 path 的临时文件；块正常结束后替换到目标路径，异常时删除临时文件"""
+        tmp_path = _temp_path_for(path)
+        # 0o666 交由 umask 决定最终权限，与直接写文件时一致
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+        f = os.fdopen(fd, "wb")
+        try:
+            yield f
+            f.flush()
+            size = f.seek(0, os.SEEK_END)
+            if self.fsync_policy == "per_file":
+                self._timed_fsync(f.fileno())
+            f.close()
+            os.replace(tmp_path, path)
+        except BaseException:
+            f.close()
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        if self.fsync_policy == "per_file":
+            self._timed(lambda: _fsync_directory(os.path.dirname(path)))
+        with self._lock:
+            self.stats.files_written += 1
+            self.stats.bytes_written += size
+            if self.fsync_policy == "per_batch":
+                self._pending.append(path)
+
+    def write_bytes(self, path, data):
+        with self.open(path) as f:
+            f.write(data)
+
+    def write_text(self, path, text, encoding="utf-8", newline=None):
+        """newline 语义同内置 open()：None 时把 '\\n' 转换为 os.linesep，与文本模式写文件结果一致"""
+        if newline is None:
+            newline = os.linesep
+        if newline and newline != "\n":
+            text = text.replace("\n", newline)
+        self.write_bytes(path, text.encode(encoding))
+
+    def save_image(self, img, path, format=None, **kwargs):
+        """PIL 图像原子保存；临时文件没有图片扩展名，因此按目标路径推断格式"""
+        if format is None:
+            from PIL import Image
+            format = Image.registered_extensions().get(os.path.splitext(path)[1].lower())
+        with self.open(path) as f:
+            img.save(f, format=format, **kwargs)
+
+    def commit(self):
+        """per_batch：统一 fsync 本批写入的文件，再逐个目录同步一次"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        flags = os.O_RDWR if os.name == "nt" else os.O_RDONLY
+        directories = []
+        for path in pending:
+            try:
+                fd = os.open(path, flags)
+            except OSError:
+                continue
+            try:
+                self._timed_fsync(fd)
+            finally:
+                os.close(fd)
+            directory = os.path.dirname(path)
+            if directory not in directories:
+                directories.append(directory)
+        for directory in directories:
+            self._timed(lambda: _fsync_directory(directory))
+
+    def _timed_fsync(self, fd):
+        self._timed(lambda: os.fsync(fd))
+
+    def _timed(self, func):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stats.fsync_count += 1
+            self.stats.fsync_seconds += elapsed
+
+
+class NameReserver:
+    """
+    单个目录内的唯一文件名分配器（线程安全）
+
+        reserver = NameReserver(out_dir)
+        path = reserver.path("image.png")   # image.png / image_1.png / image_2.png ...
+
+    - eager=True：构造时列举一次目录，之后不再访问磁盘，适合批量分配
+    - eager=False：先用一次 lexists 试探，只有出现冲突才列举目录，适合只取一两个名字
+    - 每个文件名记住下一个候选编号，同一 stem 冲突上千次也是均摊 O(1)
+    - 已分配但尚未写入的名字同样视为占用，并行写入前规划目标名时不会撞名
+    """
+
+    def __init__(self, directory, pattern="{stem}_{n}{suffix}", start=1, eager=True):
+        self.directory = directory
+        self.pattern = pattern
+        self.start = start
+        self._taken = {}  # normcase(name) -> 原始文件名
+        self._listed = False
+        self._next = {}
+        self._sequences = {}
+        self._lock = threading.Lock()
+        if eager:
+            self._list()
+
+    def _list(self):
+        if os.path.isdir(self.directory):
+            self._taken.update((os.path.normcase(name), name) for name in os.listdir(self.directory))
+        self._listed = True
+
+    def _is_taken(self, name):
+        key = os.path.normcase(name)
+        if key in self._taken:
+            return True
+        if not self._listed:
+            if not os.path.lexists(os.path.join(self.directory, name)):
+                return False
+            self._list()
+            return True
+        return False
+
+    def reserve(self, filename, numbered=False):
+        """
+        返回可用的文件名并标记为占用
+        filename 可用时原样返回；否则按 pattern 从 start 开始编号（numbered=True 时总是编号）
+        """
+        with self._lock:
+            if not numbered and not self._is_taken(filename):
+                self._taken[os.path.normcase(filename)] = filename
+                return filename
+            stem, suffix = os.path.splitext(filename)
+            key = os.path.normcase(filename)
+            n = self._next.get(key, self.start)
+            candidate = self.pattern.format(stem=stem, n=n, suffix=suffix)
+            while self._is_taken(candidate):
+                n += 1
+                candidate = self.pattern.format(stem=stem, n=n, suffix=suffix)
+            self._next[key] = n + 1
+            self._taken[os.path.normcase(candidate)] = candidate
+            return candidate
+
+    def path(self, filename, numbered=False):
+        return os.path.join(self.directory, self.reserve(filename, numbered))
+
+    def reserve_sequence(self, seq_key, make_name, parse_number, start=1):
+        """
+        编号型文件名：make_name(n) 生成文件名，parse_number(name) 从已有文件名解析编号（不匹配返回 None）
+        首次调用时取列举结果中的最大编号 + 1，之后从缓存的计数器继续，不再扫描目录
+        """
+        with self._lock:
+            if not self._listed:
+                self._list()
+            n = self._sequences.get(seq_key)
+            if n is None:
+                numbers = [number for number in map(parse_number, self._taken.values()) if number is not None]
+                n = max(numbers) + 1 if numbers else start
+            while os.path.normcase(make_name(n)) in self._taken:
+                n += 1
+            name = make_name(n)
+            self._taken[os.path.normcase(name)] = name
+            self._sequences[seq_key] = n + 1
+            return name
+
+
+def _reflink(src, dst):
+    import fcntl
+    with open(src, "rb") as fsrc:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            fcntl.ioctl(fd, _FICLONE, fsrc.fileno())
+        except BaseException:
+            os.close(fd)
+            os.remove(dst)
+            raise
+        os.close(fd)
+    shutil.copystat(src, dst)
+
+
+def _copy_file_range(src, dst):
+    with open(src, "rb") as fsrc, open(dst, "xb") as fdst:
+        try:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(remaining, 1 << 30))
+                if copied == 0:
+                    break
+                remaining -= copied
+        except BaseException:
+            fdst.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def _link_strategies(mode):
+    strategies = []
+    # FICLONE 是 Linux ioctl；其他平台直接从硬链接/复制开始
+    if sys.platform.startswith("linux"):
+        strategies.append(("reflink", _reflink))
+    if mode == "link":
+        strategies.append(("hardlink", os.link))
+    if hasattr(os, "copy_file_range"):
+        strategies.append(("copy_file_range", _copy_file_range))
+    return strategies
+
+
+def materialize(src, dst, mode="copy"):
+    """
+    把 src 放到 dst（dst 不应已存在），返回实际使用的策略名：
+    reflink / hardlink / copy_file_range / copy
+
+    某种方式在某对 (源目录, 目标目录) 上因文件系统不支持而失败后会被记住，后续文件直接跳过；
+    只与单个文件有关的失败（EPERM、EMLINK 等）只让这个文件改用下一种方式
+    """
+    if mode not in TRANSFER_MODES:
+        raise ValueError(f"未知的传输模式: {mode}")
+    directories = (os.path.dirname(os.path.abspath(src)), os.path.dirname(os.path.abspath(dst)))
+    for name, func in _link_strategies(mode):
+        key = (name,) + directories
+        if key in _unsupported:
+            continue
+        try:
+            func(src, dst)
+            return name
+        except OSError as e:
+            unsupported = _REFLINK_UNSUPPORTED_ERRNOS if name == "reflink" else _UNSUPPORTED_ERRNOS
+            if e.errno in unsupported:
+                _unsupported.add(key)
+            elif e.errno not in _PER_FILE_ERRNOS:
+                raise
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def format_transfer_counts(counts):
+    """把 {策略: 次数} 格式化为报告中的一行"""
+    if not counts:
+        return "无"
+    return ", ".join(f"{name} {count}" for name, count in sorted(counts.items(), key=lambda item: -item[1]))
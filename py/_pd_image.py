@@ -0,0 +1,169 @@
+"""
+PD 图像处理公共函数
+供缩放/转换类节点共用（文件名以 _ 开头，不会被当作节点模块加载）
+
+- fit_within：按最长边限制计算等比目标尺寸
+- ratio_crop_plan / resize_crop：“最长边缩放到 max_size 再居中裁剪到指定比例”换算成源图坐标中的裁剪框，
+  一次 resize(size, box=...) 完成，被裁掉的像素不参与重采样，也没有两次取整的误差；
+  大倍率缩小时先用 reduce() 按整数倍快速缩小（reducing_gap）
+- open_for_size：打开图片并计算目标尺寸；JPEG 用 draft 模式直接以 1/2、1/4、1/8 缩小解码，
+  结果不小于目标尺寸，再交给 LANCZOS 精确缩放，画质与全分辨率解码后缩放基本一致
+- open_for_crop：同上，按 ratio_crop_plan 计算输出尺寸与裁剪框，裁剪框换算到降采样解码后的坐标
+- ReducePyramid：同一张图生成多个尺寸时共用的 reduce(2) 金字塔，每层只算一次
+- flatten_on_white：带透明通道的图片合成到白色背景
+- encode_image：编码为字节串，便于在子进程中完成 CPU 部分、由主进程统一写盘
+"""
+
+import io
+
+from PIL import Image
+
+
+def fit_within(size, max_size):
+    """最长边不超过 max_size 的等比尺寸；无需缩小时返回 None"""
+    width, height = size
+    if max_size <= 0 or max(width, height) <= max_size:
+        return None
+    if width > height:
+        return max_size, int(height * max_size / width)
+    return int(width * max_size / height), max_size
+
+
+# 整数倍 reduce 之后剩余的缩放倍数至少为此值，画质与直接重采样几乎无差别
+REDUCING_GAP = 3.0
+
+
+def ratio_crop_plan(size, max_size, aspect_ratio, tolerance=0.01):
+    """
+    最长边缩放到 max_size（不放大），再居中裁剪到 aspect_ratio = (宽, 高)
+    输出尺寸与“先缩放、再裁剪”的两步做法完全一致
+
+    Returns:
+        output_size: 最终尺寸 (宽, 高)
+        source_box: 源图坐标中的裁剪框 (left, top, right, bottom)，可为小数
+        crop_info: 裁剪说明（比例已符合时为空）
+    """
+    width, height = size
+    max_dimension = max(width, height)
+    if max_dimension > max_size:
+        scale = max_size / max_dimension
+        # 极端长条图的短边至少保留 1 像素
+        resized_width, resized_height = max(1, int(width * scale)), max(1, int(height * scale))
+    else:
+        resized_width, resized_height = width, height
+
+    target_ratio = aspect_ratio[0] / aspect_ratio[1]
+    current_ratio = resized_width / resized_height
+    box = (0, 0, resized_width, resized_height)
+    crop_info = ""
+    if abs(current_ratio - target_ratio) > tolerance:
+        if current_ratio > target_ratio:
+            # 太宽，裁剪宽度
+            new_width = max(1, int(resized_height * target_ratio))
+            left = (resized_width - new_width) // 2
+            box = (left, 0, left + new_width, resized_height)
+            crop_info = f"裁剪宽度: {resized_width}→{new_width}"
+        else:
+            # 太高，裁剪高度
+            new_height = max(1, int(resized_width / target_ratio))
+            top = (resized_height - new_height) // 2
+            box = (0, top, resized_width, top + new_height)
+            crop_info = f"裁剪高度: {resized_height}→{new_height}"
+
+    scale_x = width / resized_width
+    scale_y = height / resized_height
+    source_box = (box[0] * scale_x, box[1] * scale_y, box[2] * scale_x, box[3] * scale_y)
+    return (box[2] - box[0], box[3] - box[1]), source_box, crop_info
+
+
+def resize_crop(img, output_size, source_box, resample=Image.Resampling.LANCZOS):
+    """按 ratio_crop_plan 的结果一次完成裁剪+缩放；不需要缩放时只做裁剪"""
+    left, top, right, bottom = source_box
+    if (right - left, bottom - top) == tuple(output_size):
+        box = (int(left), int(top), int(right), int(bottom))
+        return img if box == (0, 0) + img.size else img.crop(box)
+    return img.resize(output_size, resample, box=source_box, reducing_gap=REDUCING_GAP)
+
+
+class ReducePyramid:
+    """
+    第 k 层为上一层 reduce(2)，按需生成并缓存
+    每个输出从仍不小于 REDUCING_GAP 倍输出尺寸的最深一层开始重采样，
+    画质与从原图直接 resize(reducing_gap=REDUCING_GAP) 相当，多个输出共用同一组缩小结果
+    """
+
+    def __init__(self, img, original_size=None):
+        self.levels = [img]
+        # 裁剪框所用的坐标系；img 为降采样解码的结果时传入原始尺寸
+        self.original_size = original_size or img.size
+
+    def level(self, index):
+        while len(self.levels) <= index:
+            self.levels.append(self.levels[-1].reduce(2))
+        return self.levels[index]
+
+    def resize_crop(self, output_size, source_box, resample=Image.Resampling.LANCZOS):
+        """source_box 为原始尺寸坐标（ratio_crop_plan 的结果）"""
+        base = self.levels[0]
+        scale_x = base.size[0] / self.original_size[0]
+        scale_y = base.size[1] / self.original_size[1]
+        left, top, right, bottom = source_box
+        factor = min((right - left) * scale_x / output_size[0], (bottom - top) * scale_y / output_size[1])
+        index = 0
+        while factor >= 2 * REDUCING_GAP and min(base.size) >> (index + 1) > 0:
+            factor /= 2
+            index += 1
+        img = self.level(index)
+        scale_x *= img.size[0] / base.size[0]
+        scale_y *= img.size[1] / base.size[1]
+        box = (left * scale_x, top * scale_y, right * scale_x, bottom * scale_y)
+        return resize_crop(img, output_size, box, resample)
+
+
+def open_for_size(path, max_size):
+    """
+    打开图片，按最长边 max_size 计算目标尺寸，JPEG 在可能时降采样解码
+    返回 (已加载的图片, 目标尺寸)；无需缩小时目标尺寸为 None，按原尺寸解码
+    """
+    img = Image.open(path)
+    target_size = fit_within(img.size, max_size)
+    if target_size and img.format == "JPEG":
+        img.draft(img.mode, target_size)
+    img.load()
+    return img, target_size
+
+
+def open_for_crop(path, max_size, aspect_ratio):
+    """
+    打开图片并按 ratio_crop_plan 规划缩放裁剪；输出尺寸按原始尺寸计算，与不做降采样解码时一致
+    返回 (已加载的图片, 输出尺寸, 裁剪框, 裁剪说明)，直接交给 resize_crop
+    """
+    img = Image.open(path)
+    size = img.size
+    output_size, source_box, crop_info = ratio_crop_plan(size, max_size, aspect_ratio)
+    draft_size = fit_within(size, max_size)
+    if draft_size and img.format == "JPEG":
+        img.draft(img.mode, draft_size)
+    img.load()
+    if img.size != size:
+        scale_x, scale_y = img.size[0] / size[0], img.size[1] / size[1]
+        left, top, right, bottom = source_box
+        source_box = (left * scale_x, top * scale_y, right * scale_x, bottom * scale_y)
+    return img, output_size, source_box, crop_info
+
+
+def flatten_on_white(img):
+    """RGBA / LA / P 合成到白色背景，其余模式原样返回"""
+    if img.mode not in ('RGBA', 'LA', 'P'):
+        return img
+    if img.mode == 'P':
+        img = img.convert('RGBA')
+    background = Image.new('RGB', img.size, (255, 255, 255))
+    background.paste(img, mask=img.split()[-1])
+    return background
+
+
+def encode_image(img, format, **kwargs):
+    buffer = io.BytesIO()
+    img.save(buffer, format=format, **kwargs)
+    return buffer.getvalue()
@@ -0,0 +1,243 @@
+"""
+PD 工作流 JSON 批量编辑脚本
+供 PDJSON 类节点共用（文件名以 _ 开头，不会被当作节点模块加载）
+
+脚本每行一条操作，空行与 # 开头的行忽略：
+    set      路径 = 值            值按 JSON 解析（30、"euler"、true、[1,2]），解析失败按字符串处理；字典中不存在的键会新建
+    replace  路径 = 旧值 -> 新值   字符串按子串替换，其它类型需完全相等
+    delete   路径                 删除命中的键或列表元素
+
+路径由 . 分隔的键和 [] 选择器组成：
+    nodes[type=KSampler].widgets_values[2]
+    nodes[*].widgets_values[*]
+    groups[title=Temp]
+    [3]  下标（可为负数）   [*]  全部元素/全部键   [字段=值]  列表中该字段等于值的字典
+
+所有操作按路径编译成前缀树，每个文件只遍历一次；共享前缀的操作（如多条 nodes[type=...]）只匹配一次
+"""
+
+import re
+import json
+
+EDIT_OPS = ("set", "replace", "delete")
+
+_TOKEN = re.compile(r"\.?([^.\[\]]+)|\[([^\]]*)\]")
+
+
+def _parse_value(text):
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _kind(value):
+    """比较用的类型：bool 与数字分开（Python 中 True == 1），int 与 float 视为同一类"""
+    if isinstance(value, bool):
+        return bool
+    if isinstance(value, (int, float)):
+        return float
+    return type(value)
+
+
+def _same_value(a, b):
+    """类型严格的相等比较，列表与字典逐项递归；widgets_values 中布尔值与整数常常混在一起"""
+    if _kind(a) is not _kind(b):
+        return False
+    if isinstance(a, list):
+        return len(a) == len(b) and all(_same_value(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_same_value(a[key], b[key]) for key in a)
+    return a == b
+
+
+def _value_matches(value, raw):
+    if isinstance(value, str):
+        return value == raw
+    try:
+        return _same_value(json.loads(raw), value)
+    except ValueError:
+        return str(value) == raw
+
+
+def parse_path(path):
+    """把路径解析为步骤元组列表；格式错误时抛出 ValueError"""
+    steps = []
+    position = 0
+    path = path.strip()
+    while position < len(path):
+        match = _TOKEN.match(path, position)
+        if not match or match.end() == position:
+            raise ValueError(f"无法解析路径: {path}")
+        key, selector = match.groups()
+        if key is not None:
+            steps.append(("key", key.strip()))
+        else:
+            selector = selector.strip()
+            if selector == "*":
+                steps.append(("all",))
+            elif "=" in selector:
+                field, raw = selector.split("=", 1)
+                steps.append(("where", field.strip(), raw.strip()))
+            else:
+                try:
+                    steps.append(("index", int(selector)))
+                except ValueError:
+                    raise ValueError(f"无法解析选择器 [{selector}]: {path}")
+        position = match.end()
+    if not steps:
+        raise ValueError("路径为空")
+    return steps
+
+
+def _split_assignment(text):
+    """在方括号之外的第一个 = 处拆分"""
+    depth = 0
+    for i, ch in enumerate(text):
+        if ch == "[":
+            depth += 1
+        elif ch == "]":
+            depth -= 1
+        elif ch == "=" and depth == 0:
+            return text[:i], text[i + 1:]
+    return text, None
+
+
+class _TrieNode:
+    __slots__ = ("children", "ops")
+
+    def __init__(self):
+        self.children = {}
+        self.ops = []
+
+
+def _targets(container, step):
+    """产出 (父容器, 键/下标)"""
+    kind = step[0]
+    if kind == "key":
+        if isinstance(container, dict):
+            yield container, step[1]
+    elif kind == "index":
+        if isinstance(container, list) and -len(container) <= step[1] < len(container):
+            yield container, step[1] % len(container)
+    elif kind == "all":
+        if isinstance(container, list):
+            yield from ((container, i) for i in range(len(container)))
+        elif isinstance(container, dict):
+            yield from ((container, key) for key in list(container))
+    else:
+        _, field, raw = step
+        if isinstance(container, list):
+            items = enumerate(container)
+        elif isinstance(container, dict):
+            items = list(container.items())
+        else:
+            return
+        for key, value in items:
+            if isinstance(value, dict) and field in value and _value_matches(value[field], raw):
+                yield container, key
+
+
+def _exists(parent, key):
+    return key in parent if isinstance(parent, dict) else True
+
+
+class EditScript:
+    """编译后的编辑脚本；apply(data) 原地修改并返回修改次数"""
+
+    def __init__(self, ops):
+        self.ops = list(ops)
+        self.root = _TrieNode()
+        for op in self.ops:
+            node = self.root
+            for step in op[1]:
+                node = node.children.setdefault(step, _TrieNode())
+            node.ops.append(op)
+
+    def apply(self, data):
+        deletions = []
+        changes = self._walk(self.root, data, deletions)
+        # 删除放到遍历结束后执行；同一列表按下标从大到小删除，避免下标错位
+        deletions.sort(key=lambda item: item[1] if isinstance(item[0], list) else 0, reverse=True)
+        removed = set()
+        for parent, key in deletions:
+            marker = (id(parent), key)
+            if marker in removed:
+                continue
+            removed.add(marker)
+            if isinstance(parent, dict):
+                parent.pop(key, None)
+            else:
+                del parent[key]
+            changes += 1
+        return changes
+
+    def _walk(self, node, container, deletions):
+        changes = 0
+        for step, child in node.children.items():
+            for parent, key in list(_targets(container, step)):
+                for op in child.ops:
+                    changes += self._apply_op(op, parent, key, deletions)
+                if child.children and _exists(parent, key):
+                    changes += self._walk(child, parent[key], deletions)
+        return changes
+
+    @staticmethod
+    def _apply_op(op, parent, key, deletions):
+        kind = op[0]
+        if kind == "set":
+            value = op[2]
+            if _exists(parent, key) and _same_value(parent[key], value):
+                return 0
+            parent[key] = value
+            return 1
+        if kind == "replace":
+            if not _exists(parent, key):
+                return 0
+            old, new, current = op[2], op[3], parent[key]
+            if isinstance(current, str) and isinstance(old, str) and isinstance(new, str):
+                if old not in current:
+                    return 0
+                parent[key] = current.replace(old, new)
+                return 1
+            if _same_value(current, old) and not _same_value(current, new):
+                parent[key] = new
+                return 1
+            return 0
+        if _exists(parent, key):
+            deletions.append((parent, key))
+        return 0
+
+
+def parse_edit_script(text):
+    """返回 (EditScript, [错误说明])；有错误时仍返回由其余正确行组成的脚本"""
+    ops = []
+    errors = []
+    for line_no, raw in enumerate(text.splitlines(), 1):
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = line.split(None, 1)
+        kind = parts[0].lower()
+        if kind not in EDIT_OPS or len(parts) < 2:
+            errors.append(f"第 {line_no} 行无法识别（应为 set / replace / delete）: {line}")
+            continue
+        try:
+            if kind == "delete":
+                ops.append(("delete", parse_path(parts[1])))
+                continue
+            path, value = _split_assignment(parts[1])
+            if value is None:
+                raise ValueError("缺少 '='")
+            steps = parse_path(path)
+            if kind == "set":
+                ops.append(("set", steps, _parse_value(value)))
+            else:
+                if "->" not in value:
+                    raise ValueError("replace 需要 '旧值 -> 新值'")
+                old, new = value.split("->", 1)
+                ops.append(("replace", steps, _parse_value(old), _parse_value(new)))
+        except ValueError as e:
+            errors.append(f"第 {line_no} 行: {e}")
+    return EditScript(ops), errors
@@ -0,0 +1,177 @@
+"""
+PD 工作流自动布局
+供整理 ComfyUI 工作流 JSON 的节点共用（文件名以 _ 开头，不会被当作节点模块加载）
+
+layered_layout：按 links 建立有向图
+    1. Kahn 拓扑排序 + 最长路径分层（遇到环时取编号最小的剩余节点强制入队，打断环路）
+    2. 有限轮次的重心法（barycenter）上下交替扫描，减少相邻层之间的连线交叉，保留交叉最少的一轮
+    3. 按节点实际尺寸排布：每层宽度取该层最宽节点，层内按高度依次向下
+分层与排布 O(V + E)，每轮扫描另有层内排序与 O(E log E) 的交叉计数；2000 个节点的工作流远低于一秒
+"""
+
+from collections import deque
+
+# LiteGraph 节点 size 不含标题栏高度
+NODE_TITLE_HEIGHT = 30
+DEFAULT_NODE_SIZE = (300, 100)
+
+LAYOUT_MODES = ["diagonal", "layered"]
+
+
+def _node_size(node):
+    size = node.get("size")
+    if isinstance(size, dict):
+        size = [size.get("0"), size.get("1")]
+    try:
+        return float(size[0]), float(size[1])
+    except (TypeError, ValueError, IndexError, KeyError):
+        return DEFAULT_NODE_SIZE
+
+
+def _link_endpoints(link):
+    """兼容两种 links 格式：[id, origin_id, origin_slot, target_id, target_slot, type] 与字典"""
+    if isinstance(link, dict):
+        return link.get("origin_id"), link.get("target_id")
+    if isinstance(link, (list, tuple)) and len(link) >= 4:
+        return link[1], link[3]
+    return None, None
+
+
+def assign_layers(node_ids, edges):
+    """
+    node_ids 按编号升序；edges 为 (起点, 终点) 集合
+    返回 {节点: 层号}，层号为从源节点出发的最长路径长度
+    """
+    successors = {node_id: [] for node_id in node_ids}
+    indegree = {node_id: 0 for node_id in node_ids}
+    for origin, target in edges:
+        successors[origin].append(target)
+        indegree[target] += 1
+
+    layer = {node_id: 0 for node_id in node_ids}
+    done = set()
+    queue = deque(node_id for node_id in node_ids if indegree[node_id] == 0)
+    fallback = iter(node_ids)
+    while len(done) < len(node_ids):
+        if not queue:
+            # 剩余节点都在环上：按编号取第一个未处理的节点强制入队
+            for node_id in fallback:
+                if node_id not in done:
+                    queue.append(node_id)
+                    break
+        node_id = queue.popleft()
+        if node_id in done:
+            continue
+        done.add(node_id)
+        for target in successors[node_id]:
+            if target in done:
+                continue
+            layer[target] = max(layer[target], layer[node_id] + 1)
+            indegree[target] -= 1
+            if indegree[target] == 0:
+                queue.append(target)
+    return layer
+
+
+def _sweep(layers, neighbors, position):
+    """按相邻层邻居的平均位置对每层重新排序；没有相邻层邻居的节点保持原位置"""
+    for nodes in layers:
+        keys = {}
+        for node_id in nodes:
+            linked = neighbors[node_id]
+            keys[node_id] = (sum(position[n] for n in linked) / len(linked)) if linked else position[node_id]
+        nodes.sort(key=keys.__getitem__)
+        for index, node_id in enumerate(nodes):
+            position[node_id] = index
+
+
+def _count_crossings(layers, successors, position):
+    """相邻两层之间的连线交叉数：按起点排序后对终点位置数逆序对（归并计数），O(E log E)"""
+    total = 0
+    for nodes in layers[:-1]:
+        ends = [position[target] for node_id in nodes for target in sorted(successors[node_id], key=position.get)]
+        total += _inversions(ends)
+    return total
+
+
+def _inversions(values):
+    if len(values) < 2:
+        return 0
+    middle = len(values) // 2
+    left, right = values[:middle], values[middle:]
+    count = _inversions(left) + _inversions(right)
+    i = j = 0
+    for k in range(len(values)):
+        if j >= len(right) or (i < len(left) and left[i] <= right[j]):
+            values[k] = left[i]
+            i += 1
+        else:
+            values[k] = right[j]
+            j += 1
+            count += len(left) - i
+    return count
+
+
+def layered_layout(data, start_x=0, start_y=0, gap_x=80, gap_y=40, sweeps=4):
+    """
+    原地修改 data["nodes"] 中每个节点的 pos 与 xy；返回层数
+    """
+    nodes = [node for node in data.get("nodes", []) if isinstance(node, dict) and "id" in node]
+    if not nodes:
+        return 0
+    by_id = {node["id"]: node for node in nodes}
+    node_ids = sorted(by_id, key=lambda node_id: (str(type(node_id)), node_id))
+
+    edges = set()
+    for link in data.get("links") or []:
+        origin, target = _link_endpoints(link)
+        if origin in by_id and target in by_id and origin != target:
+            edges.add((origin, target))
+
+    layer = assign_layers(node_ids, edges)
+    layer_count = max(layer.values()) + 1
+    layers = [[] for _ in range(layer_count)]
+    for node_id in node_ids:
+        layers[layer[node_id]].append(node_id)
+
+    # 重心法只看相邻层的邻居；跨多层的长连线不参与排序
+    predecessors = {node_id: [] for node_id in node_ids}
+    successors = {node_id: [] for node_id in node_ids}
+    for origin, target in edges:
+        if layer[target] == layer[origin] + 1:
+            predecessors[target].append(origin)
+            successors[origin].append(target)
+
+    position = {}
+    for nodes_in_layer in layers:
+        for index, node_id in enumerate(nodes_in_layer):
+            position[node_id] = index
+    # 上下交替扫描，保留交叉数最少的一次排列
+    best = _count_crossings(layers, successors, position)
+    best_layers = [list(nodes_in_layer) for nodes_in_layer in layers]
+    for sweep in range(sweeps):
+        if best == 0:
+            break
+        if sweep % 2 == 0:
+            _sweep(layers[1:], predecessors, position)
+        else:
+            _sweep(layers[-2::-1], successors, position)
+        crossings = _count_crossings(layers, successors, position)
+        if crossings < best:
+            best = crossings
+            best_layers = [list(nodes_in_layer) for nodes_in_layer in layers]
+    layers = best_layers
+
+    x = start_x
+    for nodes_in_layer in layers:
+        y = start_y
+        layer_width = 0
+        for node_id in nodes_in_layer:
+            width, height = _node_size(by_id[node_id])
+            # 与对角线布局一致，pos 与 xy 同步更新
+            by_id[node_id]["pos"] = [x, y + NODE_TITLE_HEIGHT]
+            by_id[node_id]["xy"] = [x, y + NODE_TITLE_HEIGHT]
+            y += height + NODE_TITLE_HEIGHT + gap_y
+            layer_width = max(layer_width, width)
+        x += layer_width + gap_x
+    return layer_count
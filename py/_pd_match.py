@@ -0,0 +1,324 @@
+"""
+PD 多关键词匹配
+供按文件名分类/路由的节点共用（文件名以 _ 开头，不会被当作节点模块加载）
+
+- KeywordAutomaton：Aho-Corasick 自动机，对每个文件名只扫描一遍，耗时与规则数量无关
+- KeywordRouter：把“关键词 -> 文件夹”规则表编译成自动机，支持三种路由语义：
+    priority     命中多条规则时取规则表中最靠前的一条
+    first_match  取文件名中最先出现（起始位置最靠左）的关键词；同一位置取规则表中靠前的
+    all_matches  命中的每个文件夹各放一份
+- ReplaceRuleSet：任意条数的“查找 -> 替换 | 后缀”规则（字面量或 re: 正则），
+  按后缀把适用规则合并成一个带命名分组的交替正则，每个文件名一次 sub 完成全部替换
+"""
+
+import re
+from collections import deque
+
+MATCH_MODES = ["priority", "first_match", "all_matches"]
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 自动机：iter_matches(text) 产出 (起始位置, 关键词序号)"""
+
+    def __init__(self, keywords, case_sensitive=True):
+        self.case_sensitive = case_sensitive
+        self.lengths = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for index, keyword in enumerate(keywords):
+            if not case_sensitive:
+                keyword = keyword.lower()
+            self.lengths.append(len(keyword))
+            state = 0
+            for ch in keyword:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(index)
+
+        # BFS 计算失配指针，并把失配链上的输出合并到当前状态
+        # 根的直接子节点失配指针为根
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    @property
+    def state_count(self):
+        return len(self._goto)
+
+    def iter_matches(self, text):
+        if not self.case_sensitive:
+            text = text.lower()
+        goto, fail, out, lengths = self._goto, self._fail, self._out, self.lengths
+        state = 0
+        for position, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in out[state]:
+                yield position - lengths[index] + 1, index
+
+
+def parse_rules(text):
+    """
+    解析规则表，每行一条：关键词1, 关键词2 -> 文件夹
+    空行与 # 开头的行忽略；返回 ([(keyword, folder)], [错误说明])
+    """
+    rules = []
+    errors = []
+    for line_no, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "->" not in line:
+            errors.append(f"第 {line_no} 行缺少 '->': {line}")
+            continue
+        keywords, folder = line.rsplit("->", 1)
+        folder = folder.strip()
+        if not folder:
+            errors.append(f"第 {line_no} 行缺少目标文件夹: {line}")
+            continue
+        for keyword in keywords.split(","):
+            keyword = keyword.strip()
+            if keyword:
+                rules.append((keyword, folder))
+    return rules, errors
+
+
+class KeywordRouter:
+    """规则表顺序即优先级；route(name) 返回目标文件夹列表（未命中为空列表）"""
+
+    def __init__(self, rules, match_mode="priority", case_sensitive=True):
+        if match_mode not in MATCH_MODES:
+            raise ValueError(f"未知的匹配模式: {match_mode}")
+        self.match_mode = match_mode
+        self.rules = list(rules)
+        self.automaton = KeywordAutomaton([keyword for keyword, _ in self.rules], case_sensitive)
+
+    def route(self, name):
+        matches = self.automaton.iter_matches(name)
+        if self.match_mode == "first_match":
+            best = min(matches, default=None)
+            return [self.rules[best[1]][1]] if best else []
+        if self.match_mode == "priority":
+            best = min((index for _, index in matches), default=None)
+            return [self.rules[best][1]] if best is not None else []
+        # all_matches：按规则表顺序去重
+        hit = sorted({index for _, index in matches})
+        folders = []
+        for index in hit:
+            folder = self.rules[index][1]
+            if folder not in folders:
+                folders.append(folder)
+        return folders
+
+
+# 规则表中的后缀范围："all" 或 ".jpg" 这样的扩展名
+_EXT_TOKEN = re.compile(r"^(all|\.[\w]+)$", re.IGNORECASE)
+# 正则开头的全局内联标志，如 (?i)；合并成交替分支后必须改写成作用域标志 (?i:...)
+_GLOBAL_FLAGS = re.compile(r"^\(\?([aiLmsux]+)\)")
+
+
+_OCTAL = "01234567"
+
+
+def _namespace_groups(source, index):
+    """
+    合并前把规则内的分组全部改写成带规则前缀的命名分组：不同规则可能使用同名分组，
+    而合并后分组编号会整体后移，\\1 这样的数字反向引用与 (?(1)...) 条件都会指错分组
+    - (?P<name>  → (?P<_r{index}_name>      无名分组 ( → (?P<_r{index}_{编号}>
+    - (?P=name) / \\N                      → (?P=_r{index}_…)
+    - (?(name) / (?(N)                      → (?(_r{index}_…)
+    字符集 [...] 与转义字符原样保留；替换展开仍使用规则自身的正则，编号与单独使用时一致
+    """
+    prefix = f"_r{index}_"
+    names = {}  # 分组编号 → 改写后的名字
+    out = []
+    i, n = 0, len(source)
+
+    def target(ref):
+        if ref.isdigit():
+            if int(ref) not in names:
+                raise re.error(f"引用了不存在的分组 {ref}")
+            return names[int(ref)]
+        return prefix + ref
+
+    while i < n:
+        ch = source[i]
+        if ch == "\\":
+            nxt = source[i + 1:i + 2]
+            if nxt.isdigit() and nxt != "0":
+                # 与 sre_parse 一致：三位八进制数字是字符转义，否则为一到两位的分组编号
+                octal = source[i + 1:i + 4]
+                if len(octal) == 3 and all(c in _OCTAL for c in octal):
+                    out.append(source[i:i + 4])
+                    i += 4
+                    continue
+                digits = source[i + 1:i + 3] if source[i + 2:i + 3].isdigit() else nxt
+                out.append(f"(?P={target(digits)})")
+                i += 1 + len(digits)
+                continue
+            out.append(source[i:i + 2])
+            i += 2
+        elif ch == "[":
+            # 字符集：开头的 ^ 与紧跟的 ] 属于字符集内容
+            j = i + 1
+            if source[j:j + 1] == "^":
+                j += 1
+            if source[j:j + 1] == "]":
+                j += 1
+            while j < n and source[j] != "]":
+                j += 2 if source[j] == "\\" else 1
+            out.append(source[i:j + 1])
+            i = j + 1
+        elif ch == "(":
+            if source.startswith("(?P<", i):
+                end = source.index(">", i)
+                name = source[i + 4:end]
+                names[len(names) + 1] = prefix + name
+                out.append(f"(?P<{prefix}{name}>")
+                i = end + 1
+            elif source.startswith("(?P=", i):
+                end = source.index(")", i)
+                out.append(f"(?P={target(source[i + 4:end])})")
+                i = end + 1
+            elif source.startswith("(?(", i):
+                end = source.index(")", i + 3)
+                out.append(f"(?({target(source[i + 3:end])})")
+                i = end + 1
+            elif source.startswith("(?", i):
+                out.append("(?")
+                i += 2
+            else:
+                names[len(names) + 1] = f"{prefix}{len(names) + 1}"
+                out.append(f"(?P<{names[len(names)]}>")
+                i += 1
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
+
+
+class ReplaceRule:
+    """一条替换规则；ext 为小写扩展名或 "all" """
+
+    def __init__(self, find, replace, ext="all", is_regex=False):
+        self.find = find
+        self.replace = replace
+        self.ext = ext.lower()
+        self.is_regex = is_regex
+        if is_regex:
+            self.regex = re.compile(find)
+            flags = _GLOBAL_FLAGS.match(find)
+            self.source = f"(?{flags.group(1)}:{find[flags.end():]})" if flags else find
+        else:
+            self.regex = None
+            self.source = re.escape(find)
+
+    def applies_to(self, ext):
+        return self.ext == "all" or self.ext == ext
+
+    def branch(self, index):
+        """合并正则中的一个分支：外层包裹分组 _r{index} 用于识别命中的规则"""
+        source = _namespace_groups(self.source, index)
+        branch = f"(?P<_r{index}>{source})"
+        if self.is_regex and re.compile(branch).groups != self.regex.groups + 1:
+            # 例如 (?x) 注释中的括号；无法可靠改写的正则直接拒绝，而不是合并出错误的模式
+            raise re.error("无法改写分组，该正则不能与其他规则合并")
+        return branch
+
+
+def parse_replace_rules(text):
+    """
+    解析替换规则表，每行一条：查找 -> 替换 | 后缀
+    - 查找以 re: 开头时按正则处理，替换中可用 \\1 / \\g<name> 引用分组
+    - “| 后缀”可省略（默认 all）；替换留空表示删除
+    - 空行与 # 开头的行忽略
+    返回 ([ReplaceRule], [错误说明])
+    """
+    rules = []
+    errors = []
+    for line_no, raw in enumerate(text.splitlines(), 1):
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "->" not in line:
+            errors.append(f"第 {line_no} 行缺少 '->': {line}")
+            continue
+        find, rest = line.split("->", 1)
+        find = find.strip()
+        ext = "all"
+        if "|" in rest:
+            head, tail = rest.rsplit("|", 1)
+            if _EXT_TOKEN.match(tail.strip()):
+                rest, ext = head, tail.strip()
+        replace = rest.strip()
+        is_regex = find.startswith("re:")
+        if is_regex:
+            find = find[3:].strip()
+        if not find:
+            errors.append(f"第 {line_no} 行查找内容为空: {line}")
+            continue
+        try:
+            rule = ReplaceRule(find, replace, ext, is_regex)
+            # 按合并后的形式编译一次，改写或编译错误在这里对应到规则所在的行
+            re.compile(rule.branch(len(rules)))
+            rules.append(rule)
+        except re.error as e:
+            errors.append(f"第 {line_no} 行正则无效: {e}")
+    return rules, errors
+
+
+class ReplaceRuleSet:
+    """
+    同时生效的一组替换规则：每个位置按规则表顺序尝试，命中即替换并跳过被替换的部分，
+    替换结果不会再被其他规则匹配（与逐条 str.replace 的级联效果不同）
+    合并正则在构造时按后缀一次编译好：每个指定的后缀一个，其余后缀共用只含 all 规则的一个
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._scope_all = any(rule.ext == "all" for rule in self.rules)
+        self._scope = {rule.ext for rule in self.rules if rule.ext != "all"}
+        branches = [rule.branch(index) for index, rule in enumerate(self.rules)]
+        self._compiled = {}
+        for ext in list(self._scope) + [None]:
+            selected = [branch for branch, rule in zip(branches, self.rules)
+                        if rule.ext == "all" or rule.ext == ext]
+            self._compiled[ext] = re.compile("|".join(selected)) if selected else None
+
+    def in_scope(self, ext):
+        """是否有规则覆盖该后缀（严格过滤模式用）"""
+        return self._scope_all or ext in self._scope
+
+    def _combined(self, ext):
+        return self._compiled[ext if ext in self._scope else None]
+
+    def _replace_match(self, match):
+        # 包裹分组最后闭合，lastgroup 即命中规则
+        rule = self.rules[int(match.lastgroup[2:])]
+        if not rule.is_regex:
+            return rule.replace
+        # 在同一位置用规则自身的正则重新匹配，分组编号/命名与单独使用时一致
+        return rule.regex.match(match.string, match.start()).expand(rule.replace)
+
+    def apply(self, name, ext):
+        """返回 (新文件名, 命中次数)"""
+        combined = self._combined(ext)
+        if combined is None:
+            return name, 0
+        return combined.subn(self._replace_match, name)
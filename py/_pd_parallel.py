@@ -0,0 +1,225 @@
+"""
+PD 并行执行工具
+供批量文件节点共用（文件名以 _ 开头，不会被当作节点模块加载）
+
+- map_ordered：有界线程池，在途任务数受限，结果按输入顺序产出，报告顺序与串行版本一致
+- map_processes：CPU 密集任务用进程池，语义同 map_ordered；进程池不可用时自动退回线程池
+  子进程一律以 spawn 方式启动（ComfyUI 进程多线程且已加载 torch/CUDA，fork 出的子进程可能死锁），
+  任务函数放在 _pd_tasks 中，子进程只导入该模块，不会执行节点包的 __init__
+- with_retry：对网络盘/NAS 上的瞬时 I/O 错误做有限次退避重试
+- copy_files：基于 materialize 的并行复制流水线，带 ComfyUI 进度条
+"""
+
+import os
+import sys
+import time
+import errno
+import pickle
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from ._pd_fileio import materialize
+
+# 重试无意义的错误：源不存在、目标已存在、权限不足、路径类型错误
+_PERMANENT_ERRORS = (FileNotFoundError, FileExistsError, PermissionError, IsADirectoryError, NotADirectoryError)
+_PERMANENT_ERRNOS = {errno.ENOSPC, errno.EROFS, errno.ENAMETOOLONG}
+
+
+def resolve_workers(workers, io_bound=True):
+    """workers <= 0 时自动选择：I/O 密集任务与 ThreadPoolExecutor 默认值一致，计算密集任务取 CPU 核数"""
+    if workers > 0:
+        return workers
+    cpu = os.cpu_count() or 4
+    return min(32, cpu + 4) if io_bound else cpu
+
+
+def map_ordered(func, items, workers=0, on_progress=None):
+    """
+    并行执行 func(item)，按输入顺序逐个产出 (item, result, error)
+
+    同时在途的任务不超过 workers * 2 个，十万级文件也不会一次性提交全部 future；
+    on_progress(done, total) 在每个结果产出时于调用方线程中回调
+    """
+    items = list(items)
+    total = len(items)
+    workers = min(resolve_workers(workers), max(total, 1))
+
+    if workers == 1:
+        for done, item in enumerate(items, 1):
+            try:
+                result, error = func(item), None
+            except Exception as e:
+                result, error = None, e
+            if on_progress:
+                on_progress(done, total)
+            yield item, result, error
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        source = iter(items)
+
+        def submit_next():
+            for item in source:
+                pending.append((item, pool.submit(func, item)))
+                return
+
+        for _ in range(workers * 2):
+            submit_next()
+
+        done = 0
+        while pending:
+            item, future = pending.popleft()
+            try:
+                result, error = future.result(), None
+            except Exception as e:
+                result, error = None, e
+            submit_next()
+            done += 1
+            if on_progress:
+                on_progress(done, total)
+            yield item, result, error
+
+
+# spawn 子进程的初始化代码（以 exec 作为 initializer，本身无需可导入）：
+# 为任务函数所在模块的各级父包登记只带 __path__ 的空模块，之后按包内路径导入任务模块时
+# 不会执行节点包的 __init__；ComfyUI 以目录名加载自定义节点，包本身也不在子进程的 sys.path 中
+_SPAWN_BOOTSTRAP = """
+import sys, types
+for name, path in packages:
+    if name not in sys.modules:
+        module = types.ModuleType(name)
+        module.__path__ = path
+        sys.modules[name] = module
+"""
+
+
+def _parent_packages(func):
+    """func 所在模块的各级父包 [(包名, __path__)]，由外到内"""
+    parts = func.__module__.split(".")[:-1]
+    packages = []
+    for i in range(1, len(parts) + 1):
+        name = ".".join(parts[:i])
+        module = sys.modules.get(name)
+        if module is None or not hasattr(module, "__path__"):
+            break
+        packages.append((name, list(module.__path__)))
+    return packages
+
+
+def map_processes(func, items, workers=0, on_progress=None):
+    """
+    进程池版 map_ordered：func 与 items 必须可 pickle，func 需定义在 _pd_tasks 这类不依赖 ComfyUI 的模块顶层
+
+    子进程以 spawn 方式启动，不继承 ComfyUI 进程的线程、锁与 CUDA 状态；
+    子进程无法启动、或无法导入 func 所在模块时，从第一个未完成的任务起改用线程池继续；
+    Pillow 的解码/缩放会释放 GIL，线程池同样能利用多核
+    """
+    items = list(items)
+    total = len(items)
+    workers = min(resolve_workers(workers, io_bound=False), max(total, 1))
+    if workers == 1:
+        yield from map_ordered(func, items, 1, on_progress)
+        return
+
+    done = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=exec,
+                                 initargs=(_SPAWN_BOOTSTRAP, {"packages": _parent_packages(func)})) as pool:
+            pending = deque()
+            source = iter(items)
+
+            def submit_next():
+                for item in source:
+                    pending.append((item, pool.submit(func, item)))
+                    return
+
+            for _ in range(workers * 2):
+                submit_next()
+
+            while pending:
+                item, future = pending[0]
+                try:
+                    result, error = future.result(), None
+                except (BrokenProcessPool, pickle.PicklingError):
+                    raise
+                except Exception as e:
+                    result, error = None, e
+                pending.popleft()
+                submit_next()
+                done += 1
+                if on_progress:
+                    on_progress(done, total)
+                yield item, result, error
+    except (BrokenProcessPool, pickle.PicklingError, OSError) as e:
+        print(f"进程池不可用，改用线程池继续: {e}")
+        remaining = items[done:]
+        offset = done
+        for item, result, error in map_ordered(func, remaining, workers,
+                                               (lambda d, t: on_progress(offset + d, total)) if on_progress else None):
+            yield item, result, error
+
+
+def is_transient(error):
+    """是否值得重试：排除确定性的失败"""
+    if isinstance(error, _PERMANENT_ERRORS):
+        return False
+    if isinstance(error, OSError):
+        return error.errno not in _PERMANENT_ERRNOS
+    return False
+
+
+def with_retry(func, retries=2, delay=0.2, cleanup=None):
+    """
+    包装 func：瞬时 I/O 错误时最多重试 retries 次，间隔按 delay 指数退避
+    cleanup(*args) 在每次重试前调用，用于清理上一次留下的半成品
+    返回 (result, attempts)
+    """
+    def wrapper(*args):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return func(*args), attempt
+            except Exception as e:
+                if attempt > retries or not is_transient(e):
+                    raise
+                if cleanup:
+                    cleanup(*args)
+                time.sleep(delay * (2 ** (attempt - 1)))
+    return wrapper
+
+
+def _remove_partial(src, dst, mode):
+    try:
+        os.remove(dst)
+    except OSError:
+        pass
+
+
+def copy_files(jobs, transfer_mode="copy", workers=0, retries=2):
+    """
+    并行复制 jobs = [(src, dst), ...]，dst 须事先规划好且互不相同
+
+    返回与 jobs 顺序一致的列表 [(strategy, attempts, error)]：
+    成功时 strategy 为 materialize 使用的方式、attempts 为尝试次数；失败时 strategy 为 None
+    """
+    # 子进程反序列化 CaptionPipeline 时会经 _pd_caption 导入本模块，comfy 只在主进程用到时导入
+    import comfy.utils
+
+    jobs = list(jobs)
+    pbar = comfy.utils.ProgressBar(len(jobs)) if jobs else None
+    copy_one = with_retry(materialize, retries=retries, cleanup=_remove_partial)
+
+    results = []
+    for _, outcome, error in map_ordered(lambda job: copy_one(job[0], job[1], transfer_mode), jobs, workers,
+                                         on_progress=lambda done, total: pbar.update(1)):
+        if error is None:
+            strategy, attempts = outcome
+            results.append((strategy, attempts, None))
+        else:
+            results.append((None, 0, error))
+    return results
@@ -0,0 +1,229 @@
+"""
+PD 批量重命名引擎
+供各重命名节点共用（文件名以 _ 开头，不会被当作节点模块加载）
+
+- 基于一次目录列举生成完整计划，不再逐个文件 exists() 探测
+- 检测冲突：多个文件映射到同一目标、目标被不参与重命名的文件占用（冲突会级联传播）
+- 链式重命名（A→B, B→C）按依赖顺序直接执行；交换/循环（A→B, B→A）通过临时名两阶段完成
+- 执行前写入日志文件，失败时按日志回滚；进程中断留下的日志会在下次运行时自动回滚
+- 支持 dry_run：只生成计划，不改动文件
+"""
+
+import os
+import json
+import uuid
+
+from ._pd_fileio import AtomicWriter
+
+JOURNAL_NAME = ".pd_rename_journal.json"
+TEMP_PREFIX = ".pdrn_"
+
+
+def _key(name):
+    """比较用的文件名键；Windows 下不区分大小写"""
+    return os.path.normcase(name)
+
+
+def recover_journal(directory):
+    """
+    回滚上次中断的重命名：逆序检查日志中的每一步，目标存在且源不存在时改回
+    返回回滚的步数
+    """
+    journal_path = os.path.join(directory, JOURNAL_NAME)
+    if not os.path.exists(journal_path):
+        return 0
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        steps = json.load(f).get("steps", [])
+
+    reverted = 0
+    for src, dst in reversed(steps):
+        src_path = os.path.join(directory, src)
+        dst_path = os.path.join(directory, dst)
+        if os.path.exists(dst_path) and not os.path.exists(src_path):
+            os.rename(dst_path, src_path)
+            reverted += 1
+    os.remove(journal_path)
+    return reverted
+
+
+class RenameResult:
+    """执行结果：renamed/conflicts/unchanged 均按 add() 的顺序排列"""
+
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.renamed = []      # [(src, dst)]
+        self.conflicts = []    # [(src, dst, reason)]
+        self.unchanged = []    # [src]
+        self.steps = []        # [(from, to)] 实际执行（或将要执行）的 rename 调用
+        self.cycles = 0
+        self.recovered = 0
+        self.error = None
+
+    def summary(self):
+        mode = "预览 (dry run)" if self.dry_run else "已执行"
+        text = (f"{mode}: 重命名 {len(self.renamed)} 个, 冲突 {len(self.conflicts)} 个, "
+                f"无需改动 {len(self.unchanged)} 个, 循环 {self.cycles} 组, rename 调用 {len(self.steps)} 次")
+        if self.recovered:
+            text += f", 已回滚上次中断的 {self.recovered} 步"
+        if self.error:
+            text += f"\n执行失败并已回滚: {self.error}"
+        return text
+
+
+class RenamePlan:
+    """
+    单个目录内的批量重命名计划
+
+        plan = RenamePlan(folder)
+        for entry in plan.entries: ...      # os.DirEntry，is_file() 等使用列举时缓存的类型
+        plan.add("T_1.jpg", "1_T.jpg")
+        result = plan.execute(dry_run=False)
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        # 先回滚上次中断的批次，再列举目录
+        self.recovered = recover_journal(directory)
+        with os.scandir(directory) as it:
+            self.entries = list(it)
+        # 目录中已有的名字（含子目录，同样会占用目标名）
+        self._existing = {_key(e.name): e.name for e in self.entries}
+        self._entries = []
+
+    def add(self, src, dst):
+        self._entries.append((src, dst))
+
+    def exists(self, name):
+        """基于列举结果判断名字是否被占用，不访问磁盘"""
+        return _key(name) in self._existing
+
+    def _resolve(self, result):
+        """筛选可执行的条目，返回 {src_key: (src, dst)}"""
+        accepted = {}
+        rejected = {}
+        target_owner = {}
+
+        for src, dst in self._entries:
+            if src == dst:
+                result.unchanged.append(src)
+                continue
+            src_key, dst_key = _key(src), _key(dst)
+            if src_key not in self._existing:
+                result.conflicts.append((src, dst, "源文件不存在"))
+            elif src_key in accepted:
+                result.conflicts.append((src, dst, "源文件重复"))
+            elif dst_key in target_owner:
+                result.conflicts.append((src, dst, f"与 {target_owner[dst_key]} 的目标重名"))
+            else:
+                accepted[src_key] = (src, dst)
+                target_owner[dst_key] = src
+
+        # 目标被占用且占用者不会移走：冲突；被拒绝的条目源文件留在原地，可能继续阻塞其他条目
+        waiting_on = {}
+        queue = []
+        for src_key, (src, dst) in accepted.items():
+            dst_key = _key(dst)
+            if dst_key == src_key or dst_key not in self._existing:
+                continue
+            if dst_key in accepted:
+                waiting_on[dst_key] = src_key
+            else:
+                queue.append((src_key, "目标文件已存在"))
+
+        while queue:
+            src_key, reason = queue.pop()
+            if src_key in rejected:
+                continue
+            rejected[src_key] = reason
+            if src_key in waiting_on:
+                queue.append((waiting_on[src_key], f"目标被保留的 {accepted[src_key][0]} 占用"))
+
+        for src_key, reason in rejected.items():
+            src, dst = accepted.pop(src_key)
+            result.conflicts.append((src, dst, reason))
+        return accepted
+
+    def _order(self, accepted, result):
+        """
+        生成 rename 步骤：目标空闲的条目先执行，随后释放出的名字依次被等待者使用
+        剩余的条目都处于循环中，每个循环借助一个临时名打断
+        """
+        # waiter[k]：目标是 k（某个待移走的源）的条目
+        waiter = {}
+        ready = []
+        for src_key, (src, dst) in accepted.items():
+            dst_key = _key(dst)
+            if dst_key in accepted:
+                waiter[dst_key] = src_key
+            else:
+                ready.append(src_key)
+
+        steps = []
+        done = set()
+
+        def follow(src_key):
+            while src_key is not None and src_key not in done:
+                src, dst = accepted[src_key]
+                steps.append((src, dst))
+                done.add(src_key)
+                src_key = waiter.get(src_key)
+
+        for src_key in ready:
+            follow(src_key)
+
+        for src_key in accepted:
+            if src_key in done:
+                continue
+            # 循环：start 先移到临时名，沿等待链依次移动，最后临时名移到 start 的目标
+            result.cycles += 1
+            start_src, start_dst = accepted[src_key]
+            temp = self._temp_name()
+            steps.append((start_src, temp))
+            done.add(src_key)
+            current = waiter.get(src_key)
+            while current is not None and current not in done:
+                src, dst = accepted[current]
+                steps.append((src, dst))
+                done.add(current)
+                current = waiter.get(current)
+            steps.append((temp, start_dst))
+        return steps
+
+    def _temp_name(self):
+        while True:
+            name = f"{TEMP_PREFIX}{uuid.uuid4().hex[:12]}"
+            if _key(name) not in self._existing:
+                self._existing[_key(name)] = name
+                return name
+
+    def execute(self, dry_run=False):
+        result = RenameResult(dry_run)
+        result.recovered = self.recovered
+        accepted = self._resolve(result)
+        result.steps = self._order(accepted, result)
+
+        # renamed / conflicts 按 add() 顺序输出
+        order = {}
+        for i, (src, _) in enumerate(self._entries):
+            order.setdefault(_key(src), i)
+        result.renamed = sorted(accepted.values(), key=lambda item: order[_key(item[0])])
+        result.conflicts.sort(key=lambda item: order[_key(item[0])])
+        if dry_run or not result.steps:
+            return result
+
+        journal_path = os.path.join(self.directory, JOURNAL_NAME)
+        AtomicWriter().write_text(journal_path, json.dumps({"steps": result.steps}, ensure_ascii=False))
+
+        done = []
+        try:
+            for src, dst in result.steps:
+                os.rename(os.path.join(self.directory, src), os.path.join(self.directory, dst))
+                done.append((src, dst))
+        except Exception as e:
+            for src, dst in reversed(done):
+                os.rename(os.path.join(self.directory, dst), os.path.join(self.directory, src))
+            result.error = str(e)
+            result.conflicts.extend((src, dst, "已回滚") for src, dst in result.renamed)
+            result.renamed = []
+        os.remove(journal_path)
+        return result
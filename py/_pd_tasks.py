@@ -0,0 +1,230 @@
+"""
+PD 进程池任务函数
+供 map_processes 调用的各节点 CPU 密集任务（文件名以 _ 开头，不会被当作节点模块加载）
+
+子进程以 spawn 方式启动，只导入本模块：这里只依赖标准库、PIL 与同样不依赖 ComfyUI 的 _pd_* 模块，
+不导入 comfy / folder_paths / torch，也不会执行节点包的 __init__（那会加载全部节点）；
+任务参数与返回值都必须可 pickle，写盘统一由主进程完成
+
+- convert_image：PD_number_star 的缩放/格式转换
+- transcode_image：PD_rename_image 的缩放/重新编码
+- compose_image / fan_out_image：PD_ImageSize34Compose / PD_ImageMultiCompose 的缩放裁剪
+- remove_words_batch / caption_batch：PD_RemoveColorWords / PD_CaptionTags 的成批标注处理
+- group_workflow / edit_workflow：PDJSON_Group / PDJSON_EditScript 的工作流修改
+"""
+
+import os
+import re
+import json
+
+from PIL import Image
+
+from ._pd_image import (open_for_size, open_for_crop, resize_crop, flatten_on_white, encode_image, fit_within,
+                        ratio_crop_plan, ReducePyramid)
+
+
+def convert_image(task):
+    """
+    按最长边缩放并转换格式，返回编码后的字节串
+
+    Args:
+        task (tuple): (文件路径, 目标格式 jpg/png/其他 = 保持原格式, 最长边尺寸)
+    """
+    path, format_convert, max_size = task
+    # JPEG 按不小于目标尺寸的最近比例（1/2、1/4、1/8）直接缩小解码，再用 LANCZOS 精确缩放
+    img, target_size = open_for_size(path, max_size)
+    with img:
+        # 转换为RGB模式（适用于JPG），透明部分填白
+        if format_convert == "jpg":
+            img = flatten_on_white(img)
+        if target_size and img.size != target_size:
+            img = img.resize(target_size, Image.Resampling.LANCZOS)
+
+        if format_convert == "jpg":
+            return encode_image(img, 'JPEG', quality=95, optimize=True)
+        if format_convert == "png":
+            return encode_image(img, 'PNG', optimize=True)
+        # 保持原格式但调整尺寸
+        format = Image.registered_extensions().get(os.path.splitext(path)[1].lower())
+        return encode_image(img, format, optimize=True)
+
+
+def transcode_image(task):
+    """
+    按最长边缩放并编码为目标格式，返回字节串
+
+    Args:
+        task (tuple): (文件路径, 最长边尺寸, 输出格式 JPG/PNG)
+    """
+    path, max_size, output_format = task
+    img, target_size = open_for_size(path, max_size)
+    with img:
+        # 转换为RGB模式（对于JPG格式），透明部分填白
+        if output_format == "JPG":
+            img = flatten_on_white(img)
+        elif img.mode not in ("RGBA", "RGB", "L"):
+            img = img.convert("RGBA")
+        # 调整图片尺寸
+        if target_size and img.size != target_size:
+            img = img.resize(target_size, Image.Resampling.LANCZOS)
+        if output_format == "JPG":
+            return encode_image(img, "JPEG", quality=95, optimize=True)
+        return encode_image(img, "PNG", optimize=True)
+
+
+def compose_image(task):
+    """
+    缩放最长边并居中裁剪，返回 (编码后的字节串, 输出尺寸)
+
+    Args:
+        task (tuple): (文件路径, 最长边尺寸, (宽, 高) 比例, 输出格式)
+    """
+    path, longer_size, aspect_ratio, format = task
+    # JPEG 按不小于目标尺寸的最近比例直接缩小解码，裁剪框随之换算
+    img, output_size, source_box, _ = open_for_crop(path, longer_size, aspect_ratio)
+    with img:
+        # 透明部分填白，其余模式转换为RGB
+        img = flatten_on_white(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        # 裁剪框换算到原图坐标，一次重采样完成缩放与裁剪
+        img = resize_crop(img, output_size, source_box, Image.Resampling.LANCZOS)
+        return encode_image(img, format, quality=95), img.size
+
+
+def fan_out_image(task):
+    """
+    一次解码生成全部目标，返回 [(编码后的字节串, 扩展名, 输出尺寸)]，顺序与 targets 一致
+
+    Args:
+        task (tuple): (文件路径, [(宽, 高, 最长边, (PIL 格式, 扩展名))], 质量)；PIL 格式为 None 时保持源文件格式
+    """
+    path, targets, quality = task
+    img = Image.open(path)
+    with img:
+        size = img.size
+        source_format = img.format
+        plans = [ratio_crop_plan(size, longer_size, (width, height)) for width, height, longer_size, _ in targets]
+        # 按最大的目标降采样解码，所有目标都不低于输出分辨率
+        draft_size = fit_within(size, max(target[2] for target in targets))
+        if draft_size and img.format == "JPEG":
+            img.draft(img.mode, draft_size)
+        img.load()
+        img = flatten_on_white(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        pyramid = ReducePyramid(img, size)
+
+        results = []
+        for (_, _, _, (pil_format, ext)), (output_size, source_box, _) in zip(targets, plans):
+            output = pyramid.resize_crop(output_size, source_box, Image.Resampling.LANCZOS)
+            if pil_format is None:
+                pil_format, ext = source_format, os.path.splitext(path)[1]
+            if pil_format in ("JPEG", "WEBP"):
+                data = encode_image(output, pil_format, quality=quality)
+            else:
+                data = encode_image(output, pil_format)
+            results.append((data, ext, output.size))
+        return results
+
+
+def remove_words_batch(task):
+    """
+    处理一批标注文件：读取、删除/添加单词
+    返回 [(路径, 新内容或 None（无变化）, 错误信息或 None)]，由主进程只写回有变化的文件
+    """
+    paths, pattern, words_to_add = task
+    regex = re.compile(pattern, re.IGNORECASE) if pattern else None
+    results = []
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            new_content = content
+            if regex:
+                new_content = regex.sub('', new_content)
+            if words_to_add:
+                new_content = words_to_add + " " + new_content.lstrip()
+            results.append((path, new_content if new_content != content else None, None))
+        except Exception as e:
+            results.append((path, None, str(e)))
+    return results
+
+
+def caption_batch(task):
+    """按标签流水线（_pd_caption.CaptionPipeline）处理一批标注文件，返回格式同 remove_words_batch"""
+    paths, pipeline = task
+    results = []
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            results.append((path, pipeline.apply(content), None))
+        except Exception as e:
+            results.append((path, None, str(e)))
+    return results
+
+
+def _dump_json(data, style):
+    """序列化为写盘字节；换行按 write_text 的方式转换为系统换行，与之前写出的文件逐字节一致"""
+    if style == "compact":
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    else:
+        text = json.dumps(data, ensure_ascii=False, indent=4)
+    return text.replace("\n", os.linesep).encode("utf-8")
+
+
+def _same_bytes(path, data):
+    """目标文件内容是否与 data 完全相同（先比大小，不同则不必读取）"""
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+        with open(path, 'rb') as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+
+def group_workflow(job):
+    """
+    处理一个工作流文件：修改组颜色/字体大小并序列化
+    返回 (修改项数, 待写入字节)；未修改或与目标文件字节相同时字节为 None
+    """
+    input_path, output_path, target_color, modify_size, font_size, target_title, style = job
+    with open(input_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    changes = 0
+    for group in data.get("groups", []):
+        # 修改颜色
+        if target_color is not None:
+            group["color"] = target_color
+            changes += 1
+
+        # 修改字体大小
+        if modify_size == "enable":
+            should_modify = not target_title or group.get("title") == target_title
+            if should_modify and "font_size" in group:
+                group["font_size"] = font_size
+                changes += 1
+
+    if not changes:
+        return 0, None
+    payload = _dump_json(data, style)
+    if _same_bytes(output_path, payload):
+        return changes, None
+    return changes, payload
+
+
+def edit_workflow(job):
+    """对一个工作流文件执行编辑脚本（_pd_jsonedit.EditScript），返回 (修改次数, 待写入字节)，含义同 group_workflow"""
+    input_path, output_path, script, style = job
+    with open(input_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    changes = script.apply(data)
+    if not changes:
+        return 0, None
+    payload = _dump_json(data, style)
+    if _same_bytes(output_path, payload):
+        return changes, None
+    return changes, payload
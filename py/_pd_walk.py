@@ -0,0 +1,182 @@
+"""
+PD 目录遍历
+供按文件夹批量处理的节点共用（文件名以 _ 开头，不会被当作节点模块加载）
+
+- walk_files：基于 os.scandir 的遍历，产出 FileEntry；stat 信息取自 DirEntry（Windows 上免费），按需获取且只取一次
+    extensions  只保留这些扩展名（小写，带点）
+    max_depth   0 只列根目录，None 不限深度
+    include     文件名 glob 列表，任一命中才保留；含 / 的模式匹配相对路径
+    exclude     文件名 glob 列表，命中即排除；同时用于剪掉不需要进入的子目录
+    symlinks    follow 跟随文件与目录链接（防环）；files 只跟随文件链接（os.walk 默认行为）；skip 全部忽略
+- list_files：同上但返回列表，可选按根目录缓存列举结果，以目录 mtime 判断是否失效
+- 本包写入过程中的临时文件、重命名日志始终跳过
+"""
+
+import os
+import fnmatch
+import threading
+
+from ._pd_fileio import is_temp_name
+from ._pd_rename import JOURNAL_NAME, TEMP_PREFIX
+
+IMAGE_EXTS = frozenset({'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.tif', '.webp'})
+TEXT_EXTS = frozenset({'.txt'})
+JSON_EXTS = frozenset({'.json'})
+EXCEL_EXTS = frozenset({'.xlsx', '.xlsm'})
+
+SYMLINK_POLICIES = ["files", "follow", "skip"]
+
+# 缓存的根目录数量上限，超出时丢弃最早的
+_CACHE_LIMIT = 32
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _is_internal(name):
+    return is_temp_name(name) or name.startswith(TEMP_PREFIX) or name == JOURNAL_NAME
+
+
+class FileEntry:
+    """一个文件：path 为完整路径，rel_path 为相对根目录的路径（/ 分隔），depth 为所在层级"""
+
+    __slots__ = ("path", "name", "rel_path", "depth", "is_symlink", "_dirent", "_stat")
+
+    def __init__(self, path, name, rel_path, depth, is_symlink, dirent=None):
+        self.path = path
+        self.name = name
+        self.rel_path = rel_path
+        self.depth = depth
+        self.is_symlink = is_symlink
+        self._dirent = dirent
+        self._stat = None
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return f"FileEntry({self.rel_path!r})"
+
+    @property
+    def ext(self):
+        return os.path.splitext(self.name)[1].lower()
+
+    @property
+    def stem(self):
+        return os.path.splitext(self.name)[0]
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = self._dirent.stat() if self._dirent is not None else os.stat(self.path)
+            self._dirent = None
+        return self._stat
+
+    @property
+    def size(self):
+        return self.stat().st_size
+
+    @property
+    def mtime(self):
+        return self.stat().st_mtime
+
+
+def _matches(patterns, name, rel_path):
+    return any(fnmatch.fnmatch(rel_path if "/" in pattern else name, pattern) for pattern in patterns)
+
+
+def _scan(root, extensions, max_depth, include, exclude, symlinks, skip_hidden, dir_mtimes):
+    """深度优先遍历；同一目录内按名称排序，先产出文件再进入子目录（与 os.walk 自顶向下一致）"""
+    visited = set()
+    stack = [(root, "", 0)]
+    while stack:
+        directory, rel_dir, depth = stack.pop()
+        try:
+            # 先取 mtime 再列举：列举期间发生的改动会让下次校验失效，而不是被缓存遗漏
+            st = os.stat(directory)
+            if symlinks == "follow":
+                key = (st.st_dev, st.st_ino)
+                if key in visited:
+                    continue
+                visited.add(key)
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            print(f"无法读取目录 {directory}: {e}")
+            continue
+        if dir_mtimes is not None:
+            dir_mtimes[directory] = st.st_mtime_ns
+
+        subdirs = []
+        for entry in entries:
+            name = entry.name
+            if _is_internal(name) or (skip_hidden and name.startswith(".")):
+                continue
+            rel_path = f"{rel_dir}{name}"
+            if exclude and _matches(exclude, name, rel_path):
+                continue
+            try:
+                is_symlink = entry.is_symlink()
+                if is_symlink and symlinks == "skip":
+                    continue
+                if entry.is_dir(follow_symlinks=symlinks == "follow"):
+                    if max_depth is None or depth < max_depth:
+                        subdirs.append((entry.path, f"{rel_path}/", depth + 1))
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            if extensions is not None and os.path.splitext(name)[1].lower() not in extensions:
+                continue
+            if include and not _matches(include, name, rel_path):
+                continue
+            yield FileEntry(entry.path, name, rel_path, depth, is_symlink, entry)
+
+        stack.extend(reversed(subdirs))
+
+
+def walk_files(root, extensions=None, max_depth=0, include=(), exclude=(), symlinks="files", skip_hidden=False):
+    """逐个产出 FileEntry；root 不存在或不可读时什么也不产出"""
+    if symlinks not in SYMLINK_POLICIES:
+        raise ValueError(f"未知的符号链接策略: {symlinks}")
+    return _scan(os.fspath(root), extensions, max_depth, tuple(include), tuple(exclude),
+                 symlinks, skip_hidden, None)
+
+
+def _cache_valid(dir_mtimes):
+    try:
+        return all(os.stat(directory).st_mtime_ns == mtime for directory, mtime in dir_mtimes.items())
+    except OSError:
+        return False
+
+
+def list_files(root, extensions=None, max_depth=0, include=(), exclude=(), symlinks="files", skip_hidden=False,
+               use_cache=False):
+    """
+    返回 FileEntry 列表
+    use_cache=True 时按 (根目录, 参数) 缓存：再次调用时只 stat 遍历过的各个目录，mtime 均未变化则直接复用列举结果
+    （新增/删除/重命名都会改变所在目录的 mtime；文件内容的修改不影响列举，复用的条目会重新获取 stat）
+    """
+    root = os.fspath(root)
+    if symlinks not in SYMLINK_POLICIES:
+        raise ValueError(f"未知的符号链接策略: {symlinks}")
+    args = (extensions, max_depth, tuple(include), tuple(exclude), symlinks, skip_hidden)
+    if not use_cache:
+        return list(_scan(root, *args, None))
+
+    key = (os.path.normcase(os.path.abspath(root)),
+           frozenset(extensions) if extensions is not None else None) + args[1:]
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None and _cache_valid(cached[0]):
+        return [FileEntry(path, name, rel_path, depth, is_symlink)
+                for path, name, rel_path, depth, is_symlink in cached[1]]
+
+    dir_mtimes = {}
+    entries = list(_scan(root, *args, dir_mtimes))
+    listing = [(e.path, e.name, e.rel_path, e.depth, e.is_symlink) for e in entries]
+    with _cache_lock:
+        _cache.pop(key, None)
+        _cache[key] = (dir_mtimes, listing)
+        while len(_cache) > _CACHE_LIMIT:
+            _cache.pop(next(iter(_cache)))
+    return entries
@@ -5,6 +5,7 @@ from PIL import Image
 import io
 from pathlib import Path
 from datetime import datetime
+from ._pd_walk import EXCEL_EXTS, walk_files
 
 class PD_excel_image:
     """
@@ -79,7 +80,7 @@ class PD_excel_image:
             
             # 搜索所有Excel文件
             input_path = Path(input_directory)
-            excel_files = list(input_path.glob("*.xlsx")) + list(input_path.glob("*.xlsm"))
+            excel_files = [Path(entry.path) for entry in walk_files(input_path, EXCEL_EXTS, skip_hidden=True)]
             
             if not excel_files:
                 no_files_msg = f"ℹ️  在目录中没有找到Excel文件: {input_directory}\n📁 输出目录: {output_directory}"
@@ -1,6 +1,16 @@
 import os
+import uuid
 import comfy.utils
-from PIL import Image
+from ._pd_fileio import AtomicWriter, FSYNC_POLICIES
+from ._pd_rename import RenamePlan, TEMP_PREFIX
+from ._pd_parallel import map_processes
+from ._pd_tasks import convert_image
+
+
+def _temp_name():
+    """同目录内的临时名；TEMP_PREFIX 开头的文件会被目录遍历跳过"""
+    return f"{TEMP_PREFIX}{uuid.uuid4().hex[:12]}"
+
 
 class PD_number_star:
     """
@@ -21,6 +31,11 @@ class PD_number_star:
                 "padding": ("INT", {"default": 1, "min": 0, "max": 9, "step": 1}),  # 数字填充位数
                 "format_convert": (["NONE", "jpg", "png", "txt"], {"default": "不修改"}),  # 格式转换
                 "max_size": ("INT", {"default": 1024, "min": 64, "max": 4096, "step": 64}),  # 图片最长边
+            },
+            "optional": {
+                "fsync_policy": (FSYNC_POLICIES, {"default": "never"}),  # 落盘策略：耐久性 vs 吞吐
+                "dry_run": ("BOOLEAN", {"default": False}),  # 只预览重命名计划，不改动文件
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),  # 图片处理进程数，0 = CPU 核数
             }
         }
     
@@ -29,7 +44,8 @@ class PD_number_star:
     FUNCTION = "rename_files"
     CATEGORY = "ZHO Tools"
 
-    def rename_files(self, folder_path, new_name="", prefix="", delimiter="_", number_start=False, padding=1, format_convert="不修改", max_size=1024):
+    def rename_files(self, folder_path, new_name="", prefix="", delimiter="_", number_start=False, padding=1, format_convert="不修改", max_size=1024,
+                     fsync_policy="never", dry_run=False, workers=0):
         """
         重命名文件夹中的文件
         
@@ -42,6 +58,9 @@ class PD_number_star:
             padding (int): 数字填充位数
             format_convert (str): 格式转换选项
             max_size (int): 图片最长边尺寸
+            fsync_policy (str): 转换后图片的 fsync 策略
+            dry_run (bool): 只生成重命名计划，不执行
+            workers (int): 图片处理并行进程数，0 为自动
             
         Returns:
             tuple: 包含操作结果的字符串
@@ -56,8 +75,9 @@ class PD_number_star:
             return (f"错误: 文件夹路径不存在 - {folder_path}",)
             
         try:
-            # 获取文件夹中的所有文件
-            files = [f for f in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, f))]
+            # 列举目录（同时回滚上次中断的重命名批次）
+            files = [e.name for e in RenamePlan(folder_path).entries if e.is_file()]
+            planned = []  # [(源文件名, 新文件名, 是否需要图片处理)]
             
             if not files:
                 return ("提示: 文件夹为空，没有文件需要处理",)
@@ -65,15 +85,12 @@ class PD_number_star:
             # 检查是否同时提供了新文件名和前缀
             if new_name and prefix:
                 return ("错误: 不能同时使用新文件名和前缀，请只选择其中一种方式",)
-                
+
             for index, filename in enumerate(files, 1):
-                file_path = os.path.join(folder_path, filename)
-                
                 # 分离文件名和扩展名
                 name, ext = os.path.splitext(filename)
                 
                 # 处理格式转换
-                original_ext = ext
                 if format_convert != "不修改":
                     if format_convert == "jpg":
                         ext = ".jpg"
@@ -113,36 +130,89 @@ class PD_number_star:
                     # 如果没有提供任何参数，跳过该文件
                     continue
                 
-                new_path = os.path.join(folder_path, new_name_with_ext)
-                
+                # 检查是否需要图片处理
+                is_input_image = self._is_image_file(filename)
+                needs_processing = (is_input_image and format_convert in ["jpg", "png"]) or (is_input_image and format_convert == "不修改")
+                planned.append((filename, new_name_with_ext, needs_processing and not dry_run))
+
+            # 先处理图片：结果写入同目录的临时名，源文件保持不动；处理失败的文件不参与重命名，保留原名和原格式
+            writer = AtomicWriter(fsync_policy)
+            staged = {}  # 源文件名 → (临时名, 新文件名, 源文件移走时的临时名)
+            targets = {src: dst for src, dst, process in planned if process}
+            tasks = [(os.path.join(folder_path, src), format_convert, max_size) for src in targets]
+            pbar = comfy.utils.ProgressBar(len(tasks)) if tasks else None
+            # 结果按输入顺序取回，报告顺序不变
+            for (path, _, _), data, error in map_processes(convert_image, tasks, workers,
+                                                           on_progress=lambda done, total: pbar.update(1)):
+                src = os.path.basename(path)
+                if error is None:
+                    staged_name = _temp_name()
+                    try:
+                        writer.write_bytes(os.path.join(folder_path, staged_name), data)
+                        staged[src] = (staged_name, targets[src], _temp_name())
+                        continue
+                    except Exception as e:
+                        error = e
+                result["errors"].append({"filename": src, "error": f"图片处理失败: {error}"})
+            writer.commit()
+
+            # 再整体重命名（冲突检测、链式/循环重命名、失败回滚）：处理过的图片由临时名改为新文件名，
+            # 同时把源文件移到临时名；新文件名无法使用的，连同源文件一起退出计划，源文件保持不动
+            plain = [(src, dst) for src, dst, process in planned if not process]
+            dropped = set()
+            while True:
+                plan = RenamePlan(folder_path)
+                for src, dst in plain:
+                    plan.add(src, dst)
+                for src, (staged_name, dst, trash_name) in staged.items():
+                    if src not in dropped:
+                        plan.add(staged_name, dst)
+                        plan.add(src, trash_name)
+                if dry_run:
+                    break
+                preview = plan.execute(dry_run=True)
+                conflicted = {src: (dst, reason) for src, dst, reason in preview.conflicts}
+                newly_dropped = [src for src, (staged_name, _, _) in staged.items()
+                                 if src not in dropped and (staged_name in conflicted or src in conflicted)]
+                if not newly_dropped:
+                    break
+                for src in newly_dropped:
+                    dropped.add(src)
+                    dst, reason = conflicted.get(staged[src][0], conflicted.get(src))
+                    result["errors"].append({"filename": src, "error": f"{reason} ({dst})"})
+            rename_result = plan.execute(dry_run=dry_run)
+
+            plain_names = {src for src, _ in plain}
+            for src, dst, reason in rename_result.conflicts:
+                if src in plain_names:
+                    result["errors"].append({"filename": src, "error": f"{reason} ({dst})"})
+            renamed = {src for src, _ in rename_result.renamed}
+
+            # 收尾：处理结果已就位的删除移走的源文件；未就位的（冲突或回滚）删除临时结果
+            converted = set()
+            for src, (staged_name, _, trash_name) in staged.items():
                 try:
-                    # 检查是否需要图片处理
-                    is_input_image = self._is_image_file(file_path)
-                    needs_image_processing = (is_input_image and format_convert in ["jpg", "png"]) or (is_input_image and format_convert == "不修改")
-                    
-                    if needs_image_processing:
-                        # 处理图片格式转换和尺寸调整
-                        self._process_image(file_path, new_path, format_convert, max_size, original_ext)
+                    if src not in dropped and staged_name in renamed:
+                        os.remove(os.path.join(folder_path, trash_name))
+                        converted.add(src)
                     else:
-                        # 普通文件重命名
-                        os.rename(file_path, new_path)
-                    
+                        os.remove(os.path.join(folder_path, staged_name))
+                except OSError as e:
+                    result["errors"].append({"filename": src, "error": f"清理临时文件时出错: {e}"})
+
+            for filename, new_name_with_ext, _ in planned:
+                if filename in converted or (filename in plain_names and filename in renamed):
                     result["success"].append({
                         "original": filename,
                         "new_name": new_name_with_ext
                     })
                     result["total_processed"] += 1
-                except Exception as e:
-                    result["errors"].append({
-                        "filename": filename,
-                        "error": str(e)
-                    })
-            
+
             # 构建结果信息
             success_count = len(result["success"])
             error_count = len(result["errors"])
             
-            report = f"操作完成\n成功: {success_count}\n失败: {error_count}"
+            report = f"操作完成\n成功: {success_count}\n失败: {error_count}\n{rename_result.summary()}\n{writer.stats.summary()}"
             
             if success_count > 0:
                 report += "\n\n成功重命名的文件:\n"
@@ -170,79 +240,7 @@ class PD_number_star:
         image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.webp'}
         _, ext = os.path.splitext(file_path)
         return ext.lower() in image_extensions
-    
-    def _process_image(self, input_path, output_path, format_convert, max_size, original_ext):
-        """
-        处理图片：调整尺寸和格式转换
-        
-        Args:
-            input_path (str): 输入文件路径
-            output_path (str): 输出文件路径
-            format_convert (str): 目标格式
-            max_size (int): 最长边尺寸
-            original_ext (str): 原始扩展名
-        """
-        try:
-            # 打开图片
-            with Image.open(input_path) as img:
-                # 转换为RGB模式（适用于JPG）
-                if format_convert == "jpg" and img.mode in ('RGBA', 'LA', 'P'):
-                    # 创建白色背景
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                    img = background
-                
-                # 调整图片尺寸
-                if max_size > 0:
-                    img = self._resize_image(img, max_size)
-                
-                # 保存图片
-                if format_convert == "jpg":
-                    img.save(output_path, 'JPEG', quality=95, optimize=True)
-                elif format_convert == "png":
-                    img.save(output_path, 'PNG', optimize=True)
-                else:
-                    # 保持原格式但调整尺寸
-                    img.save(output_path, optimize=True)
-            
-            # 删除原文件（如果路径不同）
-            if input_path != output_path:
-                os.remove(input_path)
-                
-        except Exception as e:
-            # 如果图片处理失败，回退到普通重命名
-            print(f"图片处理失败，回退到普通重命名: {e}")
-            os.rename(input_path, output_path)
-    
-    def _resize_image(self, img, max_size):
-        """
-        调整图片尺寸，保持宽高比
-        
-        Args:
-            img: PIL图片对象
-            max_size (int): 最长边尺寸
-            
-        Returns:
-            PIL.Image: 调整后的图片
-        """
-        width, height = img.size
-        
-        # 如果图片已经小于等于目标尺寸，不需要调整
-        if max(width, height) <= max_size:
-            return img
-        
-        # 计算缩放比例
-        if width > height:
-            new_width = max_size
-            new_height = int(height * max_size / width)
-        else:
-            new_height = max_size
-            new_width = int(width * max_size / height)
-        
-        # 使用高质量重采样
-        return img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
 
 # 在 ComfyUI 中的节点映射配置
 NODE_CLASS_MAPPINGS = {"PD_number_star": PD_number_star}
@@ -1,6 +1,7 @@
 import os
 import re
 import comfy.utils
+from ._pd_rename import RenamePlan
 
 class PD_number_start:
     """
@@ -15,6 +16,9 @@ class PD_number_start:
             "required": {
                 "folder_path": ("STRING", {"default": ""}),
                 "target_prefix": ("STRING", {"default": "T"}),  # 目标前缀，默认为T
+            },
+            "optional": {
+                "dry_run": ("BOOLEAN", {"default": False}),  # 只预览重命名计划，不改动文件
             }
         }
     
@@ -23,13 +27,14 @@ class PD_number_start:
     FUNCTION = "rename_order_files"
     CATEGORY = "ZHO Tools"
 
-    def rename_order_files(self, folder_path, target_prefix="T"):
+    def rename_order_files(self, folder_path, target_prefix="T", dry_run=False):
         """
         重命名文件，将前缀_数字格式改为数字_前缀格式
         
         Args:
             folder_path (str): 目标文件夹路径
             target_prefix (str): 目标前缀词（默认为T）
+            dry_run (bool): 只生成重命名计划，不执行
             
         Returns:
             tuple: 包含操作结果的字符串
@@ -48,8 +53,9 @@ class PD_number_start:
             return ("❌ 错误: 目标前缀不能为空",)
             
         try:
-            # 获取文件夹中的所有文件
-            all_files = [f for f in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, f))]
+            # 获取文件夹中的所有文件（一次列举，同时作为重命名计划的占用表）
+            plan = RenamePlan(folder_path)
+            all_files = [e.name for e in plan.entries if e.is_file()]
             
             if not all_files:
                 return ("⚠️ 提示: 文件夹为空，没有文件需要处理",)
@@ -80,37 +86,27 @@ class PD_number_start:
             # 按数字排序
             matched_files.sort(key=lambda x: x["number"])
             
-            # 执行重命名操作
+            # 整批规划后执行：T_1→1_T 与已存在的 1_T→... 等链式/循环重命名按依赖顺序完成
             for file_info in matched_files:
-                old_path = os.path.join(folder_path, file_info["original"])
-                new_filename = f"{file_info['number']}_{target_prefix}{file_info['extension']}"
-                new_path = os.path.join(folder_path, new_filename)
-                
-                try:
-                    # 检查目标文件是否已存在
-                    if os.path.exists(new_path):
-                        result["errors"].append({
-                            "original": file_info["original"],
-                            "new_name": new_filename,
-                            "error": "目标文件已存在"
-                        })
-                        continue
-                    
-                    # 执行重命名
-                    os.rename(old_path, new_path)
-                    
-                    result["renamed"].append({
-                        "original": file_info["original"],
-                        "new_name": new_filename,
-                        "number": file_info["number"]
-                    })
-                    
-                except Exception as e:
-                    result["errors"].append({
-                        "original": file_info["original"],
-                        "new_name": new_filename,
-                        "error": str(e)
-                    })
+                file_info["new_name"] = f"{file_info['number']}_{target_prefix}{file_info['extension']}"
+                plan.add(file_info["original"], file_info["new_name"])
+            rename_result = plan.execute(dry_run=dry_run)
+
+            numbers = {item["original"]: item["number"] for item in matched_files}
+            for original, new_filename in rename_result.renamed:
+                result["renamed"].append({
+                    "original": original,
+                    "new_name": new_filename,
+                    "number": numbers[original]
+                })
+            for original, new_filename, reason in rename_result.conflicts:
+                result["errors"].append({
+                    "original": original,
+                    "new_name": new_filename,
+                    "error": reason
+                })
+            result["plan_summary"] = rename_result.summary()
+            result["dry_run"] = dry_run
             
             # 构建结果报告
             report = self._build_report(result, target_prefix)
@@ -143,7 +139,8 @@ class PD_number_start:
         report += f"  • 匹配 '{target_prefix}_数字' 格式的文件: {matched_count} 个\n"
         report += f"  • 成功重命名: {renamed_count} 个\n"
         report += f"  • 失败: {error_count} 个\n"
-        report += f"  • 跳过（不匹配格式）: {skipped_count} 个\n\n"
+        report += f"  • 跳过（不匹配格式）: {skipped_count} 个\n"
+        report += f"  • {result['plan_summary']}\n\n"
         
         # 成功重命名的文件列表
         if renamed_count > 0:
@@ -169,7 +166,7 @@ class PD_number_start:
             report += "\n"
         
         # 操作提示
-        if renamed_count > 0:
+        if renamed_count > 0 and not result["dry_run"]:
             report += "✅ 重命名操作已完成！\n"
         
         return report
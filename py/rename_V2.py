@@ -1,6 +1,7 @@
 import os
-import shutil
 from pathlib import Path
+from ._pd_rename import RenamePlan
+from ._pd_parallel import copy_files
 
 class PD_RenameV2:
     def __init__(self):
@@ -25,6 +26,10 @@ class PD_RenameV2:
                     "default": "",
                     "placeholder": "输出路径(可选，不填则覆盖原图)"
                 })
+            },
+            "optional": {
+                "dry_run": ("BOOLEAN", {"default": False}),  # 只预览重命名计划，不改动文件（原地重命名模式）
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),  # 输出路径模式的并行复制线程数，0 = 自动
             }
         }
     
@@ -33,7 +38,7 @@ class PD_RenameV2:
     FUNCTION = "batch_rename_files"
     CATEGORY = "PD_Tools/file_operations"
     
-    def batch_rename_files(self, folder_path, keyword_to_remove, output_path=""):
+    def batch_rename_files(self, folder_path, keyword_to_remove, output_path="", dry_run=False, workers=0):
         try:
             # 验证文件夹路径
             if not os.path.exists(folder_path):
@@ -63,9 +68,12 @@ class PD_RenameV2:
             # 查找包含关键词的文件并计算新名称
             files_to_process = []
             folder_path_obj = Path(folder_path)
+            # 一次列举，同时作为原地重命名计划的占用表
+            plan = RenamePlan(folder_path)
             
-            for file_path in folder_path_obj.iterdir():
-                if file_path.is_file():
+            for entry in plan.entries:
+                if entry.is_file():
+                    file_path = Path(entry.path)
                     file_ext = file_path.suffix.lower()
                     if file_ext in image_extensions and keyword_to_remove in file_path.name:
                         # 计算新文件名（移除关键词）
@@ -86,26 +94,36 @@ class PD_RenameV2:
             processed_files = []
             failed_files = []
             
-            for old_path, new_path, old_name, new_name in files_to_process:
-                try:
-                    # 检查目标文件是否已存在
-                    if new_path.exists():
+            if output_path:
+                # 串行检查目标（含同批重名），再并行复制
+                jobs = []
+                names = []
+                reserved = set()
+                for old_path, new_path, old_name, new_name in files_to_process:
+                    key = os.path.normcase(str(new_path))
+                    if key in reserved or new_path.exists():
                         failed_files.append(f"{old_name} → {new_name} (目标文件已存在)")
                         continue
-                    
-                    if output_path:
-                        # 复制到新路径
-                        shutil.copy2(old_path, new_path)
-                        processed_files.append(f"复制: {old_name} → {new_name}")
-                    else:
-                        # 重命名原文件
-                        old_path.rename(new_path)
-                        processed_files.append(f"重命名: {old_name} → {new_name}")
-                    
+                    reserved.add(key)
+                    jobs.append((str(old_path), str(new_path)))
+                    names.append((old_name, new_name))
+                
+                for (old_name, new_name), (_, _, error) in zip(names, copy_files(jobs, "copy", workers)):
+                    if error is not None:
+                        failed_files.append(f"{old_name} → {new_name} (错误: {str(error)})")
+                        continue
+                    processed_files.append(f"复制: {old_name} → {new_name}")
                     processed_count += 1
-                    
-                except Exception as e:
-                    failed_files.append(f"{old_name} → {new_name} (错误: {str(e)})")
+            else:
+                # 原地重命名：整批规划（冲突/链式/循环）后执行，失败时整体回滚
+                for _, _, old_name, new_name in files_to_process:
+                    plan.add(old_name, new_name)
+                rename_result = plan.execute(dry_run=dry_run)
+                for old_name, new_name in rename_result.renamed:
+                    processed_files.append(f"重命名: {old_name} → {new_name}")
+                for old_name, new_name, reason in rename_result.conflicts:
+                    failed_files.append(f"{old_name} → {new_name} ({reason})")
+                processed_count = len(rename_result.renamed)
             
             # 构建结果消息
             result_parts = []
@@ -119,6 +137,9 @@ class PD_RenameV2:
                 result_parts.append(f"\n处理失败 {len(failed_files)} 个文件:")
                 result_parts.extend([f"  ✗ {fail_info}" for fail_info in failed_files])
             
+            if not output_path:
+                result_parts.append(f"\n{rename_result.summary()}")
+            
             result_message = '\n'.join(result_parts)
             
             return result_message, processed_count
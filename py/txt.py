@@ -1,5 +1,42 @@
 import os
 import re
+import time
+import comfy.utils
+from ._pd_fileio import AtomicWriter, FSYNC_POLICIES
+from ._pd_parallel import map_processes
+from ._pd_tasks import remove_words_batch, caption_batch
+from ._pd_walk import TEXT_EXTS, walk_files
+from ._pd_caption import CaptionPipeline, split_tags, parse_replace_map, TagIndex, QUERY_MODES
+
+# 每个并行任务处理的文件数：小文件逐个提交时进程间传输开销比处理本身还大
+_BATCH_SIZE = 128
+
+
+def _rewrite_files(paths, batch_func, params, workers, writer):
+    """
+    按批并行执行 batch_func((批内路径, *params))，结果按顺序取回，有变化的文件经 writer 原子写回
+    返回 (成功读取的文件数, 修改的文件数)
+    """
+    batches = [(paths[i:i + _BATCH_SIZE],) + tuple(params) for i in range(0, len(paths), _BATCH_SIZE)]
+    pbar = comfy.utils.ProgressBar(len(paths)) if paths else None
+    processed = modified = 0
+    for batch, results, error in map_processes(batch_func, batches, workers):
+        if error is not None:
+            results = [(path, None, str(error)) for path in batch[0]]
+        for path, content, file_error in results:
+            if file_error is not None:
+                print(f"跳过文件 {path}，错误: {file_error}")
+                continue
+            if content is not None:
+                try:
+                    writer.write_text(path, content)
+                except Exception as e:
+                    print(f"跳过文件 {path}，错误: {e}")
+                    continue
+                modified += 1
+            processed += 1
+        pbar.update(len(batch[0]))
+    return processed, modified
 
 
 class PD_RemoveColorWords:
@@ -11,6 +48,10 @@ class PD_RemoveColorWords:
                 "words_to_remove": ("STRING", {"default": ""}),  # 要删除的单词，支持换行或空行
                 "words_to_add": ("STRING", {"default": ""}),  # 要添加的单词
             },
+            "optional": {
+                "fsync_policy": (FSYNC_POLICIES, {"default": "never"}),  # 落盘策略：耐久性 vs 吞吐
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),  # 并行进程数，0 = CPU 核数
+            },
         }
 
     RETURN_TYPES = ("STRING",)
@@ -18,7 +59,7 @@ class PD_RemoveColorWords:
     FUNCTION = "process_directory"
     CATEGORY = "PD Custom Nodes"
 
-    def process_directory(self, directory_path, words_to_remove, words_to_add):
+    def process_directory(self, directory_path, words_to_remove, words_to_add, fsync_policy="never", workers=0):
         try:
             if not os.path.isdir(directory_path):
                 return (f"错误：目录 {directory_path} 不存在！",)
@@ -31,45 +72,25 @@ class PD_RemoveColorWords:
 
             words_to_add = words_to_add.strip() if words_to_add.strip() else None
 
+            pattern = None
             if words_to_remove:
                 patterns = [
                     rf'\b{re.escape(word)}(?:\s*\([^)]*\)|_[^\s,]*|\s+[^\s,]*)?\b'
                     if word != '\n' else r'\n+'
                     for word in words_to_remove
                 ]
-                combined_pattern = '|'.join(patterns)
-
-            processed_files = 0
-            total_files = 0
-            modified_files = 0
-
-            for root, dirs, files in os.walk(directory_path):
-                for file in files:
-                    if file.endswith('.txt'):
-                        total_files += 1
-                        file_path = os.path.join(root, file)
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                content = f.read()
-
-                            original_content = content
-
-                            if words_to_remove:
-                                content = re.sub(combined_pattern, '', content, flags=re.IGNORECASE)
+                pattern = '|'.join(patterns)
+                # 先在主进程编译一次，规则有误时立即报错；子进程内由 re 的编译缓存复用
+                re.compile(pattern, re.IGNORECASE)
 
-                            if words_to_add:
-                                content = words_to_add + " " + content.lstrip()
-
-                            if content != original_content:
-                                modified_files += 1
-                                with open(file_path, 'w', encoding='utf-8') as f:
-                                    f.write(content)
-                                print(f"处理完成: {file_path}")
-
-                            processed_files += 1
-                        except Exception as e:
-                            print(f"跳过文件 {file_path}，错误: {e}")
-                            continue
+            start_time = time.perf_counter()
+            paths = [entry.path for entry in walk_files(directory_path, TEXT_EXTS, max_depth=None)]
+            total_files = len(paths)
+            writer = AtomicWriter(fsync_policy)
+            processed_files, modified_files = _rewrite_files(
+                paths, remove_words_batch, (pattern, words_to_add), workers, writer)
+            writer.commit()
+            seconds = time.perf_counter() - start_time
 
             if processed_files == 0:
                 return (f"未找到符合条件的文件",)
@@ -79,12 +100,164 @@ class PD_RemoveColorWords:
                 result_message += f"，已删除内容：{', '.join(words_to_remove)}"
             if words_to_add:
                 result_message += f"，已添加单词：'{words_to_add}'"
+            result_message += f"\n{writer.stats.summary()}"
+            result_message += f"\n⏱️ 耗时 {seconds:.2f}s | {total_files / seconds if seconds > 0 else 0:.0f} 文件/秒"
             return (result_message,)
 
         except Exception as e:
             return (f"处理出错：{e}",)
 
 
+class PD_CaptionTags:
+    """
+    标签式标注批量处理：每个 txt 解析为逗号分隔的标签列表，
+    依次执行 替换 → 删除 → 去重 → 指定标签前置 → 添加触发词 → 限制数量，只写回有变化的文件
+    """
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "directory_path": ("STRING", {"default": ""}),  # 文件夹路径
+                "remove_tags": ("STRING", {"default": "", "multiline": True, "placeholder": "要删除的标签，逗号或换行分隔"}),
+                "replace_tags": ("STRING", {"default": "", "multiline": True, "placeholder": "旧标签 -> 新标签（留空为删除）"}),
+                "front_tags": ("STRING", {"default": "", "placeholder": "移到最前的标签，按此顺序"}),
+                "trigger_word": ("STRING", {"default": ""}),  # 触发词，放在最前面
+                "dedupe": ("BOOLEAN", {"default": True}),  # 去掉重复标签
+                "max_tags": ("INT", {"default": 0, "min": 0, "max": 1000, "step": 1}),  # 最多保留的标签数（不含触发词），0 = 不限
+            },
+            "optional": {
+                "case_sensitive": ("BOOLEAN", {"default": False}),
+                "recursive": ("BOOLEAN", {"default": True}),  # 是否包含子文件夹
+                "fsync_policy": (FSYNC_POLICIES, {"default": "never"}),  # 落盘策略：耐久性 vs 吞吐
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),  # 并行进程数，0 = CPU 核数
+            },
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("Result",)
+    FUNCTION = "process_captions"
+    CATEGORY = "PD Custom Nodes"
+
+    def process_captions(self, directory_path, remove_tags, replace_tags, front_tags, trigger_word, dedupe, max_tags,
+                         case_sensitive=False, recursive=True, fsync_policy="never", workers=0):
+        try:
+            if not os.path.isdir(directory_path):
+                return (f"错误：目录 {directory_path} 不存在！",)
+
+            replace_pairs, errors = parse_replace_map(replace_tags)
+            if errors:
+                return ("替换表错误：\n" + "\n".join(errors),)
+
+            pipeline = CaptionPipeline(
+                remove=split_tags(remove_tags),
+                replace=replace_pairs,
+                dedupe=dedupe,
+                front=split_tags(front_tags),
+                trigger=split_tags(trigger_word),
+                max_tags=max_tags,
+                case_sensitive=case_sensitive,
+            )
+
+            start_time = time.perf_counter()
+            paths = [entry.path for entry in walk_files(directory_path, TEXT_EXTS, max_depth=None if recursive else 0)]
+            if not paths:
+                return (f"未找到符合条件的文件",)
+            writer = AtomicWriter(fsync_policy)
+            processed_files, modified_files = _rewrite_files(paths, caption_batch, (pipeline,), workers, writer)
+            writer.commit()
+            seconds = time.perf_counter() - start_time
+
+            result_message = f"处理完成，共扫描了 {len(paths)} 个文件，实际修改了 {modified_files} 个文件"
+            if processed_files < len(paths):
+                result_message += f"，读取失败 {len(paths) - processed_files} 个"
+            result_message += f"\n{writer.stats.summary()}"
+            result_message += f"\n⏱️ 耗时 {seconds:.2f}s | {len(paths) / seconds if seconds > 0 else 0:.0f} 文件/秒"
+            return (result_message,)
+
+        except Exception as e:
+            return (f"处理出错：{e}",)
+
+
+class PD_TagIndex:
+    """
+    标注数据集标签统计：建立/增量更新 .pd_tag_index.json，并查询
+    top_n 出现最多的标签 | cooccurrence 与查询标签共同出现的标签 | files_with_tag 同时包含查询标签的文件
+    索引常驻内存，同一目录再次查询时只检查文件 mtime/大小
+    """
+    # (目录, 是否递归, 是否区分大小写) → TagIndex
+    _indexes = {}
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "directory_path": ("STRING", {"default": ""}),  # 文件夹路径
+                "query_mode": (QUERY_MODES, {"default": "top_n"}),
+                "query_tags": ("STRING", {"default": "", "placeholder": "查询标签，逗号分隔（top_n 不需要）"}),
+                "limit": ("INT", {"default": 50, "min": 0, "max": 100000, "step": 1}),  # 最多显示条数，0 = 全部
+            },
+            "optional": {
+                "recursive": ("BOOLEAN", {"default": True}),  # 是否包含子文件夹
+                "case_sensitive": ("BOOLEAN", {"default": False}),
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),  # 读取线程数，0 = 自动
+            },
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("Result",)
+    FUNCTION = "query_index"
+    CATEGORY = "PD Custom Nodes"
+
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        # 结果取决于磁盘上的标注文件，每次都重新检查
+        return float("NaN")
+
+    def query_index(self, directory_path, query_mode, query_tags, limit, recursive=True, case_sensitive=False, workers=0):
+        try:
+            if not os.path.isdir(directory_path):
+                return (f"错误：目录 {directory_path} 不存在！",)
+
+            start_time = time.perf_counter()
+            key = (os.path.normcase(os.path.abspath(directory_path)), recursive, case_sensitive)
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = TagIndex(directory_path, recursive, case_sensitive)
+            if not index.loaded:
+                index.load()
+            stats = index.update(workers)
+            writer = AtomicWriter("never")
+            index.save(writer)
+            update_seconds = time.perf_counter() - start_time
+
+            tags = split_tags(query_tags)
+            if query_mode != "top_n" and not tags:
+                return ("错误：请输入要查询的标签",)
+
+            query_start = time.perf_counter()
+            lines = []
+            if query_mode == "top_n":
+                lines = [f"{tag}: {count}" for tag, count in index.top(limit)]
+                title = f"出现最多的标签（共 {len(index.counts)} 种）"
+            elif query_mode == "cooccurrence":
+                matched = len(index.files_with(tags))
+                lines = [f"{tag}: {count} ({count / matched:.0%})" for tag, count in index.cooccurrence(tags, limit)]
+                title = f"与 {', '.join(tags)} 共同出现的标签（{matched} 个文件）"
+            else:
+                files = index.files_with(tags)
+                title = f"包含 {', '.join(tags)} 的文件：{len(files)} 个"
+                lines = files[:limit] if limit > 0 else files
+            query_seconds = time.perf_counter() - query_start
+
+            header = (f"📊 索引: {len(index.files)} 个文件 | 扫描 {stats['scanned']} | 新增 {stats['added']} | "
+                      f"更新 {stats['updated']} | 删除 {stats['removed']} | 失败 {stats['errors']}\n"
+                      f"⏱️ 同步 {update_seconds:.2f}s | 查询 {query_seconds * 1000:.1f}ms")
+            return ("\n".join([header, "", title] + lines),)
+
+        except Exception as e:
+            return (f"处理出错：{e}",)
+
+
 class Empty_Line:
     @classmethod
     def INPUT_TYPES(cls):
@@ -108,10 +281,14 @@ class Empty_Line:
 # 节点映射
 NODE_CLASS_MAPPINGS = {
     "PD_RemoveColorWords": PD_RemoveColorWords,
+    "PD_CaptionTags": PD_CaptionTags,
+    "PD_TagIndex": PD_TagIndex,
     "Empty_Line": Empty_Line,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "PD_RemoveColorWords": "PDstring:removecolorwords",
+    "PD_CaptionTags": "PDstring:caption_tags",
+    "PD_TagIndex": "PDstring:tag_index",
     "Empty_Line": "PDstring:del_EmptyLine",
 }
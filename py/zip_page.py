@@ -1,10 +1,184 @@
 import os
+import re
+import json
+import time
+import zlib
+import struct
+import tarfile
 import zipfile
-import io
+import tempfile
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import torch
 from PIL import Image
 import folder_paths
+from ._pd_fileio import AtomicWriter, FSYNC_POLICIES, NameReserver, is_temp_name
+
+# 已经是压缩格式的文件：再做 deflate 几乎没有收益，直接以 ZIP_STORED 存储
+STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.webp', '.gif', '.avif', '.heic',
+    '.mp3', '.mp4', '.m4a', '.mov', '.mkv', '.webm', '.ogg', '.flac',
+    '.zip', '.7z', '.rar', '.gz', '.bz2', '.xz', '.zst',
+}
+
+# 工作线程的临时归档超过该大小时从内存转存到磁盘临时文件，大文件不会整体驻留内存
+PARALLEL_MEMBER_LIMIT = 64 * 1024 * 1024
+# 线程池中同时在途（已提交、尚未拷入归档）的最大源文件字节数
+MAX_INFLIGHT_BYTES = 256 * 1024 * 1024
+# 每个线程池任务处理的一组文件：累计达到字节数或个数上限即成组
+CHUNK_BYTES = 8 * 1024 * 1024
+CHUNK_FILES = 64
+# 增量归档清单：与 zip 同目录，记录每个成员的 (size, mtime_ns, crc)
+MANIFEST_SUFFIX = ".manifest.json"
+# PD_TarShards 的分片文件名
+_SHARD_NAME = re.compile(r"^\d{5}\.tar$")
+
+# zip 记录格式（PKWARE APPNOTE.TXT 4.3），供 _ZipAssembler 拷贝成员、写中央目录
+_LOCAL_HEADER = struct.Struct("<I2B4HL2L2H")
+_CENTRAL_HEADER = struct.Struct("<I4B4HL2L5H2L")
+_END_RECORD = struct.Struct("<I4H2LH")
+_ZIP64_END_RECORD = struct.Struct("<IQ2H2L4Q")
+_ZIP64_LOCATOR = struct.Struct("<ILQL")
+_LOCAL_SIGNATURE = 0x04034b50
+_CENTRAL_SIGNATURE = 0x02014b50
+_END_SIGNATURE = 0x06054b50
+_ZIP64_END_SIGNATURE = 0x06064b50
+_ZIP64_LOCATOR_SIGNATURE = 0x07064b50
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_COUNT_LIMIT = 0xFFFF
+_ZIP64_VERSION = 45
+# 通用标志位 3：CRC 与大小写在数据之后的数据描述符中
+_FLAG_DATA_DESCRIPTOR = 0x08
+
+
+def _read_local_header(fp, zinfo):
+    """读取成员的本地文件头，返回 (各字段, 文件名字节, 扩展字段字节)"""
+    fp.seek(zinfo.header_offset)
+    fields = _LOCAL_HEADER.unpack(fp.read(_LOCAL_HEADER.size))
+    if fields[0] != _LOCAL_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local file header: {zinfo.filename}")
+    name = fp.read(fields[10])
+    extra = fp.read(fields[11])
+    return fields, name, extra
+
+
+class _ZipAssembler:
+    """
+    按顺序把各临时归档中已压缩好的成员原样拷入目标归档，最后写出中央目录
+    成员由工作线程各自用 ZipFile 写入临时归档（ZipFile.write 的 deflate 期间 zlib 释放 GIL，各线程真正并行），
+    主线程只做字节拷贝，不再重复压缩；偏移、大小或成员数超限时写 ZIP64 记录
+    """
+
+    def __init__(self, fp, existing=()):
+        """
+        fp: 可写、可 seek 的目标文件
+        existing: 追加模式下归档中已有的成员 [(ZipInfo, 本地文件头字段, 文件名字节, 扩展字段字节)]，位置不变，
+                  新成员从最后一个成员的数据之后开始写，覆盖原中央目录
+        """
+        self.fp = fp
+        self.members = []
+        self.offset = 0
+        for zinfo, fields, name, extra in existing:
+            self.members.append((zinfo, fields, name, zinfo.header_offset))
+            end = zinfo.header_offset + _LOCAL_HEADER.size + len(name) + len(extra) + zinfo.compress_size
+            self.offset = max(self.offset, end)
+        fp.seek(self.offset)
+
+    def copy_from(self, source, zinfo):
+        """把 source（临时归档文件）中 zinfo 对应的本地记录拷到目标归档末尾"""
+        fields, name, extra = _read_local_header(source, zinfo)
+        if fields[3] & _FLAG_DATA_DESCRIPTOR:
+            raise zipfile.BadZipFile(f"Unexpected data descriptor: {zinfo.filename}")
+        self.fp.write(_LOCAL_HEADER.pack(*fields))
+        self.fp.write(name)
+        self.fp.write(extra)
+        remaining = zinfo.compress_size
+        while remaining:
+            chunk = source.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                raise zipfile.BadZipFile(f"Truncated member: {zinfo.filename}")
+            self.fp.write(chunk)
+            remaining -= len(chunk)
+        self.members.append((zinfo, fields, name, self.offset))
+        self.offset += _LOCAL_HEADER.size + len(name) + len(extra) + zinfo.compress_size
+
+    def finish(self):
+        """写出中央目录与结束记录，并截掉目标文件中原有的多余字节（追加模式下的旧中央目录）"""
+        fp = self.fp
+        central_offset = self.offset
+        for zinfo, fields, name, header_offset in self.members:
+            version, flags, method, mtime, mdate, crc = fields[1], fields[3], fields[4], fields[5], fields[6], fields[7]
+            file_size, compress_size = zinfo.file_size, zinfo.compress_size
+            zip64 = []
+            if file_size >= _ZIP64_LIMIT:
+                zip64.append(file_size)
+                file_size = _ZIP64_LIMIT
+            if compress_size >= _ZIP64_LIMIT:
+                zip64.append(compress_size)
+                compress_size = _ZIP64_LIMIT
+            if header_offset >= _ZIP64_LIMIT:
+                zip64.append(header_offset)
+                header_offset = _ZIP64_LIMIT
+            extra = struct.pack(f"<2H{len(zip64)}Q", 1, 8 * len(zip64), *zip64) if zip64 else b""
+            if zip64:
+                version = max(version, _ZIP64_VERSION)
+            fp.write(_CENTRAL_HEADER.pack(_CENTRAL_SIGNATURE, max(zinfo.create_version, version), zinfo.create_system,
+                                          version, 0, flags, method, mtime, mdate, crc, compress_size, file_size,
+                                          len(name), len(extra), 0, 0, zinfo.internal_attr, zinfo.external_attr,
+                                          header_offset))
+            fp.write(name)
+            fp.write(extra)
+
+        count = len(self.members)
+        central_size = fp.tell() - central_offset
+        if count >= _ZIP64_COUNT_LIMIT or central_size >= _ZIP64_LIMIT or central_offset >= _ZIP64_LIMIT:
+            zip64_offset = fp.tell()
+            fp.write(_ZIP64_END_RECORD.pack(_ZIP64_END_SIGNATURE, _ZIP64_END_RECORD.size - 12,
+                                            _ZIP64_VERSION, _ZIP64_VERSION, 0, 0, count, count,
+                                            central_size, central_offset))
+            fp.write(_ZIP64_LOCATOR.pack(_ZIP64_LOCATOR_SIGNATURE, 0, zip64_offset, 1))
+            count = min(count, _ZIP64_COUNT_LIMIT)
+            central_size = min(central_size, _ZIP64_LIMIT)
+            central_offset = min(central_offset, _ZIP64_LIMIT)
+        fp.write(_END_RECORD.pack(_END_SIGNATURE, 0, 0, count, count, central_size, central_offset, 0))
+        fp.truncate()
+
+
+def _compress_chunk(chunk, compress_level):
+    """
+    工作线程：把一组文件用 ZipFile.write 写入自己的临时归档（小时在内存，超过 PARALLEL_MEMBER_LIMIT 转存磁盘）
+    chunk = [(file_path, archive_name, compress_type)]
+    返回 (临时归档文件, [(ZipInfo 或 None, 错误或 None)])，顺序与 chunk 一致；临时文件由调用方关闭
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=PARALLEL_MEMBER_LIMIT)
+    results = []
+    try:
+        with zipfile.ZipFile(spool, 'w', allowZip64=True) as tmp:
+            for file_path, archive_name, compress_type in chunk:
+                try:
+                    tmp.write(file_path, archive_name, compress_type=compress_type, compresslevel=compress_level)
+                    results.append((tmp.infolist()[-1], None))
+                except Exception as e:
+                    results.append((None, e))
+    except BaseException:
+        spool.close()
+        raise
+    return spool, results
+
+
+def _file_crc(file_path, chunk_size=1024 * 1024):
+    """计算文件 CRC32（仅在 size 相同而 mtime 变化时使用）"""
+    crc = 0
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
 
 class PD_Zip_Simple:
     """
@@ -15,6 +189,14 @@ class PD_Zip_Simple:
     2. 【文件夹模式】：原样打包，字节级无损复制。
     3. 【图像流模式】：支持 PNG (无损) 和 JPG (100%画质)。
     4. 【防覆盖】：自动重命名 (_1, _2)。
+    5. 【并行压缩】：jpg/png 等已压缩格式直接 STORED；其余文件分组在线程池中各自经 ZipFile.write 压缩进临时归档，
+       主线程按原顺序把压缩好的成员原样拷入归档，不重复压缩。
+    6. 【流式写入】：图像编码结果直接写入 zip 成员，不经过内存缓冲；大归档自动启用 ZIP64。
+    7. 【增量归档】（仅文件夹模式）：
+       - new：每次新建 _N.zip（默认）
+       - append：固定写入 <name>.zip，只追加新增的文件；已有成员发生变化时整包重建
+       - delta：<name>.zip 作为基准包，变化部分写入 <name>_delta_N.zip
+       清单 <zip>.manifest.json 记录 (size, mtime, crc)，丢失时从 zip 目录重建。
     """
     
     def __init__(self):
@@ -32,6 +214,10 @@ class PD_Zip_Simple:
                 "images": ("IMAGE",),
                 "folder_path": ("STRING", {"default": "", "multiline": False, "placeholder": "文件夹路径：当 Images 未连接时才生效"}),
                 "save_to": ("STRING", {"default": "", "placeholder": "保存路径 (留空则存到 ComfyUI/output)"}),
+                "compress_level": ("INT", {"default": 9, "min": 0, "max": 9, "step": 1}),
+                "workers": ("INT", {"default": 0, "min": 0, "max": 64, "step": 1}),  # 0 = 自动 (CPU 核数)
+                "archive_mode": (["new", "append", "delta"], {"default": "new"}),  # 仅文件夹模式生效
+                "fsync_policy": (FSYNC_POLICIES, {"default": "never"}),  # 落盘策略：耐久性 vs 吞吐
             }
         }
 
@@ -40,7 +226,8 @@ class PD_Zip_Simple:
     FUNCTION = "process"
     CATEGORY = "PD_Image/Saving"
 
-    def process(self, zip_filename, save_format, images=None, folder_path="", save_to=""):
+    def process(self, zip_filename, save_format, images=None, folder_path="", save_to="",
+                compress_level=9, workers=0, archive_mode="new", fsync_policy="never"):
 
         # 1. 确定保存目录
         if save_to and save_to.strip() != "":
@@ -60,95 +247,521 @@ class PD_Zip_Simple:
         else:
             base_name = zip_filename
 
-        counter = 0
-        while True:
-            if counter == 0:
-                candidate_name = f"{base_name}.zip"
-            else:
-                candidate_name = f"{base_name}_{counter}.zip"
-            
-            full_zip_path = os.path.join(output_dir, candidate_name)
-            
-            if not os.path.exists(full_zip_path):
-                break
-            counter += 1
+        workers = workers if workers > 0 else (os.cpu_count() or 4)
+
+        # 增量模式：仅在没有 Images 输入、且文件夹有效时生效
+        if archive_mode != "new" and images is None and folder_path and os.path.isdir(folder_path):
+            try:
+                with AtomicWriter(fsync_policy) as writer:
+                    zip_path = self._process_incremental(output_dir, base_name, folder_path, archive_mode,
+                                                         compress_level, workers, writer)
+                print(f"PD_Zip_Simple: {writer.stats.summary()}")
+                return (zip_path,)
+            except Exception as e:
+                return (f"Error: {str(e)}",)
+
+        # base.zip 被占用时依次尝试 base_1.zip、base_2.zip ...；无冲突时只探测一次，不列举输出目录
+        candidate_name = NameReserver(output_dir, eager=False).reserve(f"{base_name}.zip")
+        full_zip_path = os.path.join(output_dir, candidate_name)
 
         # 绝对路径用于防死循环
         abs_zip_path = os.path.abspath(full_zip_path)
         files_count = 0
         images_count = 0
-        
+
         try:
             print(f"--- PD_Zip_Simple: Saving to {candidate_name} ---")
 
-            # 使用 Level 9 极限压缩容器
-            with zipfile.ZipFile(full_zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as zipf:
+            # 成员的压缩方式逐个决定，容器本身启用 ZIP64；先写临时文件，完成后再替换到位
+            with AtomicWriter(fsync_policy) as writer, writer.open(full_zip_path) as zip_file:
                 
                 # Logic: 互斥判断
                 
                 # === 情况 A: 检测到 Images 输入 (优先级最高) ===
                 if images is not None:
                     print(">> Mode: Images Input Detected (Folder path ignored)")
-                    
-                    for i, image in enumerate(images):
-                        # 转换 Tensor -> Numpy -> PIL
-                        img_array = 255. * image.cpu().numpy()
-                        img_array = np.clip(img_array, 0, 255).astype(np.uint8)
-                        img_pil = Image.fromarray(img_array)
-                        
-                        img_buffer = io.BytesIO()
-                        
-                        # 根据格式编码
-                        if save_format == "png":
-                            # PNG 无损
-                            img_pil.save(img_buffer, format="PNG", optimize=True, compress_level=9)
-                            ext = "png"
-                        else: 
-                            # JPG 100% 画质
-                            if img_pil.mode == 'RGBA':
-                                img_pil = img_pil.convert('RGB')
-                            img_pil.save(img_buffer, format="JPEG", quality=100, optimize=True, subsampling=0)
-                            ext = "jpg"
-                        
-                        archive_name = f"img_{i+1:05d}.{ext}"
-                        zipf.writestr(archive_name, img_buffer.getvalue())
-                        images_count += 1
+                    with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED,
+                                         compresslevel=compress_level, allowZip64=True) as zipf:
+                        images_count = self._pack_images(zipf, images, save_format)
 
                 # === 情况 B: 没有 Images，但有文件夹路径 ===
                 elif folder_path and os.path.isdir(folder_path):
                     print(f">> Mode: Path Input Detected (Packing folder: {folder_path})")
                     
-                    base_len = len(folder_path.rstrip(os.sep)) + 1
-                    for root, dirs, files in os.walk(folder_path):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            # 跳过自己
-                            if os.path.abspath(file_path) == abs_zip_path:
-                                continue
-                            
-                            archive_name = os.path.join("files", file_path[base_len:])
-                            try:
-                                # 原样字节复制，忽略 save_format
-                                zipf.write(file_path, archive_name)
-                                files_count += 1
-                            except:
-                                pass
+                    entries = self._collect_entries(folder_path, {abs_zip_path})
+                    assembler = _ZipAssembler(zip_file)
+                    files_count = len(self._pack_files(assembler, entries, compress_level, workers))
+                    assembler.finish()
                                 
                 else:
                     print(">> Warning: No valid input (Images or Folder Path) provided.")
+                    _ZipAssembler(zip_file).finish()
 
             msg = f"Saved: {candidate_name} (Img:{images_count}, File:{files_count})"
             print(msg)
+            print(f"PD_Zip_Simple: {writer.stats.summary()}")
             return (full_zip_path,)
 
         except Exception as e:
             return (f"Error: {str(e)}",)
 
+    def _pack_images(self, zipf, images, save_format):
+        """
+        图像流模式：编码结果直接流式写入 zip 成员
+        png/jpg 本身已压缩，成员统一使用 ZIP_STORED
+        """
+        images_count = 0
+        date_time = time.localtime(time.time())[:6]
+
+        for i, image in enumerate(images):
+            # 转换 Tensor -> Numpy -> PIL
+            img_array = 255. * image.cpu().numpy()
+            img_array = np.clip(img_array, 0, 255).astype(np.uint8)
+            img_pil = Image.fromarray(img_array)
+
+            ext = "png" if save_format == "png" else "jpg"
+            zinfo = zipfile.ZipInfo(f"img_{i+1:05d}.{ext}", date_time=date_time)
+            zinfo.compress_type = zipfile.ZIP_STORED
+            zinfo.external_attr = 0o644 << 16
+
+            with zipf.open(zinfo, 'w') as dest:
+                # 根据格式编码
+                if save_format == "png":
+                    # PNG 无损
+                    img_pil.save(dest, format="PNG", optimize=True, compress_level=9)
+                else: 
+                    # JPG 100% 画质
+                    if img_pil.mode == 'RGBA':
+                        img_pil = img_pil.convert('RGB')
+                    img_pil.save(dest, format="JPEG", quality=100, optimize=True, subsampling=0)
+            images_count += 1
+
+        return images_count
+
+    def _collect_entries(self, folder_path, skip_paths):
+        """遍历文件夹，返回 [(file_path, archive_name)]，跳过归档自身及其清单"""
+        entries = []
+        base_len = len(folder_path.rstrip(os.sep)) + 1
+        for root, dirs, files in os.walk(folder_path):
+            for file in files:
+                file_path = os.path.join(root, file)
+                abs_path = os.path.abspath(file_path)
+                # 跳过自己（含写入中的临时文件）
+                if abs_path in skip_paths or abs_path.endswith(".zip" + MANIFEST_SUFFIX) or is_temp_name(file):
+                    continue
+                archive_name = "files/" + file_path[base_len:].replace(os.sep, "/")
+                entries.append((file_path, archive_name))
+        return entries
+
+    def _load_manifest(self, zip_path):
+        """
+        读取增量清单 {archive_name: [size, mtime_ns, crc]}
+        清单丢失时从 zip 中央目录重建（zip 时间戳精度不足，mtime 记为 None，改用 crc 判断）
+        """
+        manifest_path = zip_path + MANIFEST_SUFFIX
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    return json.load(f).get("entries", {})
+            except Exception as e:
+                print(f">> Warning: manifest unreadable, rebuilding from archive: {e}")
+
+        manifest = {}
+        if os.path.exists(zip_path):
+            with zipfile.ZipFile(zip_path, 'r') as zipf:
+                for info in zipf.infolist():
+                    manifest[info.filename] = [info.file_size, None, info.CRC]
+        return manifest
+
+    def _save_manifest(self, zip_path, manifest, writer):
+        """原子写入清单，避免中断时留下半截 JSON"""
+        writer.write_text(zip_path + MANIFEST_SUFFIX,
+                          json.dumps({"version": 1, "entries": manifest}, ensure_ascii=False))
+
+    def _diff_entries(self, entries, manifest):
+        """
+        与清单比较，返回 (变化的 entries, 未变化数量)
+        size 不同 -> 变化；size 与 mtime 都相同 -> 未变化；仅 mtime 不同 -> 比较 crc
+        """
+        changed = []
+        unchanged = 0
+        for file_path, archive_name in entries:
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            old = manifest.get(archive_name)
+            if old is None or old[0] != st.st_size:
+                changed.append((file_path, archive_name))
+            elif old[1] == st.st_mtime_ns:
+                unchanged += 1
+            elif _file_crc(file_path) == old[2]:
+                # 内容未变（例如只是被 touch），刷新 mtime 以便下次直接命中
+                old[1] = st.st_mtime_ns
+                unchanged += 1
+            else:
+                changed.append((file_path, archive_name))
+        return changed, unchanged
+
+    def _process_incremental(self, output_dir, base_name, folder_path, archive_mode, compress_level, workers,
+                             writer):
+        """
+        增量归档：只处理相对清单新增或变化的文件；已删除的文件从清单中移除
+        append 只追加新成员；有已在归档中的文件发生变化时整包重建，归档中不会出现同名成员
+        append 追加需要在原归档上进行，无法整体原子替换；新建、重建的归档与 delta 包均经临时文件写出
+        """
+        base_zip_path = os.path.join(output_dir, f"{base_name}.zip")
+        manifest = self._load_manifest(base_zip_path)
+        base_exists = os.path.exists(base_zip_path)
+
+        entries = self._collect_entries(folder_path, {os.path.abspath(base_zip_path)})
+        # 跳过输出目录中本节点生成的 delta 包
+        delta_prefix = os.path.abspath(os.path.join(output_dir, f"{base_name}_delta_"))
+        entries = [e for e in entries if not os.path.abspath(e[0]).startswith(delta_prefix)]
+
+        if base_exists:
+            changed, unchanged = self._diff_entries(entries, manifest)
+        else:
+            changed, unchanged = entries, 0
+        current = {name for _, name in entries}
+        removed = [name for name in manifest if name not in current]
+        for name in removed:
+            del manifest[name]
+
+        if base_exists and not changed:
+            # 清单可能刚从 zip 重建、刷新过 mtime 或移除了已删除的文件，保存后下次无需再算 crc
+            self._save_manifest(base_zip_path, manifest, writer)
+            print(f"Up to date: {os.path.basename(base_zip_path)} (unchanged:{unchanged}, removed:{len(removed)})")
+            return base_zip_path
+
+        rebuilt = False
+        existing = None
+        if archive_mode == "delta" and base_exists:
+            target_path = NameReserver(output_dir).path(f"{base_name}_delta.zip", numbered=True)
+        else:
+            target_path = base_zip_path
+            if base_exists:
+                existing = self._existing_members(base_zip_path)
+                names = {zinfo.filename for zinfo, _, _, _ in existing}
+                if (any(name in names for _, name in changed)
+                        or any(fields[3] & _FLAG_DATA_DESCRIPTOR for _, fields, _, _ in existing)):
+                    # 变化的文件已在归档中：追加会产生同名成员，改为按当前文件夹整包重建
+                    # （带数据描述符的成员无法确定记录长度，同样重建）
+                    changed = entries
+                    manifest = {}
+                    existing = None
+                    rebuilt = True
+
+        print(f"--- PD_Zip_Simple ({archive_mode}{', rebuild' if rebuilt else ''}): "
+              f"Saving to {os.path.basename(target_path)} ---")
+        with ExitStack() as stack:
+            if existing is not None:
+                zip_file = stack.enter_context(open(target_path, 'r+b'))
+            else:
+                zip_file = stack.enter_context(writer.open(target_path))
+            assembler = _ZipAssembler(zip_file, existing or ())
+            written = self._pack_files(assembler, changed, compress_level, workers)
+            assembler.finish()
+            for file_path, archive_name, st, zinfo in written:
+                mtime_ns = st.st_mtime_ns if st is not None else None
+                manifest[archive_name] = [zinfo.file_size, mtime_ns, zinfo.CRC]
+
+        self._save_manifest(base_zip_path, manifest, writer)
+        print(f"Saved: {os.path.basename(target_path)} "
+              f"(written:{len(written)}, unchanged:{unchanged if not rebuilt else 0}, removed:{len(removed)})")
+        return target_path
+
+    def _member_compress_type(self, file_path, compress_level):
+        """已压缩格式或压缩级别为 0 时直接存储"""
+        if compress_level == 0:
+            return zipfile.ZIP_STORED
+        if os.path.splitext(file_path)[1].lower() in STORED_EXTENSIONS:
+            return zipfile.ZIP_STORED
+        return zipfile.ZIP_DEFLATED
+
+    def _existing_members(self, zip_path):
+        """追加模式：读取归档中已有成员及其本地文件头，[(ZipInfo, 本地文件头字段, 文件名字节, 扩展字段字节)]"""
+        with open(zip_path, 'rb') as fp, zipfile.ZipFile(fp, 'r') as zipf:
+            return [(zinfo,) + _read_local_header(fp, zinfo) for zinfo in zipf.infolist()]
+
+    def _pack_files(self, assembler, entries, compress_level, workers):
+        """
+        文件夹模式：原样字节复制
+        - 文件按顺序分组（CHUNK_BYTES / CHUNK_FILES），每组由一个工作线程经 ZipFile.write 压缩进自己的临时归档
+        - 主线程按 entries 顺序把压缩好的成员原样拷入目标归档；预取窗口按组数和字节数双重限制，内存占用有上界
+        返回成功写入的 [(file_path, archive_name, 读取前的 os.stat 结果, 成员的 ZipInfo)]
+        """
+        written = []
+        pending = deque()
+        inflight = 0
+        source = iter(entries)
+        window = max(2, workers * 2)
+
+        def next_chunk():
+            # 在读取之前 stat：读取期间被修改的文件，清单记录的是旧状态，下次仍会被当作变化
+            chunk, stats, size = [], [], 0
+            for file_path, archive_name in source:
+                try:
+                    st = os.stat(file_path)
+                    size += st.st_size
+                except OSError:
+                    st = None
+                chunk.append((file_path, archive_name, self._member_compress_type(file_path, compress_level)))
+                stats.append(st)
+                if size >= CHUNK_BYTES or len(chunk) >= CHUNK_FILES:
+                    break
+            return chunk, stats, size
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+
+            def refill():
+                nonlocal inflight
+                while len(pending) < window and (not pending or inflight < MAX_INFLIGHT_BYTES):
+                    chunk, stats, size = next_chunk()
+                    if not chunk:
+                        return
+                    pending.append((chunk, stats, size, pool.submit(_compress_chunk, chunk, compress_level)))
+                    inflight += size
+
+            try:
+                refill()
+                while pending:
+                    chunk, stats, size, future = pending.popleft()
+                    inflight -= size
+                    try:
+                        spool, results = future.result()
+                    except Exception as e:
+                        results, spool = [(None, e)] * len(chunk), None
+                    try:
+                        for (file_path, archive_name, _), st, (zinfo, error) in zip(chunk, stats, results):
+                            if error is not None:
+                                print(f"  跳过文件 {file_path}: {error}")
+                                continue
+                            assembler.copy_from(spool, zinfo)
+                            written.append((file_path, archive_name, st, zinfo))
+                    finally:
+                        if spool is not None:
+                            spool.close()
+                    refill()
+            finally:
+                # 出错退出时关闭尚未取回的临时归档
+                for _, _, _, future in pending:
+                    if not future.cancel() and future.exception() is None:
+                        future.result()[0].close()
+
+        return written
+
+class PD_TarShards:
+    """
+    PD_Tar Shards (WebDataset 导出):
+    1. 把文件夹中的图片及其同名 .txt 标注（PD_TensorTraining 产出的格式）打包成固定大小的 tar 分片。
+    2. 分片命名 00000.tar, 00001.tar ...；成员名为 WebDataset 风格的 <key>.<ext>，同一样本的成员相邻。
+    3. 顺序流式写入，单个文件按块拷贝，内存占用与文件大小无关。
+    4. 输出 index.jsonl（每行一个样本：key、分片、成员偏移、源文件）和 shards.json（分片汇总）。
+    """
+
+    IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+    CAPTION_EXTENSION = '.txt'
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "folder_path": ("STRING", {"default": "", "multiline": False, "placeholder": "数据集文件夹路径"}),
+                "shard_size_mb": ("INT", {"default": 1024, "min": 1, "max": 65536, "step": 1}),
+            },
+            "optional": {
+                "save_to": ("STRING", {"default": "", "placeholder": "分片保存路径 (留空则存到 ComfyUI/output/<文件夹名>_shards)"}),
+                "max_samples_per_shard": ("INT", {"default": 0, "min": 0, "max": 10000000, "step": 1}),  # 0 = 不限
+                "recursive": ("BOOLEAN", {"default": True}),
+                "include_captions": ("BOOLEAN", {"default": True}),
+                "fsync_policy": (FSYNC_POLICIES, {"default": "never"}),  # 落盘策略：耐久性 vs 吞吐
+            }
+        }
+
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("message",)
+    FUNCTION = "process"
+    CATEGORY = "PD_Image/Saving"
+
+    def process(self, folder_path, shard_size_mb, save_to="", max_samples_per_shard=0,
+                recursive=True, include_captions=True, fsync_policy="never"):
+        folder_path = folder_path.strip()
+        if not folder_path or not os.path.isdir(folder_path):
+            return (f"Error: folder not found: {folder_path}",)
+
+        if save_to and save_to.strip() != "":
+            output_dir = save_to.strip()
+        else:
+            folder_name = os.path.basename(os.path.normpath(folder_path)) or "dataset"
+            output_dir = os.path.join(folder_paths.get_output_directory(), f"{folder_name}_shards")
+
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            samples = self._collect_samples(folder_path, output_dir, recursive, include_captions)
+            if not samples:
+                return (f"Warning: no images found in {folder_path}",)
+
+            with AtomicWriter(fsync_policy) as writer:
+                shards = self._write_shards(samples, output_dir, shard_size_mb * 1024 * 1024,
+                                            max_samples_per_shard, writer)
+
+            # 分片数比上次少时，旧的高编号分片不在新的 shards.json / index.jsonl 中，删除以免被误读
+            stale = self._remove_stale_shards(output_dir, len(shards))
+
+            total_bytes = sum(shard["bytes"] for shard in shards)
+            msg = (f"Saved {len(samples)} samples into {len(shards)} shards "
+                   f"({total_bytes / (1024 * 1024):.1f} MB) -> {output_dir}")
+            if stale:
+                msg += f"\nRemoved {len(stale)} stale shards from a previous run: {', '.join(stale)}"
+            print(msg)
+            print(f"PD_TarShards: {writer.stats.summary()}")
+            return (msg,)
+
+        except Exception as e:
+            return (f"Error: {str(e)}",)
+
+    def _collect_samples(self, folder_path, output_dir, recursive, include_captions):
+        """
+        按相对路径排序收集样本：[(key, [(ext, file_path), ...])]
+        key 为去掉扩展名的相对路径；WebDataset 以文件名第一个 '.' 切分 key，因此把 key 中的 '.' 替换为 '_'
+        """
+        samples = []
+        used_keys = set()
+        abs_output = os.path.abspath(output_dir)
+
+        for root, dirs, files in os.walk(folder_path):
+            if os.path.abspath(root) == abs_output:
+                dirs[:] = []
+                continue
+            dirs.sort()
+            if not recursive:
+                dirs[:] = []
+
+            # 标注文件的扩展名不区分大小写（a.TXT 同样是 a.jpg 的标注）
+            names = {file.lower(): file for file in files}
+            for file in sorted(files):
+                stem, ext = os.path.splitext(file)
+                if ext.lower() not in self.IMAGE_EXTENSIONS:
+                    continue
+
+                members = [(ext[1:].lower(), os.path.join(root, file))]
+                caption = names.get((stem + self.CAPTION_EXTENSION).lower())
+                if include_captions and caption is not None:
+                    members.append(("txt", os.path.join(root, caption)))
+
+                rel_stem = os.path.relpath(os.path.join(root, stem), folder_path)
+                key = "/".join(part.replace(".", "_") for part in rel_stem.split(os.sep))
+                unique_key, counter = key, 1
+                while unique_key in used_keys:
+                    unique_key = f"{key}_{counter}"
+                    counter += 1
+                used_keys.add(unique_key)
+                samples.append((unique_key, members))
+
+        return samples
+
+    def _tar_info(self, name, st):
+        info = tarfile.TarInfo(name)
+        info.size = st.st_size
+        info.mtime = int(st.st_mtime)
+        info.mode = 0o644
+        return info
+
+    def _tar_size(self, info):
+        """
+        成员在 tar 中占用的字节数：头部（含非 ASCII 长文件名等所需的 PAX 扩展头）+ 按 512 对齐的数据块
+        头部用 TarInfo.tobuf 按写入时相同的格式与编码生成
+        """
+        header = info.tobuf(tarfile.PAX_FORMAT, tarfile.ENCODING, "surrogateescape")
+        return len(header) + (info.size + 511) // 512 * 512
+
+    def _shard_file_size(self, member_bytes):
+        """分片文件的实际大小：成员之后是 TarFile.close() 写入的两个结束块，整个文件再补齐到 RECORDSIZE 的整数倍"""
+        size = member_bytes + 2 * tarfile.BLOCKSIZE
+        return -(-size // tarfile.RECORDSIZE) * tarfile.RECORDSIZE
+
+    def _write_shards(self, samples, output_dir, shard_bytes, max_samples, writer):
+        """
+        顺序写出分片，同时流式写 index.jsonl；返回分片汇总列表
+        每个分片经临时文件写出，完成后才以 00000.tar 等名字出现
+        """
+        shards = []
+        current = None
+        shard_stack = None
+        tar = None
+
+        with ExitStack() as stack:
+            index_file = stack.enter_context(writer.open(os.path.join(output_dir, "index.jsonl")))
+            try:
+                for key, members in samples:
+                    stats = [(ext, path, self._tar_info(f"{key}.{ext}", os.stat(path))) for ext, path in members]
+                    sample_bytes = sum(self._tar_size(info) for _, _, info in stats)
+
+                    if current is not None and current["samples"] > 0 and (
+                            self._shard_file_size(current["bytes"] + sample_bytes) > shard_bytes
+                            or (max_samples > 0 and current["samples"] >= max_samples)):
+                        tar.close()
+                        shard_stack.close()
+                        current["bytes"] = self._shard_file_size(current["bytes"])
+                        shards.append(current)
+                        current = None
+
+                    if current is None:
+                        current = {"name": f"{len(shards):05d}.tar", "samples": 0, "bytes": 0}
+                        shard_stack = ExitStack()
+                        shard_file = shard_stack.enter_context(writer.open(os.path.join(output_dir, current["name"])))
+                        tar = tarfile.open(fileobj=shard_file, mode='w', format=tarfile.PAX_FORMAT)
+
+                    record = {"key": key, "shard": current["name"], "members": {}}
+                    for ext, path, info in stats:
+                        with open(path, 'rb') as f:
+                            tar.addfile(info, f)
+                        # addfile 之后 tar.offset 指向数据块末尾，据此反推数据起始偏移，便于随机读取
+                        data_offset = tar.offset - (info.size + 511) // 512 * 512
+                        record["members"][ext] = {"offset": data_offset, "size": info.size,
+                                                  "source": os.path.abspath(path)}
+
+                    current["samples"] += 1
+                    current["bytes"] += sample_bytes
+                    index_file.write((json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8'))
+
+                if current is not None:
+                    tar.close()
+                    shard_stack.close()
+                    current["bytes"] = self._shard_file_size(current["bytes"])
+                    shards.append(current)
+                    current = None
+            except BaseException as e:
+                # 丢弃未完成分片的临时文件
+                if current is not None:
+                    shard_stack.__exit__(type(e), e, e.__traceback__)
+                raise
+
+        writer.write_text(os.path.join(output_dir, "shards.json"),
+                          json.dumps({"shards": shards, "samples": len(samples)}, ensure_ascii=False, indent=2))
+
+        return shards
+
+    def _remove_stale_shards(self, output_dir, shard_count):
+        """删除上次运行留下的、编号不小于本次分片数的 NNNNN.tar；返回删除的文件名"""
+        removed = []
+        with os.scandir(output_dir) as it:
+            names = sorted(entry.name for entry in it if entry.is_file() and _SHARD_NAME.match(entry.name))
+        for name in names:
+            if int(name[:-4]) >= shard_count:
+                os.remove(os.path.join(output_dir, name))
+                removed.append(name)
+        return removed
+
+
 # 注册节点
 NODE_CLASS_MAPPINGS = {
-    "PD_Zip_Simple": PD_Zip_Simple
+    "PD_Zip_Simple": PD_Zip_Simple,
+    "PD_TarShards": PD_TarShards,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
-    "PD_Zip_Simple": "PD_Zip Simple"
+    "PD_Zip_Simple": "PD_Zip Simple",
+    "PD_TarShards": "PD_Tar Shards (WebDataset)",
 }
\ No newline at end of file